@@ -13,6 +13,53 @@ SMS_STS sms_sts;
 
 #define VERBOSE true
 
+// BINARY FRAMED PROTOCOL (see src/esp32_protocol.py)
+// Frame: SYNC_1 SYNC_2 <length u8> <sequence u8> <type u8> <payload, length - 1 bytes> <crc u16>
+// length counts the type and the payload, the CRC-16/CCITT-FALSE covers length, sequence, type and payload.
+// All values are little endian, a reply carries the sequence number of its request.
+#define FRAME_SYNC_1 0xA5
+#define FRAME_SYNC_2 0x5A
+
+#define FRAME_MOVE 0x01            // <id u8> <position s16> <speed u16> <acc u8>
+#define FRAME_SYNC_MOVE 0x02       // <count u8> count * (<id u8> <position s16> <speed u16> <acc u8>)
+#define FRAME_GET_POS 0x03         // <count u8> count * <id u8>                  ---> FRAME_POSITIONS
+#define FRAME_GET_TELEMETRY 0x04   // <count u8> count * <id u8>                  ---> FRAME_TELEMETRY
+#define FRAME_MOVE_AND_REPORT 0x05 // <tolerance u8> <timeout ms u16> then like SYNC_MOVE ---> FRAME_MOVE_REPORT
+#define FRAME_CALIBRATE 0x06       // <id u8>
+
+#define FRAME_POSITIONS 0x83   // <count u8> count * (<id u8> <position s16>)
+#define FRAME_TELEMETRY 0x84   // <count u8> count * (<id u8> <position s16> <speed s16> <load s16> <voltage s16> <temperature s16> <move u8> <current s16>)
+#define FRAME_MOVE_REPORT 0x85 // <arrived u8> then like FRAME_TELEMETRY
+#define FRAME_ERROR 0xFF       // <request type u8> <code u8>
+
+#define FRAME_ERROR_BAD_CRC 1
+#define FRAME_ERROR_UNKNOWN_TYPE 2
+#define FRAME_ERROR_BAD_PAYLOAD 3
+
+#define MOVE_RECORD_SIZE 6
+#define TELEMETRY_RECORD_SIZE 14
+#define MAX_FRAME_SERVOS 16
+
+// MOVE NOTIFICATIONS
+// After a text MOVE or SYNC_MOVE the servo is watched, once its move flag cleared within MOVE_DONE_TOLERANCE of the
+// target the ESP32 sends MOVE_DONE,<servo_id>,<position> without being asked. A newer move of the servo replaces the watch,
+// a servo that does not arrive within MOVE_WATCH_TIMEOUT_MS is dropped silently (the controller checks it itself then).
+#define MOVE_DONE_TOLERANCE 10
+#define MOVE_WATCH_INTERVAL_MS 5
+#define MOVE_WATCH_TIMEOUT_MS 15000
+#define MAX_MOVE_WATCHES 16
+
+struct MoveWatch
+{
+  bool active;
+  u8 servoID;
+  s16 target;
+  unsigned long started;
+};
+
+MoveWatch moveWatches[MAX_MOVE_WATCHES];
+unsigned long lastMoveWatchCheck = 0;
+
 void setup()
 {
 
@@ -29,9 +76,18 @@ void setup()
 
 void loop()
 {
+  checkMoveWatches();
+
   // Check for serial input
   if (Serial.available() > 0)
   {
+    // Binary frames start with a byte that never starts a text command
+    if (Serial.peek() == FRAME_SYNC_1)
+    {
+      processBinaryFrame();
+      return;
+    }
+
     String serialInput = Serial.readStringUntil('\n');
 
     // Process serial input and send response
@@ -106,50 +162,110 @@ void handleMove(String parameters)
   int acc = parameters.substring(comma3 + 1).toInt();
 
   executeMove(servoID, position, speed, acc);
+  watchMove(servoID, position);
+}
+
+// Returns the index of the first comma at or after from that is not inside a [ ] list, or -1
+int indexOfField(String text, int from)
+{
+  int depth = 0;
+  for (int i = from; i < (int)text.length(); i++)
+  {
+    char c = text.charAt(i);
+    if (c == '[')
+    {
+      depth++;
+    }
+    else if (c == ']')
+    {
+      depth--;
+    }
+    else if (c == ',' && depth == 0)
+    {
+      return i;
+    }
+  }
+  return -1;
+}
+
+// Parses a list like [1,2] into count values, returns false if it does not hold exactly count values
+bool parseIntList(String list, int count, long values[])
+{
+  list.trim();
+  if (list.startsWith("["))
+  {
+    list.remove(0, 1);
+  }
+  if (list.endsWith("]"))
+  {
+    list.remove(list.length() - 1);
+  }
+  for (int i = 0; i < count; i++)
+  {
+    int nextComma = list.indexOf(',');
+    if ((nextComma < 0) != (i == count - 1))
+    {
+      return false;
+    }
+    values[i] = (nextComma < 0 ? list : list.substring(0, nextComma)).toInt();
+    list.remove(0, nextComma + 1);
+  }
+  return true;
 }
 
 void handleSyncMove(String parameters)
 {
-  // Extract parameters
-  int comma1 = parameters.indexOf(',');
-  int comma2 = parameters.indexOf(',', comma1 + 1);
-  int comma3 = parameters.indexOf(',', comma2 + 1);
-  int comma4 = parameters.indexOf(',', comma3 + 1);
+  // Extract parameters: [<id>,...],<count>,[<position>,...],[<speed>,...],[<acc>,...]
+  // The lists hold commas themselves, so the fields are split on the commas outside of them
+  int comma1 = indexOfField(parameters, 0);
+  int comma2 = comma1 < 0 ? -1 : indexOfField(parameters, comma1 + 1);
+  int comma3 = comma2 < 0 ? -1 : indexOfField(parameters, comma2 + 1);
+  int comma4 = comma3 < 0 ? -1 : indexOfField(parameters, comma3 + 1);
+  if (comma4 < 0)
+  {
+    Serial.println("INVALID,SYNC_MOVE");
+    return;
+  }
 
-  u8 idn = parameters.substring(comma1 + 1, comma2).toInt();
-  String servoIDsStr = parameters.substring(0, comma1);
-  String positionsStr = parameters.substring(comma2 + 1, comma3);
-  String speedsStr = parameters.substring(comma3 + 1, comma4);
-  String accsStr = parameters.substring(comma4 + 1);
+  int idn = parameters.substring(comma1 + 1, comma2).toInt();
+  if (idn < 1 || idn > MAX_MOVE_WATCHES)
+  {
+    Serial.println("INVALID,SYNC_MOVE");
+    return;
+  }
 
   // Convert String parameters to arrays
+  long servoIDValues[idn];
+  long positionValues[idn];
+  long speedValues[idn];
+  long accValues[idn];
+  if (!parseIntList(parameters.substring(0, comma1), idn, servoIDValues) ||
+      !parseIntList(parameters.substring(comma2 + 1, comma3), idn, positionValues) ||
+      !parseIntList(parameters.substring(comma3 + 1, comma4), idn, speedValues) ||
+      !parseIntList(parameters.substring(comma4 + 1), idn, accValues))
+  {
+    Serial.println("INVALID,SYNC_MOVE");
+    return;
+  }
+
   u8 servoIDs[idn];
   s16 positions[idn];
   u16 speeds[idn];
   u8 accs[idn];
-
-  // Parse comma-separated values and store them in arrays
   for (int i = 0; i < idn; i++)
   {
-    int nextComma = servoIDsStr.indexOf(',');
-    servoIDs[i] = servoIDsStr.substring(0, nextComma).toInt();
-    servoIDsStr.remove(0, nextComma + 1);
-
-    nextComma = positionsStr.indexOf(',');
-    positions[i] = positionsStr.substring(0, nextComma).toInt();
-    positionsStr.remove(0, nextComma + 1);
-
-    nextComma = speedsStr.indexOf(',');
-    speeds[i] = speedsStr.substring(0, nextComma).toInt();
-    speedsStr.remove(0, nextComma + 1);
-
-    nextComma = accsStr.indexOf(',');
-    accs[i] = accsStr.substring(0, nextComma).toInt();
-    accsStr.remove(0, nextComma + 1);
+    servoIDs[i] = servoIDValues[i];
+    positions[i] = positionValues[i];
+    speeds[i] = speedValues[i];
+    accs[i] = accValues[i];
   }
 
   // Call executeSyncMove with the converted arrays
   executeSyncMove(servoIDs, idn, positions, speeds, accs);
+  for (int i = 0; i < idn; i++)
+  {
+    watchMove(servoIDs[i], positions[i]);
+  }
 }
 
 
@@ -209,4 +325,303 @@ void executeGetTelemetry(int servoID)
   Current = sms_sts.ReadCurrent(servoID);
 
   Serial.println("TELEMETRY," + String(servoID) + ","+ String(Pos) + "," + String(Speed) + "," + String(Load) + ",V" + String(Voltage) + "," + String(Temp) + "," + String(Move) + "," + String(Current));
-}
\ No newline at end of file
+}
+
+// MOVE NOTIFICATIONS
+
+void watchMove(u8 servoID, s16 target)
+{
+  int slot = -1;
+  for (int i = 0; i < MAX_MOVE_WATCHES; i++)
+  {
+    if (moveWatches[i].active && moveWatches[i].servoID == servoID)
+    {
+      slot = i;
+      break;
+    }
+    if (!moveWatches[i].active && slot < 0)
+    {
+      slot = i;
+    }
+  }
+  if (slot < 0)
+  {
+    return;
+  }
+  moveWatches[slot].active = true;
+  moveWatches[slot].servoID = servoID;
+  moveWatches[slot].target = target;
+  moveWatches[slot].started = millis();
+}
+
+void unwatchMove(u8 servoID)
+{
+  for (int i = 0; i < MAX_MOVE_WATCHES; i++)
+  {
+    if (moveWatches[i].active && moveWatches[i].servoID == servoID)
+    {
+      moveWatches[i].active = false;
+    }
+  }
+}
+
+void checkMoveWatches()
+{
+  if (millis() - lastMoveWatchCheck < MOVE_WATCH_INTERVAL_MS)
+  {
+    return;
+  }
+  lastMoveWatchCheck = millis();
+
+  for (int i = 0; i < MAX_MOVE_WATCHES; i++)
+  {
+    MoveWatch &watch = moveWatches[i];
+    if (!watch.active)
+    {
+      continue;
+    }
+    if (millis() - watch.started > MOVE_WATCH_TIMEOUT_MS)
+    {
+      watch.active = false;
+      continue;
+    }
+    // The move flag may still be clear right after the command, the position check covers that
+    if (sms_sts.ReadMove(watch.servoID) != 0)
+    {
+      continue;
+    }
+    int position = sms_sts.ReadPos(watch.servoID);
+    if (abs(position - watch.target) <= MOVE_DONE_TOLERANCE)
+    {
+      watch.active = false;
+      Serial.println("MOVE_DONE," + String(watch.servoID) + "," + String(position));
+    }
+  }
+}
+
+// BINARY FRAMES
+
+uint16_t crc16(const uint8_t *data, size_t length)
+{
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < length; i++)
+  {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++)
+    {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+int16_t readInt16(const uint8_t *data)
+{
+  return (int16_t)(data[0] | (data[1] << 8));
+}
+
+uint8_t *writeInt16(uint8_t *data, int16_t value)
+{
+  data[0] = value & 0xFF;
+  data[1] = (value >> 8) & 0xFF;
+  return data + 2;
+}
+
+void sendFrame(uint8_t sequence, uint8_t type, const uint8_t *payload, uint8_t payloadLength)
+{
+  uint8_t body[3 + 254];
+  body[0] = payloadLength + 1;
+  body[1] = sequence;
+  body[2] = type;
+  memcpy(body + 3, payload, payloadLength);
+  uint16_t crc = crc16(body, payloadLength + 3);
+
+  uint8_t sync[2] = {FRAME_SYNC_1, FRAME_SYNC_2};
+  uint8_t crcBytes[2] = {(uint8_t)(crc & 0xFF), (uint8_t)(crc >> 8)};
+  Serial.write(sync, 2);
+  Serial.write(body, payloadLength + 3);
+  Serial.write(crcBytes, 2);
+}
+
+void sendFrameError(uint8_t sequence, uint8_t requestType, uint8_t code)
+{
+  uint8_t payload[2] = {requestType, code};
+  sendFrame(sequence, FRAME_ERROR, payload, 2);
+}
+
+void processBinaryFrame()
+{
+  uint8_t sync[2];
+  if (Serial.readBytes(sync, 2) != 2 || sync[0] != FRAME_SYNC_1 || sync[1] != FRAME_SYNC_2)
+  {
+    return;
+  }
+
+  // length, sequence, type and payload
+  uint8_t body[2 + 255];
+  if (Serial.readBytes(body, 1) != 1 || body[0] == 0)
+  {
+    return;
+  }
+  uint8_t length = body[0];
+  uint8_t crcBytes[2];
+  if (Serial.readBytes(body + 1, length + 1) != (size_t)length + 1 || Serial.readBytes(crcBytes, 2) != 2)
+  {
+    return;
+  }
+
+  uint8_t sequence = body[1];
+  uint8_t type = body[2];
+  if ((crcBytes[0] | (crcBytes[1] << 8)) != crc16(body, length + 2))
+  {
+    sendFrameError(sequence, type, FRAME_ERROR_BAD_CRC);
+    return;
+  }
+  handleFrame(sequence, type, body + 3, length - 1);
+}
+
+// Parses count move records, returns false if the payload does not hold them
+bool parseMoves(const uint8_t *payload, uint8_t payloadLength, u8 *servoIDs, s16 *positions, u16 *speeds, u8 *accs, u8 *count)
+{
+  if (payloadLength < 1)
+  {
+    return false;
+  }
+  *count = payload[0];
+  if (*count > MAX_FRAME_SERVOS || payloadLength != 1 + *count * MOVE_RECORD_SIZE)
+  {
+    return false;
+  }
+  for (int i = 0; i < *count; i++)
+  {
+    const uint8_t *record = payload + 1 + i * MOVE_RECORD_SIZE;
+    servoIDs[i] = record[0];
+    positions[i] = readInt16(record + 1);
+    speeds[i] = (u16)readInt16(record + 3);
+    accs[i] = record[5];
+  }
+  return true;
+}
+
+uint8_t *writeTelemetryRecord(uint8_t *data, u8 servoID)
+{
+  data[0] = servoID;
+  data = writeInt16(data + 1, sms_sts.ReadPos(servoID));
+  data = writeInt16(data, sms_sts.ReadSpeed(servoID));
+  data = writeInt16(data, sms_sts.ReadLoad(servoID));
+  data = writeInt16(data, sms_sts.ReadVoltage(servoID));
+  data = writeInt16(data, sms_sts.ReadTemper(servoID));
+  data[0] = sms_sts.ReadMove(servoID);
+  return writeInt16(data + 1, sms_sts.ReadCurrent(servoID));
+}
+
+void handleFrame(uint8_t sequence, uint8_t type, const uint8_t *payload, uint8_t payloadLength)
+{
+  u8 servoIDs[MAX_FRAME_SERVOS];
+  s16 positions[MAX_FRAME_SERVOS];
+  u16 speeds[MAX_FRAME_SERVOS];
+  u8 accs[MAX_FRAME_SERVOS];
+  u8 count;
+  uint8_t reply[2 + MAX_FRAME_SERVOS * TELEMETRY_RECORD_SIZE];
+
+  switch (type)
+  {
+  case FRAME_MOVE:
+    if (payloadLength != MOVE_RECORD_SIZE)
+    {
+      break;
+    }
+    unwatchMove(payload[0]);
+    executeMove(payload[0], readInt16(payload + 1), (u16)readInt16(payload + 3), payload[5]);
+    return;
+
+  case FRAME_SYNC_MOVE:
+    if (!parseMoves(payload, payloadLength, servoIDs, positions, speeds, accs, &count))
+    {
+      break;
+    }
+    for (int i = 0; i < count; i++)
+    {
+      unwatchMove(servoIDs[i]);
+    }
+    executeSyncMove(servoIDs, count, positions, speeds, accs);
+    return;
+
+  case FRAME_GET_POS:
+  case FRAME_GET_TELEMETRY:
+  {
+    count = payloadLength > 0 ? payload[0] : 0;
+    if (payloadLength < 1 || count > MAX_FRAME_SERVOS || payloadLength != 1 + count)
+    {
+      break;
+    }
+    reply[0] = count;
+    uint8_t *data = reply + 1;
+    for (int i = 0; i < count; i++)
+    {
+      if (type == FRAME_GET_POS)
+      {
+        data[0] = payload[1 + i];
+        data = writeInt16(data + 1, sms_sts.ReadPos(payload[1 + i]));
+      }
+      else
+      {
+        data = writeTelemetryRecord(data, payload[1 + i]);
+      }
+    }
+    sendFrame(sequence, type == FRAME_GET_POS ? FRAME_POSITIONS : FRAME_TELEMETRY, reply, data - reply);
+    return;
+  }
+
+  case FRAME_MOVE_AND_REPORT:
+  {
+    if (payloadLength < 3 || !parseMoves(payload + 3, payloadLength - 3, servoIDs, positions, speeds, accs, &count))
+    {
+      break;
+    }
+    int tolerance = payload[0];
+    unsigned long timeout = (u16)readInt16(payload + 1);
+    for (int i = 0; i < count; i++)
+    {
+      unwatchMove(servoIDs[i]);
+    }
+    executeSyncMove(servoIDs, count, positions, speeds, accs);
+
+    // Wait on the servo bus until every servo stopped within tolerance of its position
+    unsigned long started = millis();
+    bool arrived = false;
+    while (!arrived && millis() - started < timeout)
+    {
+      delay(2);
+      arrived = true;
+      for (int i = 0; i < count && arrived; i++)
+      {
+        arrived = abs(sms_sts.ReadPos(servoIDs[i]) - positions[i]) <= tolerance && sms_sts.ReadMove(servoIDs[i]) == 0;
+      }
+    }
+
+    reply[0] = arrived ? 1 : 0;
+    reply[1] = count;
+    uint8_t *data = reply + 2;
+    for (int i = 0; i < count; i++)
+    {
+      data = writeTelemetryRecord(data, servoIDs[i]);
+    }
+    sendFrame(sequence, FRAME_MOVE_REPORT, reply, data - reply);
+    return;
+  }
+
+  case FRAME_CALIBRATE:
+    if (payloadLength != 1)
+    {
+      break;
+    }
+    executeCalibrate(payload[0]);
+    return;
+
+  default:
+    sendFrameError(sequence, type, FRAME_ERROR_UNKNOWN_TYPE);
+    return;
+  }
+  sendFrameError(sequence, type, FRAME_ERROR_BAD_PAYLOAD);
+}
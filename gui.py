@@ -23,6 +23,8 @@ def gui_query_thread_method():
             sp = signal_processor.SignalProcessor(id=hackrf_id)
             device.assign_signal_processor(signal_processor=sp)
             device.initialize()
+            # Telemetry is polled in the background, reads below and during scans come from its cache
+            device.start_telemetry_polling()
             device_center_frequency_from_gui = device.sp.hackrf.center_freq
             device_sample_rate_from_gui = device.sp.hackrf.sample_rate
             device_sample_count_from_gui = device.sp.sample_count
@@ -45,11 +47,8 @@ def gui_query_thread_method():
             device.stop()
 
         if command == "get_telemetry":
-            if currently_scanning:
-                continue
-            else:
-                telemetry_data_1 = device.get_telemetry(1)
-                telemetry_data_2 = device.get_telemetry(2)
+            # Answered from the telemetry cache without waiting, so this never waits behind a running scan for the serial port
+            telemetry_data_1, telemetry_data_2 = device.get_all_telemetry(max_age=1.0, timeout=0)
 
         if command == "perform_full_scan":
             currently_scanning = True
@@ -0,0 +1,244 @@
+import math
+
+import numpy as np
+
+from src import bearing_estimator
+
+# Golden ratio conjugate, the fraction of the interval kept by every golden-section step
+INVERSE_GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+
+class SearchPeak:
+    """Class that holds one emitter found by the AdaptiveSearch: the channel (index into the measured power arrays),
+    the servo position of its maximum and the power measured there."""
+
+    def __init__(self, channel, position, power_db):
+        self.channel = channel
+        self.position = position
+        self.power_db = power_db
+
+    def to_string(self):
+        return f"Peak: channel {self.channel}, position {self.position}, {self.power_db} dBm"
+
+
+class AdaptiveSearch:
+    """Class that searches one servo axis for the directions emitters are received from, coarse to fine. \n
+    measure(position) moves the antenna to the servo position and returns the power (dBm) of every channel there as an array.
+    A coarse pass measures coarse_points evenly spaced positions around the full circle. The noise floor of every channel
+    is the median of its coarse profile, since most directions hold no emitter. Every coarse local maximum at least
+    margin_db above the floor is refined by golden-section search between its two coarse neighbours, until the interval is
+    smaller than resolution servo steps. \n
+    Every measurement returns all channels and is cached by position, so emitters close to each other share measurements.
+    The number of measurements grows with the number of emitters and the logarithm of the resolution, not with the
+    number of positions at that resolution.
+    """
+
+    def __init__(self, measure, coarse_points=16, resolution=12, margin_db=6.0, circumference=4096, estimator=None):
+        self.measure = measure
+        self.coarse_points = coarse_points
+        self.resolution = resolution
+        self.margin_db = margin_db
+        self.circumference = circumference
+        # Fits the main lobe to the measurements around a peak, golden-section alone is limited by the measurement noise
+        self.estimator = estimator if estimator is not None else bearing_estimator.BeamPatternEstimator()
+        # Servo position -> channel powers measured there
+        self.measurements = dict()
+
+    def __wrap(self, position):
+        return int(round(position)) % self.circumference
+
+    def power_at(self, position):
+        """Returns the channel powers at the servo position, measuring only if it was not measured before."""
+        position = self.__wrap(position)
+        powers = self.measurements.get(position)
+        if powers is None:
+            powers = np.asarray(self.measure(position), dtype=np.float64)
+            self.measurements[position] = powers
+        return powers
+
+    def coarse_positions(self):
+        """Returns the servo positions of the coarse pass."""
+        return [self.__wrap(i * self.circumference / self.coarse_points) for i in range(self.coarse_points)]
+
+    def add_measurements(self, positions, powers):
+        """Adds measurements that were taken elsewhere (for example a pipelined coarse pass) to the cache."""
+        for position, channel_powers in zip(positions, powers):
+            self.measurements[self.__wrap(position)] = np.asarray(channel_powers, dtype=np.float64)
+
+    def coarse_peaks(self):
+        """Returns (channel, coarse index) of every coarse local maximum that is margin_db above its channel's noise floor."""
+        positions = self.coarse_positions()
+        profile = np.stack([self.power_at(position) for position in positions])  # coarse points x channels
+        floor = np.median(profile, axis=0)
+        previous = np.roll(profile, 1, axis=0)
+        following = np.roll(profile, -1, axis=0)
+        # Ties go to the first of equal neighbours so a flat top is refined once
+        is_peak = (profile > previous) & (profile >= following) & (profile >= floor + self.margin_db)
+        coarse_index, channel = np.nonzero(is_peak)
+        return list(zip(channel.tolist(), coarse_index.tolist()))
+
+    def refine(self, channel, low, high):
+        """Returns the position of the maximum power of the channel between servo positions low and high (low < high,
+        unwrapped), by golden-section search down to resolution steps."""
+        inner_low = high - INVERSE_GOLDEN_RATIO * (high - low)
+        inner_high = low + INVERSE_GOLDEN_RATIO * (high - low)
+        power_low = self.power_at(inner_low)[channel]
+        power_high = self.power_at(inner_high)[channel]
+        while high - low > self.resolution:
+            if power_low >= power_high:
+                high, inner_high, power_high = inner_high, inner_low, power_low
+                inner_low = high - INVERSE_GOLDEN_RATIO * (high - low)
+                power_low = self.power_at(inner_low)[channel]
+            else:
+                low, inner_low, power_low = inner_low, inner_high, power_high
+                inner_high = low + INVERSE_GOLDEN_RATIO * (high - low)
+                power_high = self.power_at(inner_high)[channel]
+        return inner_low if power_low >= power_high else inner_high
+
+    def run(self):
+        """Runs the coarse pass and refines every peak. Returns the SearchPeak of every emitter, in servo position order."""
+        spacing = self.circumference / self.coarse_points
+        coarse = self.coarse_positions()
+        peaks = list()
+        for channel, index in sorted(self.coarse_peaks(), key=lambda peak: coarse[peak[1]]):
+            center = coarse[index]
+            position = self.__fit(channel, self.refine(channel, center - spacing, center + spacing), spacing)
+            peaks.append(SearchPeak(channel, position, float(self.power_at(position)[channel])))
+        return peaks
+
+
+    def __fit(self, channel, position, spacing):
+        """Returns the bearing fitted to the cached measurements within spacing of the position, or the position itself
+        if the fit can't be trusted."""
+        offsets = list()
+        powers = list()
+        for measured, channel_powers in self.measurements.items():
+            # Unwrapped offset from the position, so the lobe may lie across servo position 0
+            offset = (measured - position + self.circumference / 2) % self.circumference - self.circumference / 2
+            if abs(offset) <= spacing:
+                offsets.append(offset)
+                powers.append(channel_powers[channel])
+        center = bearing_estimator.HORIZONTAL_CENTER
+        history = [[center + offset, bearing_estimator.VERTICAL_CENTER, power] for offset, power in zip(offsets, powers)]
+        bearing = self.estimator.estimate(history)
+        if bearing is None or not bearing.fitted or bearing.confidence <= 0:
+            return self.__wrap(position)
+        steps_per_degree = self.circumference / 360
+        return self.__wrap(position + bearing.horizontal_angle * steps_per_degree)
+
+
+class HillClimb:
+    """Class that finds the local power maximum of one signal over both servo axes, starting from a known position. \n
+    measure(x, y) moves the antenna to the position and returns (power in dBm, data) of the signal there, or None if it
+    was not found. Every step measures the points_per_ring positions on a circle of the current radius around the best
+    position. The search moves to the first stronger one right away and keeps the radius. If none is stronger the radius
+    is halved, until it drops below min_radius or max_measurements were taken. \n
+    Measured positions are cached, so the circle around a new best position reuses the old center and any other point
+    measured before. After a step the same direction is tried first. Otherwise the points of a circle are visited in
+    nearest neighbour order from the current antenna position, by Chebyshev distance since both servos move at the same
+    time. clamp(x, y) returns the position limited to the servo range. \n
+    If estimator (a bearing_estimator.BeamPatternEstimator) is given, a circle without a stronger point is followed by a
+    main lobe fit to everything measured so far, and the search ends at the fitted maximum if it is measured stronger.
+    """
+
+    def __init__(
+        self, measure, radius=200, min_radius=25, points_per_ring=8, max_measurements=64, clamp=None, estimator=None
+    ):
+        self.measure = measure
+        self.radius = radius
+        self.min_radius = min_radius
+        self.points_per_ring = points_per_ring
+        self.max_measurements = max_measurements
+        self.clamp = clamp if clamp is not None else (lambda x, y: (x, y))
+        self.estimator = estimator
+        # (x, y) -> (power in dBm, data), or None where the signal was not found
+        self.measurements = dict()
+        self.measurement_count = 0
+
+    def __power(self, position):
+        value = self.measurements.get(position)
+        return -math.inf if value is None else value[0]
+
+    def ring(self, x, y, radius):
+        """Returns (direction, position) of the points on the circle around x, y, clamped and without duplicates or the
+        center itself. direction is the index of the point on the circle."""
+        ring = list()
+        seen = {(x, y)}
+        for i in range(self.points_per_ring):
+            angle = 2 * math.pi * i / self.points_per_ring
+            position = self.clamp(int(round(x + radius * math.cos(angle))), int(round(y + radius * math.sin(angle))))
+            if position not in seen:
+                seen.add(position)
+                ring.append((i, position))
+        return ring
+
+    def __visit_order(self, antenna, ring, heading):
+        """Returns the ring points in the order to measure them. The direction of the last step comes first and then its
+        neighbours, since the maximum is most likely further that way. Without a heading the points are visited in nearest
+        neighbour order from the antenna position."""
+        if heading is not None:
+            def turn(point):
+                difference = abs(point[0] - heading) % self.points_per_ring
+                return min(difference, self.points_per_ring - difference)
+
+            return sorted(ring, key=turn)
+        ordered = list()
+        remaining = list(ring)
+        current = antenna
+        while len(remaining) > 0:
+            nearest = min(remaining, key=lambda p: max(abs(p[1][0] - current[0]), abs(p[1][1] - current[1])))
+            remaining.remove(nearest)
+            ordered.append(nearest)
+            current = nearest[1]
+        return ordered
+
+    def run(self, x, y, power_db, data=None):
+        """Climbs from the position x, y where the signal was measured at power_db. Returns the best position and its
+        (power in dBm, data)."""
+        best = (x, y)
+        self.measurements[best] = (power_db, data)
+        antenna = best
+        radius = self.radius
+        heading = None
+        while radius >= self.min_radius and self.measurement_count < self.max_measurements:
+            moved = False
+            for direction, position in self.__visit_order(antenna, self.ring(*best, radius), heading):
+                if position not in self.measurements:
+                    if self.measurement_count >= self.max_measurements:
+                        break
+                    self.measurements[position] = self.measure(*position)
+                    self.measurement_count += 1
+                    antenna = position
+                # The first stronger point is taken right away, the rest of the circle is not needed
+                if self.__power(position) > self.__power(best):
+                    best = position
+                    heading = direction
+                    moved = True
+                    break
+            if not moved:
+                fitted = self.__fitted_maximum(best)
+                if fitted is not None:
+                    return fitted, self.measurements[fitted]
+                radius //= 2
+                heading = None
+        return best, self.measurements[best]
+
+    def __fitted_maximum(self, best):
+        """Measures the maximum of the main lobe fitted to all measurements. Returns its position if it is stronger than
+        best, otherwise None."""
+        if self.estimator is None or self.measurement_count >= self.max_measurements:
+            return None
+        history = [[x, y, value[0]] for (x, y), value in self.measurements.items() if value is not None]
+        bearing = self.estimator.estimate(history)
+        if bearing is None or not bearing.fitted or bearing.confidence <= 0 or bearing.vertical_angle is None:
+            return None
+        position = self.clamp(
+            int(round(bearing_estimator.angle_to_x(bearing.horizontal_angle))),
+            int(round(bearing_estimator.angle_to_y(bearing.vertical_angle))),
+        )
+        if position not in self.measurements:
+            self.measurements[position] = self.measure(*position)
+            self.measurement_count += 1
+        if self.__power(position) > self.__power(best):
+            return position
+        return None
@@ -0,0 +1,134 @@
+import numpy as np
+
+# Servo steps per full turn, x = 2048 and y = 1024 point straight ahead (see esp32_controller.Channel.calc_angle)
+STEPS_PER_TURN = 4096
+HORIZONTAL_CENTER = 2048
+VERTICAL_CENTER = 1024
+
+
+def x_to_angle(x):
+    """Returns the horizontal angle in degrees of servo position x, 0 is straight ahead."""
+    return (np.asarray(x, dtype=np.float64) - HORIZONTAL_CENTER) / (STEPS_PER_TURN / 2) * 180
+
+
+def y_to_angle(y):
+    """Returns the vertical angle in degrees of servo position y, 0 is level."""
+    return (np.asarray(y, dtype=np.float64) - VERTICAL_CENTER) / (STEPS_PER_TURN / 4) * 90
+
+
+def angle_to_x(angle):
+    """Returns the servo position x of the horizontal angle in degrees."""
+    return angle / 180 * (STEPS_PER_TURN / 2) + HORIZONTAL_CENTER
+
+
+def angle_to_y(angle):
+    """Returns the servo position y of the vertical angle in degrees."""
+    return angle / 90 * (STEPS_PER_TURN / 4) + VERTICAL_CENTER
+
+
+class BearingEstimate:
+    """Class that holds a bearing fitted to the power measured at several antenna positions. \n
+    Angles are in degrees like Channel.horizontal_angle and vertical_angle, vertical_angle is None if all measurements were
+    taken at one height. error is the standard error of the horizontal angle in degrees, and confidence goes from 0 (no
+    better than guessing within the beam) to 1. fitted is False if too few measurements were inside the main lobe, the
+    angles are then those of the strongest measurement.
+    """
+
+    def __init__(self, horizontal_angle, vertical_angle, peak_power_db, error, confidence, point_count, fitted=True):
+        self.horizontal_angle = horizontal_angle
+        self.vertical_angle = vertical_angle
+        self.peak_power_db = peak_power_db
+        self.error = error
+        self.confidence = confidence
+        self.point_count = point_count
+        self.fitted = fitted
+
+    def to_string(self):
+        return f"Bearing: {self.horizontal_angle}° ± {self.error}°, {self.vertical_angle}° vertical, {self.peak_power_db} dBm, confidence {self.confidence}, {self.point_count} points"
+
+
+class BeamPatternEstimator:
+    """Class that estimates the bearing of a transmitter by fitting the antenna's main lobe to (x, y, dBm) measurements. \n
+    The main lobe is modelled as a Gaussian beam: in dBm it drops by 3 dB at half the beam width off axis, so the power is a
+    paraboloid with a known curvature around the bearing. With the curvature fixed the fit is a linear least squares problem
+    in the peak power and the bearing, which stays well conditioned with few points and is not thrown off by a single
+    strong measurement like taking the strongest position is. Only measurements within lobe_depth_db of the strongest one
+    are used, weaker ones are side lobes, nulls or noise. \n
+    The PRO 12T helical antenna has a beam width of about 30 degrees.
+    """
+
+    def __init__(self, beam_width=30.0, lobe_depth_db=10.0, min_points=3):
+        self.beam_width = beam_width
+        self.lobe_depth_db = lobe_depth_db
+        self.min_points = min_points
+
+    def __strongest(self, horizontal, vertical, power_db):
+        """Returns the unfitted estimate at the strongest measurement."""
+        strongest = int(np.argmax(power_db))
+        return BearingEstimate(
+            round(float(horizontal[strongest]), 3),
+            None if vertical is None else round(float(vertical[strongest]), 3),
+            float(power_db[strongest]),
+            self.beam_width / 2,
+            0.0,
+            len(power_db),
+            fitted=False,
+        )
+
+    def estimate(self, position_history):
+        """Returns the BearingEstimate for a list of [x, y, dBm] measurements (Channel.position_history), None if empty. \n
+        Several measurements at the same position are reduced to the strongest one.
+        """
+        history = np.asarray(position_history, dtype=np.float64).reshape(-1, 3)
+        if len(history) == 0:
+            return None
+        positions, inverse = np.unique(history[:, :2], axis=0, return_inverse=True)
+        power_db = np.full(len(positions), -np.inf)
+        np.maximum.at(power_db, inverse.ravel(), history[:, 2])
+
+        horizontal = x_to_angle(positions[:, 0])
+        vertical = y_to_angle(positions[:, 1])
+        strongest = int(np.argmax(power_db))
+        in_lobe = power_db >= power_db[strongest] - self.lobe_depth_db
+        has_height = np.ptp(vertical[in_lobe]) > 0
+
+        unknowns = 3 if has_height else 2
+        if np.count_nonzero(in_lobe) < max(self.min_points, unknowns + 1):
+            return self.__strongest(horizontal, vertical if has_height else None, power_db)
+
+        # power_db = p0 - k * ((h - h0)^2 + (v - v0)^2), with k such that the power is 3 dB down at half the beam width.
+        # Moving the known curvature to the left side leaves p0 - k * (h0^2 + v0^2) + 2k * h0 * h + 2k * v0 * v
+        k = 12 / self.beam_width**2
+        h = horizontal[in_lobe]
+        v = vertical[in_lobe]
+        target = power_db[in_lobe] + k * (h**2 + v**2 if has_height else h**2)
+        columns = [np.ones_like(h), h, v] if has_height else [np.ones_like(h), h]
+        design = np.stack(columns, axis=1)
+        coefficients, _, rank, _ = np.linalg.lstsq(design, target, rcond=None)
+        if rank < unknowns:
+            return self.__strongest(horizontal, vertical if has_height else None, power_db)
+
+        horizontal_angle = coefficients[1] / (2 * k)
+        vertical_angle = coefficients[2] / (2 * k) if has_height else None
+        peak_power_db = coefficients[0] + k * (horizontal_angle**2 + (vertical_angle**2 if has_height else 0))
+
+        # Standard error of the bearing from the residuals of the fit
+        residuals = target - design @ coefficients
+        degrees_of_freedom = len(h) - unknowns
+        variance = np.sum(residuals**2) / degrees_of_freedom if degrees_of_freedom > 0 else np.inf
+        covariance = variance * np.linalg.inv(design.T @ design)
+        error = float(np.sqrt(covariance[1, 1]) / (2 * k))
+
+        # A bearing outside of the measured positions is an extrapolation, it is kept but not trusted
+        confidence = max(0.0, 1 - error / (self.beam_width / 2))
+        if not np.min(h) <= horizontal_angle <= np.max(h):
+            confidence = 0.0
+
+        return BearingEstimate(
+            round(float(horizontal_angle), 3),
+            None if vertical_angle is None else round(float(vertical_angle), 3),
+            round(float(peak_power_db), 2),
+            round(error, 3),
+            round(confidence, 3),
+            len(positions),
+        )
@@ -0,0 +1,223 @@
+import numpy as np
+
+# Frequency ranges (MHz) of the channels of every band, indexed by band letter and channel number - 1
+channel_freq_range_list = {
+    "A": [
+        [5850, 5880],
+        [5830, 5860],
+        [5810, 5840],
+        [5790, 5820],
+        [5770, 5800],
+        [5750, 5780],
+        [5730, 5760],
+        [5710, 5740],
+    ],
+    "B": [
+        [5718, 5748],
+        [5737, 5767],
+        [5756, 5786],
+        [5775, 5805],
+        [5794, 5824],
+        [5813, 5843],
+        [5832, 5862],
+        [5851, 5881],
+    ],
+    "E": [
+        [5690, 5720],
+        [5670, 5700],
+        [5650, 5680],
+        [5630, 5660],
+        [5870, 5900],
+        [5890, 5920],
+        [5910, 5940],
+        [5930, 5960],
+    ],
+    "F": [
+        [5725, 5755],
+        [5745, 5775],
+        [5765, 5795],
+        [5785, 5815],
+        [5805, 5835],
+        [5825, 5855],
+        [5845, 5875],
+        [5865, 5895],
+    ],
+    "R": [
+        [5643, 5673],
+        [5679, 5709],
+        [5716, 5746],
+        [5753, 5783],
+        [5790, 5820],
+        [5827, 5857],
+        [5864, 5894],
+        [5901, 5931],
+    ],
+    "D": [
+        [5347, 5377],
+        [5384, 5414],
+        [5421, 5451],
+        [5458, 5488],
+        [5495, 5525],
+        [5532, 5562],
+        [5569, 5599],
+        [5606, 5636],
+    ],
+    "U": [
+        [5300, 5330],
+        [5323, 5353],
+        [5341, 5371],
+        [5359, 5389],
+        [5377, 5407],
+        [5395, 5425],
+        [5413, 5443],
+        [5431, 5461],
+    ],
+    "O": [
+        [5459, 5489],
+        [5477, 5507],
+        [5495, 5525],
+        [5513, 5543],
+        [5531, 5561],
+        [5549, 5579],
+        [5567, 5597],
+        [5585, 5615],
+    ],
+    "L": [
+        [5318, 5348],
+        [5358, 5388],
+        [5398, 5428],
+        [5438, 5468],
+        [5478, 5508],
+        [5518, 5548],
+        [5558, 5588],
+        [5598, 5628],
+    ],
+    "H": [
+        [5638, 5668],
+        [5678, 5708],
+        [5718, 5748],
+        [5758, 5788],
+        [5798, 5828],
+        [5838, 5868],
+        [5878, 5908],
+        [5918, 5948],
+    ],
+}
+
+# Center frequencies (MHz) of the channels of every band
+channel_center_freq_list = {
+    "A": [5865, 5845, 5825, 5805, 5785, 5765, 5745, 5725],
+    "B": [5733, 5752, 5771, 5790, 5809, 5828, 5847, 5866],
+    "E": [5705, 5685, 5665, 5645, 5885, 5905, 5925, 5945],
+    "F": [5740, 5760, 5780, 5800, 5820, 5840, 5860, 5880],
+    "R": [5658, 5695, 5732, 5769, 5806, 5843, 5880, 5917],
+    "D": [5362, 5399, 5436, 5473, 5510, 5547, 5584, 5621],
+    "U": [5325, 5348, 5366, 5384, 5402, 5420, 5438, 5456],
+    "O": [5474, 5492, 5510, 5528, 5546, 5564, 5582, 5600],
+    "L": [5333, 5373, 5413, 5453, 5493, 5533, 5573, 5613],
+    "H": [5653, 5693, 5733, 5773, 5813, 5853, 5893, 5933],
+}
+
+
+class ChannelRegistry:
+    """Class that indexes every channel of every band once, so peak frequencies can be classified in one vectorized call. \n
+    Channels are numbered in table order (band order, then channel number), which is also the order candidates are returned in. \n
+    Intervals are kept sorted by start frequency, so finding all channels that overlap a frequency is a binary search
+    over the interval start points instead of a loop over every band and channel.
+    """
+
+    def __init__(self, freq_ranges, center_freqs):
+        names = list()
+        bands = list()
+        ranges = list()
+        centers = list()
+        for band, band_ranges in freq_ranges.items():
+            for i, freq_range in enumerate(band_ranges):
+                names.append(f"{band}{i+1}")
+                bands.append(band)
+                ranges.append(freq_range)
+                centers.append(center_freqs[band][i])
+
+        self.names = np.array(names)
+        self.bands = np.array(bands)
+        self.start_freqs = np.array([r[0] for r in ranges], dtype=np.float64)
+        self.end_freqs = np.array([r[1] for r in ranges], dtype=np.float64)
+        self.center_freqs = np.array(centers, dtype=np.float64)
+        self.__index_by_name = {name: i for i, name in enumerate(names)}
+
+        # Interval endpoints sorted by start frequency, ties keep table order
+        self.__order = np.argsort(self.start_freqs, kind="stable")
+        self.__sorted_starts = self.start_freqs[self.__order]
+        self.__sorted_ends = self.end_freqs[self.__order]
+        self.__max_width = float(np.max(self.end_freqs - self.start_freqs))
+
+        # Exact center lookup, when several channels share a center the first one in table order wins
+        unique_centers, first_index = np.unique(self.center_freqs, return_index=True)
+        self.__exact_freqs = unique_centers
+        self.__exact_index = first_index
+
+    def index(self, name):
+        """Returns the table index of the channel with the given name, for example "A5"."""
+        return self.__index_by_name[name]
+
+    def band_channels(self, band):
+        """Returns the table indices of the channels of the given band, in channel number order."""
+        return np.flatnonzero(self.bands == band)
+
+    def exact_channels(self, peak_freqs):
+        """Returns for every peak frequency (MHz) the table index of the channel whose center it rounds to, or -1."""
+        rounded = np.round(np.asarray(peak_freqs, dtype=np.float64))
+        position = np.searchsorted(self.__exact_freqs, rounded)
+        position = np.minimum(position, len(self.__exact_freqs) - 1)
+        found = self.__exact_freqs[position] == rounded
+        return np.where(found, self.__exact_index[position], -1)
+
+    def __candidate_pairs(self, peak_freqs, bands=None):
+        """Returns (frequency index, table index) pairs for every channel range that contains one of the peak frequencies."""
+        # Only intervals that start at most one interval width below the frequency can contain it
+        low = np.searchsorted(self.__sorted_starts, peak_freqs - self.__max_width, side="left")
+        high = np.searchsorted(self.__sorted_starts, peak_freqs, side="right")
+        counts = high - low
+
+        # Flatten all (frequency, interval) pairs in range and keep the ones whose interval also ends after the frequency
+        owner = np.repeat(np.arange(len(peak_freqs)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        sorted_index = np.repeat(low, counts) + offsets
+        keep = self.__sorted_ends[sorted_index] >= peak_freqs[owner]
+        table_index = self.__order[sorted_index]
+        if bands is not None:
+            keep &= np.isin(self.bands[table_index], list(bands))
+        return owner[keep], table_index[keep]
+
+    def candidate_channels(self, peak_freqs, bands=None):
+        """Returns for every peak frequency (MHz) an array of the table indices of all channels whose range contains it. \n
+        bands limits the candidates to the given band letters.
+        """
+        peak_freqs = np.asarray(peak_freqs, dtype=np.float64)
+        if len(peak_freqs) == 0:
+            return list()
+        owner, table_index = self.__candidate_pairs(peak_freqs, bands)
+
+        # Table order within each frequency, then split per frequency
+        order = np.lexsort((table_index, owner))
+        owner = owner[order]
+        table_index = table_index[order]
+        splits = np.searchsorted(owner, np.arange(1, len(peak_freqs)))
+        return np.split(table_index, splits)
+
+    def first_candidate_channels(self, peak_freqs, bands=None):
+        """Returns for every peak frequency (MHz) the table index of the first channel (in table order) whose range contains it, or -1."""
+        peak_freqs = np.asarray(peak_freqs, dtype=np.float64)
+        owner, table_index = self.__candidate_pairs(peak_freqs, bands)
+        first = np.full(len(peak_freqs), len(self.names), dtype=np.intp)
+        np.minimum.at(first, owner, table_index)
+        first[first == len(self.names)] = -1
+        return first
+
+    def classify(self, peak_freqs, bands=None):
+        """Returns the exact channel index (or -1) and the array of candidate channel indices for every peak frequency (MHz)."""
+        return self.exact_channels(peak_freqs), self.candidate_channels(peak_freqs, bands)
+
+
+# Built once at import, shared by the signal processor and the controller
+registry = ChannelRegistry(channel_freq_range_list, channel_center_freq_list)
@@ -1,10 +1,24 @@
+import collections
+import contextlib
 import os
+import threading
 import time
 import serial
 import math
 import platform
 from src import signal_processor
+from src import sweep_pipeline
+from src import channel_registry
+from src import signal_batch
+from src import signal_tracker
+from src import bearing_estimator
+from src import adaptive_search
+from src import moving_scan
+from src import esp32_protocol
+from src import serial_transport
+from src import telemetry_cache
 import queue
+import numpy as np
 
 # The custom command structure when interfacing with esp32 over serial (usb)
 # No returns:
@@ -14,6 +28,12 @@ import queue
 # With returns:
 # GET_POS,<servo_id>        ---> POSITION,<servo_id>,<position>
 # GET_TELEMETRY,<servo_id>  ---> TELEMETRY,<servo_id>,<position>,<speed>,<load>,<voltage>,<temperature>,<move>,<current>
+# Unasked, after a MOVE or SYNC_MOVE once the servo stopped at its position:
+#                              MOVE_DONE,<servo_id>,<position>
+# With protocol="binary" the same commands go as CRC checked binary frames instead (see esp32_protocol.py), which adds
+# reading several servos at once and MOVE_AND_REPORT: move, wait on the ESP32 until arrived and reply with the telemetry.
+# With async_serial=True either protocol goes through serial_transport.py, which reads replies on one asyncio task and
+# matches them to their requests, so several requests can be in flight at once.
 
 # Specification of PRO 12T helical antenna:
 # Bandwidth: 5640-5945 MHz
@@ -63,30 +83,26 @@ class stopEverything(Exception):
 class ChannelList:
     """Class for managing the channels and signals found on the channels."""
 
-    a_ranges = [
-        [5850, 5880],
-        [5830, 5860],
-        [5810, 5840],
-        [5790, 5820],
-        [5770, 5800],
-        [5750, 5780],
-        [5730, 5760],
-        [5710, 5740],
-    ]
-    a_centers = [5865, 5845, 5825, 5805, 5785, 5765, 5745, 5725]
-
     def __init__(self):
         self.channels = dict()
+        self.bearing_estimator = bearing_estimator.BeamPatternEstimator()
         self.__initialize_channels()
 
     def __initialize_channels(self):
-        for i in range(1, 9):
-            channel = Channel(f"A{i}")
-            channel.start_freq = self.a_ranges[i - 1][0]
-            channel.end_freq = self.a_ranges[i - 1][1]
-            self.channels[f"A{i}"] = channel
+        registry = channel_registry.registry
+        for i in registry.band_channels("A"):
+            name = str(registry.names[i])
+            channel = Channel(name)
+            channel.start_freq = int(registry.start_freqs[i])
+            channel.end_freq = int(registry.end_freqs[i])
+            self.channels[name] = channel
     
     def update_channels(self, signal : signal_processor.Signal):
+        if isinstance(signal, signal_processor.ChannelPowers):
+            # channel power scans report every visible channel at once
+            for channel_signal in signal:
+                self.update_channels(channel_signal)
+            return
         try:
             channel = self.channels[signal.channel]
             if channel.peak_power_db is None or float(signal.peak_power_db) >= float(channel.peak_power_db):
@@ -125,11 +141,17 @@ class ChannelList:
             channel.peak_y = None
             channel.horizontal_angle = None
             channel.vertical_angle = None
+            channel.bearing = None
             channel.position_history = []
 
     def reset_history(self):
         for channel in self.channels.values():
             channel.position_history = []
+
+    def estimate_bearings(self):
+        """Fits the bearing of every channel to the positions it was measured at during this sweep, see Channel.estimate_bearing."""
+        for channel in self.channels.values():
+            channel.estimate_bearing(self.bearing_estimator)
                 
 class Channel():
     """Class which represents a channel on the spectrum."""
@@ -148,9 +170,21 @@ class Channel():
         
         self.horizontal_angle = None
         self.vertical_angle = None
+        # BearingEstimate of the last sweep, see estimate_bearing
+        self.bearing = None
         
         self.position_history = []
             
+    def estimate_bearing(self, estimator):
+        """Fits the antenna's main lobe to the position history and uses the fitted bearing as the angles of the channel. \n
+        peak_x and peak_y stay at the strongest measurement, the angles are only replaced if the fit can be trusted."""
+        self.bearing = estimator.estimate(self.position_history)
+        if self.bearing is None or not self.bearing.fitted or self.bearing.confidence <= 0:
+            return
+        self.horizontal_angle = self.bearing.horizontal_angle
+        if self.bearing.vertical_angle is not None:
+            self.vertical_angle = self.bearing.vertical_angle
+
     def calc_angle(self):
         # calculate the angle of the peak signal
         # if peak x is at 0 we are at -180 degrees, if peak x is at 4096 we are at 180 degrees, if peak x is at 2048 we are at 0 degrees
@@ -164,6 +198,97 @@ class Channel():
 
 
  
+class ServoMotionModel:
+    """Class that predicts how long one servo takes for a move, with a trapezoidal velocity profile: it accelerates,
+    cruises at its top speed and decelerates, or only accelerates and decelerates if the move is too short to reach the
+    top speed. A fixed latency covers the command, the settling and the arrival report. \n
+    The top speed and acceleration are the commanded speed and acceleration (in units of 100 steps/s²) times
+    speed_scale and acceleration_scale. They are calibrated from recorded moves (distance, duration): the scales and
+    latency with the smallest squared duration error over a grid are kept, with the latency solved for each grid point.
+    Speed readings taken during moves bound speed_scale from below. Until calibrated, the scales are
+    1 and the latency is the default.
+    """
+
+    def __init__(self, latency=0.05, min_moves=8, calibrate_every=8, max_moves=256, min_speed_samples=8):
+        self.speed_scale = 1.0
+        self.acceleration_scale = 1.0
+        self.latency = latency
+        self.min_moves = min_moves
+        self.calibrate_every = calibrate_every
+        self.min_speed_samples = min_speed_samples
+        self.calibrated = False
+        # (distance, commanded speed, commanded acceleration, duration) of recorded moves
+        self.__moves = collections.deque(maxlen=max_moves)
+        # Measured speed / commanded speed during moves
+        self.__speed_ratios = collections.deque(maxlen=max_moves)
+        self.__new_moves = 0
+
+    def __profile(self, speed, acc):
+        """Returns the top speed (steps/s) and acceleration (steps/s²) of the commanded speed and acceleration."""
+        return max(speed, 1) * self.speed_scale, max(acc, 1) * 100 * self.acceleration_scale
+
+    @staticmethod
+    def travel_time(distance, top_speed, acceleration):
+        """Returns the time of a trapezoidal move over distance steps, works on numpy arrays as well."""
+        distance = np.abs(distance)
+        # A move shorter than the two ramps together never reaches the top speed
+        reaches_top = distance >= top_speed**2 / acceleration
+        return np.where(
+            reaches_top,
+            distance / top_speed + top_speed / acceleration,
+            2 * np.sqrt(distance / acceleration),
+        )
+
+    def predict_duration(self, distance, speed, acc):
+        """Returns the predicted time (seconds) from sending a move over distance steps until the servo reported arrival."""
+        if distance == 0:
+            return self.latency
+        top_speed, acceleration = self.__profile(speed, acc)
+        return self.latency + float(self.travel_time(distance, top_speed, acceleration))
+
+    def record_move(self, distance, speed, acc, duration):
+        """Records a finished move, the model is calibrated again every calibrate_every moves."""
+        if distance == 0 or duration <= 0:
+            return
+        self.__moves.append((abs(distance), speed, acc, duration))
+        self.__new_moves += 1
+        if len(self.__moves) >= self.min_moves and self.__new_moves >= self.calibrate_every:
+            self.calibrate()
+
+    def record_speed(self, measured_speed, speed):
+        """Records a speed reading (telemetry "speed") taken while the servo moved at the commanded speed."""
+        if measured_speed != 0 and speed > 0:
+            self.__speed_ratios.append(abs(measured_speed) / speed)
+
+    def calibrate(self):
+        """Fits speed_scale, acceleration_scale and latency to the recorded moves. Returns False if too few were recorded."""
+        self.__new_moves = 0
+        if len(self.__moves) < self.min_moves:
+            return False
+        distance, speed, acc, duration = np.asarray(self.__moves, dtype=np.float64).T
+
+        # The top speed is at least what was measured, readings taken on the ramps are slower than it
+        lowest_speed_scale = 0.25
+        if len(self.__speed_ratios) >= self.min_speed_samples:
+            lowest_speed_scale = min(np.percentile(self.__speed_ratios, 90), 4.0)
+        speed_scales = np.geomspace(lowest_speed_scale, 4, 61)
+        acceleration_scales = np.geomspace(0.05, 20, 81)
+
+        # Grid of speed scales x acceleration scales x moves
+        top_speed = speed_scales[:, None, None] * np.maximum(speed, 1)
+        acceleration = acceleration_scales[None, :, None] * np.maximum(acc, 1) * 100
+        travel = self.travel_time(distance, top_speed, acceleration)
+        latency = np.maximum(np.mean(duration - travel, axis=2), 0)
+        error = np.sum((duration - travel - latency[:, :, None]) ** 2, axis=2)
+        best_speed, best_acceleration = np.unravel_index(np.argmin(error), error.shape)
+
+        self.speed_scale = float(speed_scales[best_speed])
+        self.acceleration_scale = float(acceleration_scales[best_acceleration])
+        self.latency = float(latency[best_speed, best_acceleration])
+        self.calibrated = True
+        return True
+
+
 class ESP32Controller:
     """Class for communicating with ESP32 and controlling the connected servos."""
 
@@ -173,14 +298,20 @@ class ESP32Controller:
         serial_port=None,
         baud_rate: int = 115200,
         timeout=1,
+        protocol="text",
+        async_serial=False,
     ):
         self.communication_method = communication_method
+        # "text" for the line based commands, "binary" for framed commands (needs the current esp32_code/code.ino)
+        self.protocol = protocol
+        self.async_serial = async_serial
+        self.transport = None
         self.serial_port = serial_port
         self.baud_rate = baud_rate
         self.timeout = timeout
         self.stop_everything = False
         self.return_queue = queue.Queue()
-        self.active_signals = []  # x,y,start_freq,end_freq,peak_freq,peak_power_db
+        self.signal_tracker = signal_tracker.SignalTracker()
         self.active_channels = ChannelList()
 
         self.GLOBAL_ACC = 100
@@ -189,6 +320,36 @@ class ESP32Controller:
         self.CURRENT_POSITION_2 = 0
         self.TELEMETRY_1 = None
         self.TELEMETRY_2 = None
+        # time.monotonic() at which TELEMETRY_1 and TELEMETRY_2 were requested
+        self.TELEMETRY_TIME_1 = None
+        self.TELEMETRY_TIME_2 = None
+        # Polls the telemetry in the background once started with start_telemetry_polling
+        self.telemetry_cache = None
+        # How old (seconds) the cached telemetry of a scan may be, its position is kept current by the arrival reports
+        self.capture_telemetry_max_age = 0.5
+        # Request and reply pairs on the serial port come from several threads (sweeps, telemetry poller)
+        self.__io_lock = threading.RLock()
+        # Servo id -> time.monotonic() at which its position was last confirmed
+        self.__position_time = dict()
+
+        # Slack (seconds) on top of the predicted duration of a move before its position is checked without a MOVE_DONE
+        self.move_timeout_margin = 0.5
+        # Pause between position checks when the MOVE_DONE did not come
+        self.position_poll_interval = 0.01
+        # Pause between checks for a MOVE_DONE when nothing was received, the I/O lock is free for other threads meanwhile
+        self.notification_poll_interval = 0.005
+        # Servo id -> (position, time read) of the last MOVE_DONE that was read, but not yet waited for
+        self.__move_done = dict()
+        # Learns how long moves take from MOVE_DONE timing and telemetry, per servo
+        self.motion_models = {1: ServoMotionModel(), 2: ServoMotionModel()}
+        # Servo id -> speed of its last move command, for the speed readings in the telemetry
+        self.__commanded_speed = dict()
+        # Once the motion models are calibrated, sleep until the predicted arrival of a move and check the positions once,
+        # instead of waiting for MOVE_DONE
+        self.predicted_moves = False
+
+        # Process scans on a worker thread while the servos move to the next sweep point
+        self.pipelined_sweeps = True
 
         if serial_port == None:
             if platform.system() == "Windows":
@@ -221,6 +382,11 @@ class ESP32Controller:
         """
         return 700 <= location <= 2072
 
+    @property
+    def active_signals(self):
+        """The signals tracked during the current sweeps, least recently seen first."""
+        return self.signal_tracker.signals
+
     def __inRange(self, actual, expected, range):
         """Check if the actual value is within the expected value with a given range."""
         return abs(actual - expected) <= range
@@ -286,6 +452,155 @@ class ESP32Controller:
         if len(response) > 0:
             print("Garbage:", response)
 
+    def __read_line(self):
+        """Reads one line and returns its fields, or None if nothing came before the serial timeout. \n
+        MOVE_DONE notifications are kept for __wait_for_moves."""
+        line = self.esp32.readline().decode().strip()
+        if len(line) == 0:
+            return None
+        fields = [field.strip() for field in line.split(",")]
+        if fields[0] == "MOVE_DONE" and len(fields) == 3:
+            self.__move_done[int(fields[1])] = (int(fields[2]), time.monotonic())
+        elif fields[0] == "INVALID":
+            # The ESP32 could not parse a command, a move of it will never report MOVE_DONE
+            print(f"[WARNING] ESP32 rejected {line}")
+        return fields
+
+    def __read_reply(self, reply_type, servo_id):
+        """Reads lines until the reply_type line of the servo and returns its fields, or None if none came in time. \n
+        Notifications and stale replies read on the way are skipped instead of being taken as the answer."""
+        while True:
+            fields = self.__read_line()
+            if fields is None:
+                return None
+            if fields[0] == reply_type and len(fields) > 1 and fields[1] == str(servo_id):
+                return fields
+            if fields[0] not in ("MOVE_DONE", "INVALID"):
+                print("Garbage:", ",".join(fields))
+
+    def __motion_model(self, servo_id):
+        model = self.motion_models.get(servo_id)
+        if model is None:
+            model = self.motion_models[servo_id] = ServoMotionModel()
+        return model
+
+    def __plan_moves(self, targets):
+        """Returns (started, {servo id: distance}) of moving the servos in targets ({servo id: position}) from their last
+        known positions. Call it right before sending the move."""
+        distances = {servo_id: abs(position - self.__current_position(servo_id)) for servo_id, position in targets.items()}
+        return time.monotonic(), distances
+
+    def __predicted_duration(self, distances, speed=None):
+        """Returns the predicted time (seconds) until the slowest of the servos in distances ({servo id: distance}) arrived."""
+        speed = self.GLOBAL_SPEED if speed is None else speed
+        return max(
+            self.__motion_model(servo_id).predict_duration(distance, speed, self.GLOBAL_ACC)
+            for servo_id, distance in distances.items()
+        )
+
+    def estimate_path_time(self, points, dwell=0.0, start=None):
+        """Returns the predicted time (seconds) to visit the (x, y) points in order from start (default the current
+        position), staying dwell seconds at every point. Both servos move at once, so a step takes as long as the slower."""
+        x, y = start if start is not None else (self.CURRENT_POSITION_1, self.CURRENT_POSITION_2)
+        total = 0.0
+        for next_x, next_y in points:
+            total += self.__predicted_duration({1: abs(next_x - x), 2: abs(next_y - y)}) + dwell
+            x, y = next_x, next_y
+        return total
+
+    def __take_move_done(self, servo_id, position, plan):
+        """Returns True if a MOVE_DONE of the servo within range of position was read, and records the move's duration."""
+        done = self.__move_done.pop(servo_id, None)
+        if done is None or not self.__inRange(done[0], position, 10):
+            return False
+        self.__set_position(servo_id, done[0])
+        started, distances = plan
+        self.__motion_model(servo_id).record_move(distances[servo_id], self.GLOBAL_SPEED, self.GLOBAL_ACC, done[1] - started)
+        return True
+
+    def __wait_for_moves(self, targets, plan):
+        """Waits until every servo in targets ({servo id: position}) reported MOVE_DONE within range of its position. \n
+        plan is the __plan_moves of the move. With predicted_moves and calibrated motion models it sleeps until the
+        predicted arrival instead and checks the positions once. Servos that did not arrive by the predicted time plus
+        move_timeout_margin are checked directly, until they are in range."""
+        started, distances = plan
+        arrival = started + self.__predicted_duration(distances)
+        remaining = dict(targets)
+        if self.predicted_moves and all(self.__motion_model(servo_id).calibrated for servo_id in targets):
+            time.sleep(max(0.0, arrival - time.monotonic()))
+            for servo_id, position in list(remaining.items()):
+                if self.__inRange(self.__get_position(servo_id), position, 10):
+                    # A MOVE_DONE read on the way still has the true duration for the model
+                    self.__take_move_done(servo_id, position, plan)
+                    del remaining[servo_id]
+
+        deadline = arrival + self.move_timeout_margin
+        while len(remaining) > 0 and time.monotonic() < deadline:
+            for servo_id, position in list(remaining.items()):
+                if self.__take_move_done(servo_id, position, plan):
+                    del remaining[servo_id]
+            if len(remaining) > 0:
+                # Only reads lines that arrived, so the I/O lock is never held through a blocking read and the telemetry
+                # poller can interleave. MOVE_DONE lines its reads come across are kept for this wait as well.
+                with self.__io_lock:
+                    received = self.esp32.in_waiting > 0
+                    if received:
+                        self.__read_line()
+                if not received:
+                    time.sleep(self.notification_poll_interval)
+        for servo_id, position in remaining.items():
+            while not self.__inRange(self.__get_position(servo_id), position, 10):
+                time.sleep(self.position_poll_interval)
+
+    def __set_telemetry(self, servo_id, telemetry, sampled_at):
+        """Keeps the telemetry of the servo requested at sampled_at (time.monotonic()) and adds it to the telemetry cache.
+        A speed reading taken during a move goes to its motion model."""
+        if telemetry is None:
+            return
+        if telemetry["move"] != "0" and servo_id in self.__commanded_speed:
+            self.__motion_model(servo_id).record_speed(int(telemetry["speed"]), self.__commanded_speed[servo_id])
+        if sampled_at < self.__position_time.get(servo_id, -math.inf):
+            # Requested before the servo arrived, the confirmed position is newer than the one in the sample
+            telemetry = dict(telemetry, position=str(self.__current_position(servo_id)))
+        if servo_id == 1:
+            self.TELEMETRY_1 = telemetry
+            self.TELEMETRY_TIME_1 = sampled_at
+        elif servo_id == 2:
+            self.TELEMETRY_2 = telemetry
+            self.TELEMETRY_TIME_2 = sampled_at
+        if self.telemetry_cache is not None:
+            self.telemetry_cache.update(servo_id, telemetry, sampled_at)
+
+    def __set_position(self, servo_id, position):
+        """Keeps the confirmed position of the servo, and puts it into its cached telemetry, which keeps its own time."""
+        if servo_id == 1:
+            self.CURRENT_POSITION_1 = position
+        elif servo_id == 2:
+            self.CURRENT_POSITION_2 = position
+        self.__position_time[servo_id] = time.monotonic()
+        telemetry = self.TELEMETRY_1 if servo_id == 1 else self.TELEMETRY_2
+        if telemetry is not None and telemetry["position"] != str(position):
+            sampled_at = self.TELEMETRY_TIME_1 if servo_id == 1 else self.TELEMETRY_TIME_2
+            telemetry = dict(telemetry, position=str(position))
+            if servo_id == 1:
+                self.TELEMETRY_1 = telemetry
+            elif servo_id == 2:
+                self.TELEMETRY_2 = telemetry
+            if self.telemetry_cache is not None:
+                self.telemetry_cache.update(servo_id, telemetry, sampled_at)
+
+    def start_telemetry_polling(self, interval=0.25):
+        """Starts polling the telemetry of both servos every interval seconds on a background thread. From then on
+        get_telemetry, get_all_telemetry and capture_scan answer from the cache within their staleness budget."""
+        if self.telemetry_cache is None:
+            self.telemetry_cache = telemetry_cache.TelemetryCache(self.__read_all_telemetry, interval)
+        self.telemetry_cache.interval = interval
+        self.telemetry_cache.start()
+
+    def stop_telemetry_polling(self):
+        if self.telemetry_cache is not None:
+            self.telemetry_cache.stop()
+
     def __servosReady(self) -> bool:
         """Returns true when servos are ready to be used."""
         while True:
@@ -305,8 +620,13 @@ class ESP32Controller:
             "First turn power switch off manually, then move servos by hand to center, finally press enter when done to calibrate."
         )
 
-        self.esp32.write((f"CALIBRATE,1" + "\n").encode())
-        self.esp32.write((f"CALIBRATE,2" + "\n").encode())
+        with self.__io_lock:
+            if self.transport is not None:
+                self.transport.calibrate(1)
+                self.transport.calibrate(2)
+            else:
+                self.esp32.write((f"CALIBRATE,1" + "\n").encode())
+                self.esp32.write((f"CALIBRATE,2" + "\n").encode())
 
         if (
             self.__get_position(self.esp32, 1) == 2048
@@ -321,26 +641,68 @@ class ESP32Controller:
 
     def __get_position(self, servo_id) -> int:
         """Get the current position of the servo with the specified id."""
-        self.esp32.write((f"GET_POS,{servo_id}" + "\n").encode())
-        location = int(self.esp32.readline().decode().split(",")[2])
+        with self.__io_lock:
+            if self.transport is not None:
+                location = self.transport.get_positions([servo_id])[servo_id]
+            else:
+                self.esp32.write((f"GET_POS,{servo_id}" + "\n").encode())
+                fields = self.__read_reply("POSITION", servo_id)
+                location = -1 if fields is None else int(fields[2])
 
         # Update global variables while we are at it
-        match servo_id:
-            case 1:
-                self.CURRENT_POSITION_1 = location
-            case 2:
-                self.CURRENT_POSITION_2 = location
+        if location != -1:
+            self.__set_position(servo_id, location)
         return location
 
-    def get_telemetry(self, servo_id: int) -> dict[str, int]:
-        self.esp32.write((f"GET_TELEMETRY,{servo_id}" + "\n").encode())
-        # TELEMETRY,<servo_id>,<position>,<speed>,<load>,<voltage>,<temperature>,<move>,<current>
-        telemetry = self.esp32.readline().decode().split(",")
-        if (
-            telemetry is not None
-            and "TELEMETRY" in telemetry[0]
-            and int(telemetry[1]) == servo_id
-        ):
+    def get_telemetry(self, servo_id: int, max_age=None, timeout=None) -> dict[str, int]:
+        """Get the telemetry of the servo. While the telemetry poller runs it comes from the cache and the serial port is
+        left to the poller (see __cached_telemetry), otherwise it is read from the ESP32."""
+        if self.telemetry_cache is not None and self.telemetry_cache.running:
+            return self.__cached_telemetry([servo_id], max_age, timeout)[0]
+        return self.__read_telemetry(servo_id)
+
+    def get_all_telemetry(self, max_age=None, timeout=None) -> tuple[dict[str, int], dict[str, int]]:
+        """Get the telemetry of both servos, in one round trip with the binary protocol or the asynchronous transport. \n
+        While the telemetry poller runs they come from the cache like with get_telemetry."""
+        if self.telemetry_cache is not None and self.telemetry_cache.running:
+            return tuple(self.__cached_telemetry([1, 2], max_age, timeout))
+        return self.__read_all_telemetry()
+
+    def telemetry_age(self, servo_id):
+        """Returns how many seconds ago the newest telemetry of the servo was requested, or None if there is none."""
+        sampled_at = self.TELEMETRY_TIME_1 if servo_id == 1 else self.TELEMETRY_TIME_2
+        return None if sampled_at is None else time.monotonic() - sampled_at
+
+    def __cached_telemetry(self, servo_ids, max_age, timeout):
+        """Returns the cached telemetry of the servos. A sample older than max_age (seconds) wakes the poller, whose next
+        sample is awaited until timeout (seconds, self.timeout if None) runs out for all of them together. After that, or
+        without max_age, the newest sample there is is returned, however old (see telemetry_age), None if there is none."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        telemetry = list()
+        for servo_id in servo_ids:
+            telemetry_data = None
+            if max_age is not None:
+                telemetry_data = self.telemetry_cache.get(
+                    servo_id, max_age, timeout=max(0.0, deadline - time.monotonic())
+                )
+            if telemetry_data is None:
+                sample = self.telemetry_cache.sample(servo_id)
+                telemetry_data = None if sample is None else sample[0]
+            telemetry.append(telemetry_data)
+        return telemetry
+
+    def __read_telemetry(self, servo_id):
+        """Reads the telemetry of the servo from the ESP32."""
+        sampled_at = time.monotonic()
+        with self.__io_lock:
+            if self.transport is not None:
+                telemetry_data = self.transport.get_telemetry([servo_id])[servo_id]
+                self.__set_telemetry(servo_id, telemetry_data, sampled_at)
+                return telemetry_data
+            self.esp32.write((f"GET_TELEMETRY,{servo_id}" + "\n").encode())
+            # TELEMETRY,<servo_id>,<position>,<speed>,<load>,<voltage>,<temperature>,<move>,<current>
+            telemetry = self.__read_reply("TELEMETRY", servo_id)
+        if telemetry is not None:
             telemetry_data = {
                 "servo_id": telemetry[1],
                 "position": telemetry[2],
@@ -351,28 +713,39 @@ class ESP32Controller:
                 "move": telemetry[7],
                 "current": telemetry[8],
             }
-            if servo_id == 1:
-                self.TELEMETRY_1 = telemetry_data
-            elif servo_id == 2:
-                self.TELEMETRY_2 = telemetry_data
+            self.__set_telemetry(servo_id, telemetry_data, sampled_at)
         else:
             return None
         # print(telemetry_data)
-        return telemetry_data
+        return self.TELEMETRY_1 if servo_id == 1 else self.TELEMETRY_2
+
+    def __read_all_telemetry(self):
+        """Reads the telemetry of both servos from the ESP32, this is what the telemetry poller runs."""
+        if self.transport is None:
+            return self.__read_telemetry(1), self.__read_telemetry(2)
+        sampled_at = time.monotonic()
+        with self.__io_lock:
+            telemetry = self.transport.get_telemetry([1, 2])
+        self.__set_telemetry(1, telemetry[1], sampled_at)
+        self.__set_telemetry(2, telemetry[2], sampled_at)
+        return self.TELEMETRY_1, self.TELEMETRY_2
 
     def move_both(self, servo_id1, servo_id2, expected_pos1, expected_pos2):
-        """Move two servos to the specified positions."""
+        """Move two servos to the specified positions and wait until both are there."""
+        targets = {servo_id1: expected_pos1, servo_id2: expected_pos2}
+        if self.transport is not None:
+            self.__move_and_report(targets)
+            return
+        plan = self.__plan_moves(targets)
         self.__move_to(servo_id1, expected_pos1)
         self.__move_to(servo_id2, expected_pos2)
+        self.__wait_for_moves(targets, plan)
 
-        while True:
-            if self.__inRange(
-                self.__get_position(servo_id1), expected_pos1, 10
-            ) and self.__inRange(self.__get_position(servo_id2), expected_pos2, 10):
-                return
+    def __current_position(self, servo_id):
+        return self.CURRENT_POSITION_1 if servo_id == 1 else self.CURRENT_POSITION_2
 
-    def __move_to(self, servo_id: int, expected_pos: int):
-        """Move the servo with the specified id to the expected position."""
+    def __move_to(self, servo_id: int, expected_pos: int, speed=None):
+        """Move the servo with the specified id to the expected position, at GLOBAL_SPEED unless a speed is given."""
         if self.stop_everything:
             self.stop_everything = False
             raise stopEverything("User stopped everything.")
@@ -384,12 +757,19 @@ class ESP32Controller:
                     "Vertical servo future position out of bounds."
                 )
 
-        self.esp32.write(
-            (
-                f"MOVE,{servo_id},{expected_pos},{self.GLOBAL_SPEED},{self.GLOBAL_ACC}"
-                + "\n"
-            ).encode()
-        )
+        self.__commanded_speed[servo_id] = self.GLOBAL_SPEED if speed is None else speed
+        with self.__io_lock:
+            if self.transport is not None:
+                self.transport.move(servo_id, expected_pos, self.GLOBAL_SPEED if speed is None else speed, self.GLOBAL_ACC)
+                return
+            # A MOVE_DONE still unread belongs to an earlier move
+            self.__move_done.pop(servo_id, None)
+            self.esp32.write(
+                (
+                    f"MOVE,{servo_id},{expected_pos},{self.GLOBAL_SPEED if speed is None else speed},{self.GLOBAL_ACC}"
+                    + "\n"
+                ).encode()
+            )
 
     def __syncmove_to(self, servo_id1, servo_id2, expected_pos1, expected_pos2):
         """Move two servos to the desired positions at the same time synchronously."""
@@ -404,12 +784,24 @@ class ESP32Controller:
                     "Vertical servo future posiion out of bounds."
                 )
 
-        self.esp32.write(
-            (
-                f"SYNC_MOVE,[{servo_id1},{servo_id2}],2,[{expected_pos1},{expected_pos2}],[{self.GLOBAL_SPEED},{self.GLOBAL_SPEED}],[{self.GLOBAL_ACC},{self.GLOBAL_ACC}]"
-                + "\n"
-            ).encode()
-        )
+        self.__commanded_speed[servo_id1] = self.__commanded_speed[servo_id2] = self.GLOBAL_SPEED
+        with self.__io_lock:
+            if self.transport is not None:
+                self.transport.sync_move(
+                    [
+                        (servo_id1, expected_pos1, self.GLOBAL_SPEED, self.GLOBAL_ACC),
+                        (servo_id2, expected_pos2, self.GLOBAL_SPEED, self.GLOBAL_ACC),
+                    ]
+                )
+                return
+            self.__move_done.pop(servo_id1, None)
+            self.__move_done.pop(servo_id2, None)
+            self.esp32.write(
+                (
+                    f"SYNC_MOVE,[{servo_id1},{servo_id2}],2,[{expected_pos1},{expected_pos2}],[{self.GLOBAL_SPEED},{self.GLOBAL_SPEED}],[{self.GLOBAL_ACC},{self.GLOBAL_ACC}]"
+                    + "\n"
+                ).encode()
+            )
 
     def __syncmove_distance(self, servo_id1, servo_id2, distance1, distance2):
         """Move two servos by the specified distances at the same time synchronously."""
@@ -423,49 +815,132 @@ class ESP32Controller:
             if not self.__y_future_within_bounds(expected_pos2):
                 raise VerticalServoFutureOutOfBounds
 
-        self.esp32.write(
-            (
-                f"SYNC_MOVE,[{servo_id1},{servo_id2}],2,[{expected_pos1},{expected_pos2}],[{self.GLOBAL_SPEED},{self.GLOBAL_SPEED}],[{self.GLOBAL_ACC},{self.GLOBAL_ACC}]"
-                + "\n"
-            ).encode()
-        )
+        with self.__io_lock:
+            if self.transport is not None:
+                self.transport.sync_move(
+                    [
+                        (servo_id1, expected_pos1, self.GLOBAL_SPEED, self.GLOBAL_ACC),
+                        (servo_id2, expected_pos2, self.GLOBAL_SPEED, self.GLOBAL_ACC),
+                    ]
+                )
+                return
+            self.__move_done.pop(servo_id1, None)
+            self.__move_done.pop(servo_id2, None)
+            self.esp32.write(
+                (
+                    f"SYNC_MOVE,[{servo_id1},{servo_id2}],2,[{expected_pos1},{expected_pos2}],[{self.GLOBAL_SPEED},{self.GLOBAL_SPEED}],[{self.GLOBAL_ACC},{self.GLOBAL_ACC}]"
+                    + "\n"
+                ).encode()
+            )
+
+    def __move_to_scan_point(self, x_position, y_position):
+        """Move the antenna to a scan point and wait until it is there. \n
+        With the binary protocol this is one MOVE_AND_REPORT round trip, which also returns the telemetry of both servos at
+        the point for capture_scan. With the text protocol the vertical servo is only moved if needed and None is returned."""
+        if self.transport is None:
+            if not self.__inRange(self.CURRENT_POSITION_2, y_position, 10):
+                self.__move_to(2, y_position)
+            self.__move_to_and_wait_for_complete(1, x_position)
+            return None
+
+        self.__move_and_report({1: x_position, 2: y_position})
+        return self.TELEMETRY_1, self.TELEMETRY_2
+
+    def __move_and_report(self, targets):
+        """Move the servos in targets ({servo id: position}) through the transport, which waits until they arrived. \n
+        Updates the positions and telemetry of the moved servos and returns their telemetry by id. If they did not arrive
+        within the travel time, their positions are checked until they are in range."""
+        if self.stop_everything:
+            self.stop_everything = False
+            raise stopEverything("User stopped everything.")
+        if 2 in targets and not self.__y_future_within_bounds(targets[2]):
+            raise VerticalServoFutureOutOfBounds("Vertical servo future position out of bounds.")
+        for servo_id in targets:
+            self.__commanded_speed[servo_id] = self.GLOBAL_SPEED
+        started, distances = self.__plan_moves(targets)
+        with self.__io_lock:
+            arrived, telemetry = self.transport.move_and_report(
+                [(servo_id, position, self.GLOBAL_SPEED, self.GLOBAL_ACC) for servo_id, position in targets.items()],
+                move_timeout=self.__predicted_duration(distances) + self.move_timeout_margin,
+            )
+        reported_at = time.monotonic()
+        if arrived:
+            # The report comes when the slowest servo arrived, that is the move its duration is known of
+            slowest = max(
+                distances,
+                key=lambda servo_id: self.__motion_model(servo_id).predict_duration(
+                    distances[servo_id], self.GLOBAL_SPEED, self.GLOBAL_ACC
+                ),
+            )
+            self.__motion_model(slowest).record_move(
+                distances[slowest], self.GLOBAL_SPEED, self.GLOBAL_ACC, reported_at - started
+            )
+        for servo_id, servo_telemetry in telemetry.items():
+            # The report shows the servos after they stopped
+            self.__set_telemetry(servo_id, servo_telemetry, reported_at)
+            self.__set_position(servo_id, int(servo_telemetry["position"]))
+        if not arrived:
+            print(f"[WARNING] Servos did not report reaching {targets} in time, checking their positions.")
+            for servo_id, position in targets.items():
+                while not self.__inRange(self.__get_position(servo_id), position, 10):
+                    time.sleep(self.position_poll_interval)
+        return telemetry
 
     def __move_to_and_wait_for_complete(self, servo_id, expected_pos):
         """Move the servo to the expected position and wait for the movement to complete."""
-
+        if self.transport is not None:
+            self.__move_and_report({servo_id: expected_pos})
+            return
+        plan = self.__plan_moves({servo_id: expected_pos})
         self.__move_to(servo_id, expected_pos)
-        while True:
-            current_pos = self.__get_position(servo_id)
-            if self.__inRange(current_pos, expected_pos, 10):
-                break
+        self.__wait_for_moves({servo_id: expected_pos}, plan)
+
+    def __syncmove_to_and_wait_for_complete(self, expected_pos1, expected_pos2):
+        """Move both servos to the expected positions and wait for the movement to complete. \n
+        A diagonal move uses SYNC_MOVE so both servos arrive together, a move along one axis only moves that servo."""
+        if self.transport is not None:
+            self.__move_to_scan_point(expected_pos1, expected_pos2)
+            return
+        move_1 = not self.__inRange(self.CURRENT_POSITION_1, expected_pos1, 10)
+        move_2 = not self.__inRange(self.CURRENT_POSITION_2, expected_pos2, 10)
+        targets = dict()
+        if move_1:
+            targets[1] = expected_pos1
+        if move_2:
+            targets[2] = expected_pos2
+        if len(targets) == 0:
+            return
+        plan = self.__plan_moves(targets)
+        if move_1 and move_2:
+            self.__syncmove_to(1, 2, expected_pos1, expected_pos2)
+        elif move_1:
+            self.__move_to(1, expected_pos1)
+        else:
+            self.__move_to(2, expected_pos2)
+        self.__wait_for_moves(targets, plan)
 
     def __move_distance_and_wait_for_complete(self, servo_id, distance):
         """Move the servo by the specified distance and wait for the movement to complete."""
         current_pos = self.__get_position(servo_id)
-        expected_pos = current_pos + distance
-        self.__move_to(servo_id, expected_pos)
-        while True:
-            current_pos = self.__get_position(servo_id)
-            if self.__inRange(current_pos, expected_pos, 10):
-                break
+        self.__move_to_and_wait_for_complete(servo_id, current_pos + distance)
 
     def full_sweep_optimal(self, show_graph=False):
         """Perform a full sweep of the whole servo movement range in an optimal way."""
         y_positions = self.__calculate_vertical_movement_distances(6)
         point_array = [12, 12, 10, 8, 6, 4, 1]
 
-        for i in range(len(y_positions)):
-            self.__move_to_and_wait_for_complete(2, y_positions[i])
-            points = point_array[i]
-            start_angle = 0
-            x_positions = self.__calculate_horizontal_distances(
-                points, 4096, start_angle
-            )
-            for x_position in x_positions if i % 2 == 0 else reversed(x_positions):
-                self.__move_to_and_wait_for_complete(1, x_position[1])
-                self.perform_scan(offset=10, show_graph=show_graph)
-                # self.return_queue.put((signals, raw_data, telem1, telem2), block=False, timeout=0)
-                # print(len(signals), len(raw_data), len(telem1), len(telem2))
+        with self.__scan_pipeline() as pipeline:
+            for i in range(len(y_positions)):
+                self.__move_to_and_wait_for_complete(2, y_positions[i])
+                points = point_array[i]
+                start_angle = 0
+                x_positions = self.__calculate_horizontal_distances(
+                    points, 4096, start_angle
+                )
+                for x_position in x_positions if i % 2 == 0 else reversed(x_positions):
+                    telemetry = self.__move_to_scan_point(x_position[1], y_positions[i])
+                    # processing happens while the servos move on to the next point
+                    pipeline.submit(self.capture_scan(telemetry))
 
     def horizontal_sweep(self, show_graph=False, number_of_points=12, y_level=1024):
         """Perform a horizontal sweep scan at y_level with the specified number of points."""
@@ -497,110 +972,32 @@ class ESP32Controller:
         reverse = False
         skip_first = False
 
-        while not self.stop_everything:  # continious sweeping
-            # for s in self.active_signals:
-            #    s.update_sweep_list()  # add an empty sweep list to populate in each signals history list
-            #    if not skip_first:
-            #        s.inc_sweep_id()  # increment the sweep id for each signal
-
-            for x_position in (
-                reversed(x_positions) if reverse else x_positions
-            ):  # reverse the sweep direction every time, to minimise unnecessary traversal
-                if skip_first:
-                    skip_first = False
-                    continue
-
-                if not self.__inRange(self.CURRENT_POSITION_2, y_level, 10):
-                    self.__move_to(2, y_level)
-                self.__move_to_and_wait_for_complete(1, x_position[1])
-                scan_data = self.perform_scan(offset=10, show_graph=show_graph)
-                # x,y,start_freq,end_freq,peak_freq,peak_power_db
-                x = self.CURRENT_POSITION_1
-                y = self.CURRENT_POSITION_2
-                # start_freq = scan_data[0][0].start_freq
-                # end_freq = scan_data[0][0].end_freq
-                # peak_freq = scan_data[0][0].peak_freq
-                # peak_power_db = scan_data[0][0].peak_power_db
-                if len(scan_data[0]) > 0:  # if we got signals on this scan
-                    for signal in scan_data[0]:
-                        # print("Found signals:", len(scan_data[0]))
-                        if len(self.active_signals) == 0:
-                            signal.x = x
-                            signal.y = y
-                            self.active_signals.append(signal)
-                            self.active_channels.update_channels(signal)
-                            # print(
-                            #    "[len(active signals) == 0] Added completely new signal to active signals",
-                            #    signal.to_string(),
-                            # )
-                            signal.update_sweep_list()
-
-                        # check if signal is already in active signals, if it is, update it
-                        this_signal_is_new = True
-                        for index, existing_signal in enumerate(self.active_signals):
-                            existing_signal.inc_sweep_id()
-                            if (
-                                self.__inRange(
-                                    signal.peak_freq,
-                                    existing_signal.peak_freq,
-                                    0.1,
-                                )
-                                and self.__inRange(
-                                    signal.start_freq,
-                                    existing_signal.start_freq,
-                                    0.1,
-                                )
-                                and self.__inRange(
-                                    signal.end_freq, existing_signal.end_freq, 0.1
-                                )
-                                # and self.__inRange(x, existing_signal.x, 10)
-                                # and self.__inRange(y, existing_signal.y, 10)
-                            ):
-                                # found existing signal
-                                this_signal_is_new = False
-
-                                # update this signal's position history
-                                if (
-                                    len(existing_signal.position_history)
-                                    < existing_signal.sweep_id + 1
-                                ):
-                                    existing_signal.update_sweep_list()
-
-                                existing_signal.position_history[
-                                    existing_signal.sweep_id
-                                ].append([x, y, signal.peak_power_db])
-
-                                # its not stronger, skip the recursive 8-point check
-                                if signal.peak_power_db < existing_signal.peak_power_db:
-                                    continue
-                                # its stronger, first check if an even stronger is nearby
-                                
-                                # print(
-                                #    "Found a stronger signal position: ",
-                                #    x_return,
-                                #    y_return,
-                                # )
-                                # update existing signal with new stronger signal position data
-
-                                # x,y,signal
-                                break
-                        if this_signal_is_new:
-                            signal.x = x
-                            signal.y = y
-                            self.active_signals.append(signal)
-                            self.active_channels.update_channels(signal)
-                            # print(
-                            #    "Added new signal to active signals", signal.to_string()
-                            # )
-                            signal.update_sweep_list()
-            # self.return_queue.put((signals, raw_data, telem1, telem2), block=False, timeout=0)
-            # print(len(signals), len(raw_data), len(telem1), len(telem2))
-            # while loop variables
-            reverse = not reverse
-            skip_first = True
-            self.active_channels.reset_history()
-        else:
-            raise stopEverything("User stopped infinite horizontal precise scan.")
+        def handle_result(capture, scan_data):
+            self.__update_active_signals(scan_data[0], capture.x, capture.y, captured_at=capture.captured_at)
+
+        with self.__scan_pipeline(handle_result) as pipeline:
+            while not self.stop_everything:  # continious sweeping
+                for x_position in (
+                    reversed(x_positions) if reverse else x_positions
+                ):  # reverse the sweep direction every time, to minimise unnecessary traversal
+                    if skip_first:
+                        skip_first = False
+                        continue
+
+                    telemetry = self.__move_to_scan_point(x_position[1], y_level)
+                    # processing happens while the servo moves on to the next point
+                    pipeline.submit(self.capture_scan(telemetry))
+
+                # wait for the last points of this sweep before starting the next one
+                pipeline.drain()
+                # while loop variables
+                reverse = not reverse
+                skip_first = True
+                self.active_channels.estimate_bearings()
+                self.active_channels.reset_history()
+                self.signal_tracker.next_sweep()
+            else:
+                raise stopEverything("User stopped infinite horizontal precise scan.")
 
     def horizontal_section_sweep_precise(
         self,
@@ -619,116 +1016,177 @@ class ESP32Controller:
         reverse = False
         skip_first = False
 
-        while not self.stop_everything:  # continious sweeping
-            # for s in self.active_signals:
-            #    s.update_sweep_list()  # add an empty sweep list to populate in each signals history list
-            #    if not skip_first:
-            #        s.inc_sweep_id()  # increment the sweep id for each signal
+        def handle_result(capture, scan_data):
+            self.__update_active_signals(
+                scan_data[0], capture.x, capture.y, move_to_stronger=True, captured_at=capture.captured_at
+            )
 
-            for x_position in (
-                reversed(x_positions) if reverse else x_positions
-            ):  # reverse the sweep direction every time, to minimise unnecessary traversal
-                if skip_first:
-                    skip_first = False
-                    continue
+        with self.__scan_pipeline(handle_result) as pipeline:
+            while not self.stop_everything:  # continious sweeping
+                for x_position in (
+                    reversed(x_positions) if reverse else x_positions
+                ):  # reverse the sweep direction every time, to minimise unnecessary traversal
+                    if skip_first:
+                        skip_first = False
+                        continue
+
+                    telemetry = self.__move_to_scan_point(x_position, y_level)
+                    # processing happens while the servo moves on to the next point
+                    pipeline.submit(self.capture_scan(telemetry))
+
+                # wait for the last points of this sweep before starting the next one
+                pipeline.drain()
+                self.active_channels.estimate_bearings()
+                self.active_channels.reset_history()
+                self.signal_tracker.next_sweep()
+                # while loop variables
+                reverse = not reverse
+                skip_first = True
+            else:
+                raise stopEverything("User stopped infinite horizontal precise scan.")
 
-                if not self.__inRange(self.CURRENT_POSITION_2, y_level, 10):
-                    self.__move_to(2, y_level)
-                self.__move_to_and_wait_for_complete(1, x_position)
-                scan_data = self.perform_scan(offset=10, show_graph=show_graph)
-                # x,y,start_freq,end_freq,peak_freq,peak_power_db
-                x = self.CURRENT_POSITION_1
-                y = self.CURRENT_POSITION_2
-                # start_freq = scan_data[0][0].start_freq
-                # end_freq = scan_data[0][0].end_freq
-                # peak_freq = scan_data[0][0].peak_freq
-                # peak_power_db = scan_data[0][0].peak_power_db
-                if len(scan_data[0]) > 0:  # if we got signals on this scan
-                    for signal in scan_data[0]:
-                        # print("Found signals:", len(scan_data[0]))
-                        if len(self.active_signals) == 0:
-                            signal.x = x
-                            signal.y = y
-                            self.active_signals.append(signal)
-                            self.active_channels.update_channels(signal)
-                            # print(
-                            #    "[len(active signals) == 0] Added completely new signal to active signals",
-                            #    signal.to_string(),
-                            # )
-                            signal.update_sweep_list()
-
-                        # check if signal is already in active signals, if it is, update it
-                        this_signal_is_new = True
-                        for index, existing_signal in enumerate(self.active_signals):
-                            existing_signal.inc_sweep_id()
-                            if (
-                                self.__inRange(
-                                    signal.peak_freq,
-                                    existing_signal.peak_freq,
-                                    0.1,
-                                )
-                                and self.__inRange(
-                                    signal.start_freq,
-                                    existing_signal.start_freq,
-                                    0.1,
-                                )
-                                and self.__inRange(
-                                    signal.end_freq, existing_signal.end_freq, 0.1
-                                )
-                                # and self.__inRange(x, existing_signal.x, 10)
-                                # and self.__inRange(y, existing_signal.y, 10)
-                            ):
-                                # found existing signal
-                                this_signal_is_new = False
-
-                                # update this signal's position history
-                                if (
-                                    len(existing_signal.position_history)
-                                    < existing_signal.sweep_id + 1
-                                ):
-                                    existing_signal.update_sweep_list()
-
-                                existing_signal.position_history[
-                                    existing_signal.sweep_id
-                                ].append([x, y, signal.peak_power_db])
-
-                                # its not stronger, skip the recursive 8-point check
-                                if signal.peak_power_db < existing_signal.peak_power_db:
-                                    continue
-                                # its stronger, first check if an even stronger is nearby
-                                
-                                # print(
-                                #    "Found a stronger signal position: ",
-                                #    x_return,
-                                #    y_return,
-                                # )
-                                # update existing signal with new stronger signal position data
-                                existing_signal.x = self.CURRENT_POSITION_1
-                                existing_signal.y = self.CURRENT_POSITION_2
-                                existing_signal.peak_freq = signal.peak_freq
-                                existing_signal.peak_power_db = signal.peak_power_db
-                                existing_signal.start_freq = signal.start_freq
-                                existing_signal.end_freq = signal.end_freq
-                                # x,y,signal
-                                break
-                        if this_signal_is_new:
-                            signal.x = x
-                            signal.y = y
-                            self.active_signals.append(signal)
-                            self.active_channels.update_channels(signal)
-                            # print(
-                            #    "Added new signal to active signals", signal.to_string()
-                            # )
-                            signal.update_sweep_list()
-            self.active_channels.reset_history()
-            # self.return_queue.put((signals, raw_data, telem1, telem2), block=False, timeout=0)
-            # print(len(signals), len(raw_data), len(telem1), len(telem2))
-            # while loop variables
-            reverse = not reverse
-            skip_first = True
+    def horizontal_channel_sweep(self, number_of_points=12, y_level=1024):
+        """Perform a horizontal sweep at y_level that only measures the power of every A band channel at each point. \n
+        Uses the polyphase channelizer instead of the PSD and signal detection, results go straight into the active channels."""
+        self.__move_to_and_wait_for_complete(servo_id=2, expected_pos=y_level)
+        x_positions = self.__calculate_horizontal_distances(number_of_points, 4096, 0)
+
+        reverse = False
+        skip_first = False
+
+        def handle_result(capture, scan_data):
+            self.active_channels.update_channels(scan_data[0])
+
+        with self.__scan_pipeline(handle_result, self.process_channel_scan) as pipeline:
+            while not self.stop_everything:
+                for x_position in reversed(x_positions) if reverse else x_positions:
+                    if skip_first:
+                        skip_first = False
+                        continue
+
+                    telemetry = self.__move_to_scan_point(x_position[1], y_level)
+                    pipeline.submit(self.capture_scan(telemetry))
+
+                pipeline.drain()
+                reverse = not reverse
+                skip_first = True
+                self.active_channels.estimate_bearings()
+                self.active_channels.reset_history()
+            else:
+                raise stopEverything("User stopped infinite horizontal channel sweep.")
+
+    def horizontal_adaptive_sweep(self, coarse_points=16, resolution_deg=1.0, margin_db=6.0, y_level=1024):
+        """Find the bearing of every emitter at y_level coarse to fine, see adaptive_search.AdaptiveSearch. \n
+        A coarse pass of coarse_points channel power scans around the full circle finds the sectors with a channel above its
+        noise floor by margin_db, only those are refined down to resolution_deg degrees. \n
+        Returns (channel name, x position, power in dBm) of every emitter found, the channels get the fitted bearings."""
+        self.__move_to_and_wait_for_complete(servo_id=2, expected_pos=y_level)
+        self.active_channels.reset_history()
+        names = list()
+
+        def channel_powers_of(scan_data):
+            channel_powers = scan_data[0]
+            self.active_channels.update_channels(channel_powers)
+            names[:] = channel_powers.names
+            return channel_powers.powers_db
+
+        def measure(x_position):
+            telemetry = self.__move_to_scan_point(x_position, y_level)
+            return channel_powers_of(self.process_channel_scan(self.capture_scan(telemetry)))
+
+        search = adaptive_search.AdaptiveSearch(
+            measure,
+            coarse_points=coarse_points,
+            resolution=max(1, int(resolution_deg / 360 * 4096)),
+            margin_db=margin_db,
+        )
+
+        # The coarse points are known in advance, so they are processed while the servo moves on
+        coarse_positions = search.coarse_positions()
+        coarse_powers = list()
+
+        def handle_result(capture, scan_data):
+            coarse_powers.append(channel_powers_of(scan_data))
+
+        with self.__scan_pipeline(handle_result, self.process_channel_scan) as pipeline:
+            for x_position in coarse_positions:
+                pipeline.submit(self.capture_scan(self.__move_to_scan_point(x_position, y_level)))
+            pipeline.drain()
+        search.add_measurements(coarse_positions, coarse_powers)
+
+        peaks = search.run()
+        print(f"Adaptive sweep found {len(peaks)} emitters with {len(search.measurements)} scans.")
+        self.active_channels.estimate_bearings()
+        return [(str(names[peak.channel]), peak.position, peak.power_db) for peak in peaks]
+
+    def horizontal_moving_sweep(
+        self, start=0, end=4095, speed=500, block_samples=65536, bin_count=360, y_level=1024, detect=True
+    ):
+        """Scan while the horizontal servo turns from start to end at a constant speed (servo steps per second), without stopping. \n
+        IQ is captured in short timestamped blocks of block_samples samples. The servo position is polled between blocks, and each
+        block's position is interpolated at the middle of its samples (see moving_scan.PositionTrack). The PSD of each block
+        goes into bin_count bins over the full circle (see moving_scan.AngleBinnedSpectrum). \n
+        Streaming (SignalProcessor.start_streaming) gives the most exact block times. If detect is True the signals in the
+        average PSD of every filled bin become active signals at the bin's center. Returns the AngleBinnedSpectrum."""
+        self.__move_to_and_wait_for_complete(servo_id=2, expected_pos=y_level)
+        self.__move_to_and_wait_for_complete(servo_id=1, expected_pos=start)
+
+        track = moving_scan.PositionTrack()
+        spectrum = moving_scan.AngleBinnedSpectrum(bin_count)
+        sample_rate = self.sp.hackrf.sample_rate
+        center_freq = self.sp.hackrf.center_freq
+        # PSDs of blocks that were taken after the newest known position, as (captured_at, pxx, freqs)
+        pending = list()
+
+        def poll_position():
+            asked_at = time.monotonic()
+            position = self.__get_position(1)
+            # the reply is the position somewhere between asking and reading it
+            track.add((asked_at + time.monotonic()) / 2, position)
+            return position
+
+        poll_position()
+        self.__move_to(1, end, speed=speed)
+        while not self.stop_everything:
+            samples, captured_at = self.sp.capture_timed_samples(sample_count=block_samples)
+            pxx, freqs = self.sp.psd.estimate(
+                samples, NFFT=self.sp.fft_count, Fs=sample_rate / 1e6, Fc=center_freq / 1e6
+            )
+            pending.append((captured_at, pxx, freqs))
+            position = poll_position()
+
+            placed = [block for block in pending if block[0] <= track.newest_time]
+            pending = pending[len(placed):]
+            if len(placed) > 0:
+                positions = track.position_at([block[0] for block in placed])
+                for block_position, (block_captured_at, block_pxx, block_freqs) in zip(positions, placed):
+                    if not np.isnan(block_position):
+                        spectrum.add(block_position, block_pxx, block_freqs, block_captured_at)
+
+            if self.__inRange(position, end, 10):
+                break
         else:
-            raise stopEverything("User stopped infinite horizontal precise scan.")
+            raise stopEverything("User stopped moving sweep.")
 
+        if detect:
+            for index in spectrum.filled_bins():
+                x = spectrum.bin_center(index)
+                signals, _ = self.sp.detect_signals(
+                    spectrum.average(index), spectrum.freqs, position=(x, y_level), keep_history=False
+                )
+                self.__update_active_signals(signals, x, y_level, captured_at=spectrum.captured_at(index))
+        return spectrum
+
+    def __update_active_signals(self, signals, x, y, move_to_stronger=False, captured_at=None):
+        """Associates the signals found at position x, y with the tracked signals (see signal_tracker.SignalTracker). \n
+        If move_to_stronger is True, a matching active signal takes over the position and values of a stronger new signal."""
+        # active signals keep a history, so they need full Signal objects
+        signals = [
+            signal_processor.Signal.from_view(signal) if isinstance(signal, signal_batch.SignalView) else signal
+            for signal in signals
+        ]
+        for signal in self.signal_tracker.update(signals, x, y, captured_at, move_to_stronger):
+            self.active_channels.update_channels(signal)
 
     def section_TEST(
         self,
@@ -805,6 +1263,7 @@ class ESP32Controller:
                     for signal in scan_data[0]:
                         self.active_channels.update_channels(signal)
 
+            self.active_channels.estimate_bearings()
             file.write(f'{time.strftime("%H_%M_%S")},{sweep_nr},{"H" if horizontal else "V"},{self.active_channels.to_csv_string_active_channels()}\n')
             #reset the active channels for the next sweep to start fresh
             self.active_channels.reset_channels()
@@ -845,54 +1304,55 @@ class ESP32Controller:
         #open a file to write logs to
         file.write("timestamp, testnumber, testtype, ch_name, ch_peak_freq, ch_peak_freq_start, ch_peak_freq_end, ch_peak_power_db, ch_peak_x, ch_peak_y, ch_horizontal_angle, ch_vertical_angle\n")
 
-        while not self.stop_everything:  # continious sweeping
-            print(f"Starting sweep {sweep_nr}.")
+        def handle_result(capture, scan_data):
+            for signal in scan_data[0]:
+                self.active_channels.update_channels(signal)
+
+        with self.__scan_pipeline(handle_result) as pipeline:
+            while not self.stop_everything:  # continious sweeping
+                print(f"Starting sweep {sweep_nr}.")
             
             
             
-            if sweep_nr == 10:
-                input("Move the drone to the second point and press enter to continue scanning.")
+                if sweep_nr == 10:
+                    input("Move the drone to the second point and press enter to continue scanning.")
             
-            if sweep_nr < 10:
-                #do FIRST horizontal sweeps
-                positions = self.__calculate_n_positions_over_section(first_section_start, first_section_end, number_of_points)
-                static_level = 1024
-                point_nr = 1
-            if sweep_nr >= 10:
-                #do SECOND horizontal sweeps
-                self.active_channels.reset_channels()
-                self.active_signals = []
-                positions = self.__calculate_n_positions_over_section(second_section_start, second_section_end, number_of_points)
-                static_level = 1024
-                point_nr = 2
-            if sweep_nr >= 20:
-                #end as we have done 10 + 10 sweeps
-                print(f"Completed sweeps 0 - {sweep_nr - 1}.")
-                break
+                if sweep_nr < 10:
+                    #do FIRST horizontal sweeps
+                    positions = self.__calculate_n_positions_over_section(first_section_start, first_section_end, number_of_points)
+                    static_level = 1024
+                    point_nr = 1
+                if sweep_nr >= 10:
+                    #do SECOND horizontal sweeps
+                    self.active_channels.reset_channels()
+                    self.signal_tracker.reset()
+                    positions = self.__calculate_n_positions_over_section(second_section_start, second_section_end, number_of_points)
+                    static_level = 1024
+                    point_nr = 2
+                if sweep_nr >= 20:
+                    #end as we have done 10 + 10 sweeps
+                    print(f"Completed sweeps 0 - {sweep_nr - 1}.")
+                    break
                 
-            sweep_nr += 1
+                sweep_nr += 1
 
-            for position in (
-                reversed(positions) if reverse else positions
-            ):  # reverse the sweep direction every time, to minimise unnecessary traversal
+                for position in (
+                    reversed(positions) if reverse else positions
+                ):  # reverse the sweep direction every time, to minimise unnecessary traversal
                 
-                #little checks
-                if not self.__inRange(self.CURRENT_POSITION_2, static_level, 10):
-                        self.__move_to(2, static_level)
-
-                #main move command
-                self.__move_to_and_wait_for_complete(1, position)
+                    #main move command
+                    telemetry = self.__move_to_scan_point(position, static_level)
                 
-                scan_data = self.perform_scan(offset=10, show_graph=show_graph)
-
-                if len(scan_data[0]) > 0:  # if we got signals on this scan
-                    for signal in scan_data[0]:
-                        self.active_channels.update_channels(signal)
-
-            file.write(f'{time.strftime("%H_%M_%S")},{sweep_nr},{"FIRST" if point_nr == 1 else "SECOND"},{self.active_channels.to_csv_string_active_channels()}\n')
-            #reset the active channels for the next sweep to start fresh
-            self.active_channels.reset_channels()
-            reverse = not reverse
+                    # processing happens while the servo moves on to the next point
+                    pipeline.submit(self.capture_scan(telemetry))
+
+                # all points of this sweep must be in the channel list before it is written out
+                pipeline.drain()
+                self.active_channels.estimate_bearings()
+                file.write(f'{time.strftime("%H_%M_%S")},{sweep_nr},{"FIRST" if point_nr == 1 else "SECOND"},{self.active_channels.to_csv_string_active_channels()}\n')
+                #reset the active channels for the next sweep to start fresh
+                self.active_channels.reset_channels()
+                reverse = not reverse
         
         #Post break stuff
         file.close()
@@ -912,53 +1372,35 @@ class ESP32Controller:
         prev_signal_start_freq,
         prev_signal_end_freq,
         search_radius,
+        max_scans=64,
     ):
-        """Finds the strongest point of a signal by moving the device to the location of the signal and scanning again. If a stronger signal is found, it moves to that location and scans again. This process is repeated until no stronger signal is found."""
-        x_return = prev_x
-        y_return = prev_y
-        signal_frequency_return = prev_signal_frequency
-        signal_power_return = prev_signal_power
-
-        locations = self.calculate_circular_coordinates(prev_x, prev_y, search_radius, 8)
-
-        search_radius = search_radius // 2
-        if search_radius < 25:
-            return x_return, y_return, signal_frequency_return, signal_power_return
-            
-
-        location_data = list()
-        for location in locations:
-            # print(location)
-            self.move_both(1, 2, location[0], location[1])
-            location_data.append([location, self.perform_scan()])
-
-        new_strongest_signal_power = None
-        new_strongest_signal_freq = None
-
-        for scan in location_data:
-            signals = scan[1][0]
-            if len(signals) > 0:
-                for signal in signals:
-                    if prev_signal_start_freq < signal.peak_freq < prev_signal_end_freq:
-                        if signal.peak_power_db > prev_signal_power:
-                            new_strongest_signal_power = signal.peak_power_db
-                            new_strongest_signal_freq = signal.peak_freq
-                            new_strongest_signal_x = self.__get_position(1)
-                            new_strongest_signal_y = self.__get_position(2)
-
-        # If we found a stronger signal, we move to that location and scan again to find the strongest point of the signal
-        if new_strongest_signal_power is not None:
-            return self.find_strongest_point_of_signal(
-                prev_x=new_strongest_signal_x,
-                prev_y=new_strongest_signal_y,
-                prev_signal_frequency=new_strongest_signal_freq,
-                prev_signal_power=new_strongest_signal_power,
-                prev_signal_start_freq=prev_signal_start_freq,
-                prev_signal_end_freq=prev_signal_end_freq,
-                search_radius=search_radius
-            )
-        else:
-            return x_return, y_return, signal_frequency_return, signal_power_return
+        """Finds the strongest point of a signal by climbing towards stronger positions around the position it was found at,
+        then fitting the antenna's main lobe to the scans, see adaptive_search.HillClimb. Positions are only scanned once,
+        diagonal steps move both servos at the same time. \n
+        Returns the x, y position, peak frequency and power of the strongest scan of the signal."""
+
+        def measure(x, y):
+            self.__syncmove_to_and_wait_for_complete(x, y)
+            strongest = None
+            for signal in self.perform_scan()[0]:
+                if prev_signal_start_freq < signal.peak_freq < prev_signal_end_freq:
+                    if strongest is None or signal.peak_power_db > strongest[0]:
+                        strongest = (signal.peak_power_db, signal.peak_freq)
+            return strongest
+
+        def clamp(x, y):
+            # same limits as calculate_circular_coordinates
+            return min(max(x, 0), 4096), min(max(y, 700), 2048)
+
+        climb = adaptive_search.HillClimb(
+            measure,
+            radius=search_radius,
+            max_measurements=max_scans,
+            clamp=clamp,
+            estimator=self.active_channels.bearing_estimator,
+        )
+        (x, y), (power, frequency) = climb.run(prev_x, prev_y, prev_signal_power, prev_signal_frequency)
+        return x, y, frequency, power
 
     def go_to_forward(self):
         self.__move_to(1, 2048)
@@ -983,36 +1425,79 @@ class ESP32Controller:
     ) -> tuple[list[signal_processor.Signal], list, dict[str, int], dict[str, int]]:
         """Perform a scan at the current servo positions. \n
         Returns any signals found + servo telemetry for the GUI program to display."""
-        telemetry_1 = self.get_telemetry(1)
-        telemetry_2 = self.get_telemetry(2)
-        # print("=====================================")
-        # print(
-        #    f'[INFO] Performing scan at x {telemetry_1["position"]}, y {telemetry_2["position"]}. Temp1 {telemetry_1["temperature"]} Temp2 {telemetry_2["temperature"]}.'
-        # )
+        return self.process_scan(self.capture_scan())
+
+    def capture_scan(self, telemetry=None) -> sweep_pipeline.ScanCapture:
+        """Capture the samples and servo telemetry at the current servo positions without processing them. \n
+        telemetry is the (servo 1, servo 2) telemetry if it was already read at this position, see __move_to_scan_point."""
+        # When the signal processor is streaming, only samples taken from this moment on are used
+        scan_started = time.monotonic()
+        if telemetry is None:
+            telemetry = self.get_all_telemetry(max_age=self.capture_telemetry_max_age)
+        telemetry_1, telemetry_2 = telemetry
         # if int(telemetry_1['temperature']) >= 50 or int(telemetry_2['temperature']) >= 50:
         #    raise ServoTemperatureTooHigh("Servo temperature too high.")
-        signals, raw_data = self.sp.get_signals()
-        for signal in signals:
-            signal.x = telemetry_1["position"]
-            signal.y = telemetry_2["position"]
-
-        # print("Signals found: ", len(signals))
-        # for i, signal in enumerate(signals):
-        # print(
-        # f"[{i}] Signal from",
-        # signal.start_freq,
-        # "to",
-        # signal.end_freq,
-        # "with peak power of",
-        # signal.peak_power_db,
-        #  " at freq ",
-        #   signal.peak_freq,
-        # )
-        # print("=====================================")
+        samples = self.sp.capture_samples(after=scan_started)
+        return sweep_pipeline.ScanCapture(
+            samples,
+            self.sp.hackrf.sample_rate,
+            self.sp.hackrf.center_freq,
+            telemetry_1,
+            telemetry_2,
+            self.CURRENT_POSITION_1,
+            self.CURRENT_POSITION_2,
+            scan_started,
+        )
+
+    def process_scan(
+        self, capture: sweep_pipeline.ScanCapture
+    ) -> tuple[list[signal_processor.Signal], list, dict[str, int], dict[str, int]]:
+        """Process a captured scan. \n
+        Returns any signals found + servo telemetry for the GUI program to display."""
+        signals, raw_data = self.sp.process_samples(
+            capture.samples,
+            capture.sample_rate,
+            capture.center_freq,
+            position=(capture.telemetry_1["position"], capture.telemetry_2["position"]),
+        )
+        if isinstance(signals, signal_batch.SignalBatch):
+            signals.set_position(capture.telemetry_1["position"], capture.telemetry_2["position"])
+        else:
+            for signal in signals:
+                signal.x = capture.telemetry_1["position"]
+                signal.y = capture.telemetry_2["position"]
+
         self.return_queue.put(
-            (signals, raw_data, telemetry_1, telemetry_2), block=False, timeout=0
+            (signals, raw_data, capture.telemetry_1, capture.telemetry_2),
+            block=False,
+            timeout=0,
+        )
+        return (signals, raw_data, capture.telemetry_1, capture.telemetry_2)
+
+    def process_channel_scan(
+        self, capture: sweep_pipeline.ScanCapture
+    ) -> tuple[signal_processor.ChannelPowers, list, dict[str, int], dict[str, int]]:
+        """Process a captured scan into the power of every visible A band channel. \n
+        Returns the channel powers + servo telemetry for the GUI program to display."""
+        channel_powers, raw_data = self.sp.process_channel_powers(
+            capture.samples, capture.sample_rate, capture.center_freq
+        )
+        channel_powers.set_position(capture.telemetry_1["position"], capture.telemetry_2["position"])
+
+        self.return_queue.put(
+            (channel_powers, raw_data, capture.telemetry_1, capture.telemetry_2),
+            block=False,
+            timeout=0,
+        )
+        return (channel_powers, raw_data, capture.telemetry_1, capture.telemetry_2)
+
+    def __scan_pipeline(self, handle_result=None, process_scan=None) -> sweep_pipeline.ScanPipeline:
+        """Returns a scan pipeline that processes captures while the servos move on to the next point."""
+        if process_scan is None:
+            process_scan = self.process_scan
+        return sweep_pipeline.ScanPipeline(
+            process_scan, handle_result, enabled=self.pipelined_sweeps
         )
-        return (signals, raw_data, telemetry_1, telemetry_2)
 
     def initialize(self):
         """Initialize the ESP32 controller and connect to the device."""
@@ -1034,6 +1519,13 @@ class ESP32Controller:
         print("[INFO] Connected to ESP32.")
 
         self.__collectGarbage()
+        # After collecting the garbage, the asynchronous transport's reader owns all reads from here on
+        if self.async_serial:
+            self.transport = serial_transport.SerialTransport(self.esp32, protocol=self.protocol, timeout=self.timeout)
+            # Matches replies to requests itself, so requests from several threads can be in flight at once
+            self.__io_lock = contextlib.nullcontext()
+        elif self.protocol == "binary":
+            self.transport = esp32_protocol.BinaryTransport(self.esp32, timeout=self.timeout)
         if self.__servosReady():
             print("[INFO] Servos ready.")
 
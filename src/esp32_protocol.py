@@ -0,0 +1,219 @@
+import struct
+import time
+
+# Binary framed protocol between ESP32Controller and esp32_code/code.ino, next to the text protocol (see esp32_controller.py).
+# Frame: SYNC_1 SYNC_2 <length u8> <sequence u8> <type u8> <payload, length - 1 bytes> <crc u16>
+# length counts the type and the payload, the CRC (CRC-16/CCITT-FALSE) covers length, sequence, type and payload.
+# All values are little endian. A reply has the sequence number of its request.
+SYNC_1 = 0xA5
+SYNC_2 = 0x5A
+
+# Requests
+MOVE = 0x01  # <id u8> <position s16> <speed u16> <acc u8>, no reply
+SYNC_MOVE = 0x02  # <count u8> count * (<id u8> <position s16> <speed u16> <acc u8>), no reply
+GET_POS = 0x03  # <count u8> count * <id u8>, replied with POSITIONS
+GET_TELEMETRY = 0x04  # <count u8> count * <id u8>, replied with TELEMETRY
+MOVE_AND_REPORT = 0x05  # <tolerance u8> <timeout ms u16> then like SYNC_MOVE, replied with MOVE_REPORT once all servos arrived
+CALIBRATE = 0x06  # <id u8>, no reply
+
+# Replies
+POSITIONS = 0x83  # <count u8> count * (<id u8> <position s16>)
+TELEMETRY = 0x84  # <count u8> count * TELEMETRY_RECORD
+MOVE_REPORT = 0x85  # <arrived u8> then like TELEMETRY
+ERROR = 0xFF  # <request type u8> <code u8>
+
+MOVE_RECORD = struct.Struct("<BhHB")
+POSITION_RECORD = struct.Struct("<Bh")
+# id, position, speed, load, voltage, temperature, move, current
+TELEMETRY_RECORD = struct.Struct("<BhhhhhBh")
+CRC = struct.Struct("<H")
+
+ERROR_CODES = {1: "bad CRC", 2: "unknown type", 3: "bad payload"}
+
+
+class ProtocolError(Exception):
+    """Raised if the ESP32 sent a malformed or unexpected frame, or reported an error."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def _crc_table():
+    table = list()
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    """Returns the CRC-16/CCITT-FALSE of the bytes."""
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def encode_frame(sequence, frame_type, payload=b""):
+    """Returns the bytes of one frame."""
+    if len(payload) > 254:
+        raise ValueError(f"Payload of {len(payload)} bytes does not fit in a frame.")
+    body = bytes((len(payload) + 1, sequence & 0xFF, frame_type)) + bytes(payload)
+    return bytes((SYNC_1, SYNC_2)) + body + CRC.pack(crc16(body))
+
+
+def encode_moves(moves):
+    """Returns the payload part of SYNC_MOVE and MOVE_AND_REPORT for a list of (id, position, speed, acc)."""
+    return bytes((len(moves),)) + b"".join(MOVE_RECORD.pack(*move) for move in moves)
+
+
+def encode_ids(servo_ids):
+    return bytes((len(servo_ids),)) + bytes(servo_ids)
+
+
+def decode_positions(payload):
+    """Returns {id: position} of a POSITIONS payload."""
+    count = payload[0]
+    return dict(POSITION_RECORD.unpack_from(payload, 1 + i * POSITION_RECORD.size) for i in range(count))
+
+
+def decode_telemetry(payload):
+    """Returns {id: telemetry} of a TELEMETRY payload. Telemetry dictionaries look like the ones parsed from the text protocol."""
+    count = payload[0]
+    telemetry = dict()
+    for i in range(count):
+        servo_id, position, speed, load, voltage, temperature, move, current = TELEMETRY_RECORD.unpack_from(
+            payload, 1 + i * TELEMETRY_RECORD.size
+        )
+        telemetry[servo_id] = {
+            "servo_id": str(servo_id),
+            "position": str(position),
+            "speed": str(speed),
+            "load": str(load),
+            "voltage": f"V{voltage}",
+            "temperature": str(temperature),
+            "move": str(move),
+            "current": str(current),
+        }
+    return telemetry
+
+
+class FrameDecoder:
+    """Class that finds frames in a stream of bytes. Bytes outside of frames (text lines, noise) and frames with a bad CRC are skipped."""
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        self.dropped_bytes = 0
+
+    def feed(self, data):
+        """Adds received bytes and returns every complete frame as (sequence, type, payload)."""
+        self.__buffer += data
+        frames = list()
+        while True:
+            start = self.__buffer.find(bytes((SYNC_1, SYNC_2)))
+            if start < 0:
+                # keep a trailing first sync byte, its partner may still come
+                keep = 1 if len(self.__buffer) > 0 and self.__buffer[-1] == SYNC_1 else 0
+                self.dropped_bytes += len(self.__buffer) - keep
+                del self.__buffer[: len(self.__buffer) - keep]
+                return frames
+            self.dropped_bytes += start
+            del self.__buffer[:start]
+            if len(self.__buffer) < 3:
+                return frames
+            length = self.__buffer[2]
+            frame_size = 2 + 2 + length + CRC.size
+            if len(self.__buffer) < frame_size:
+                return frames
+            body = bytes(self.__buffer[2 : 4 + length])
+            (crc,) = CRC.unpack_from(self.__buffer, 4 + length)
+            if length == 0 or crc != crc16(body):
+                # not a frame after all, look for the next sync
+                self.dropped_bytes += 1
+                del self.__buffer[:1]
+                continue
+            frames.append((body[1], body[2], body[3:]))
+            del self.__buffer[:frame_size]
+
+
+class BinaryTransport:
+    """Class that talks the binary framed protocol over an open serial port (anything with write, read and in_waiting). \n
+    Every request gets the next sequence number, replies are matched by it, so a late reply to an earlier request or
+    leftover text is skipped instead of being taken as the answer. Combined commands read all servos or move and report
+    in one round trip.
+    """
+
+    def __init__(self, port, timeout=1.0):
+        self.port = port
+        self.timeout = timeout
+        self.__sequence = 0
+        self.__decoder = FrameDecoder()
+        self.__received = list()
+
+    def __next_sequence(self):
+        self.__sequence = (self.__sequence + 1) & 0xFF
+        return self.__sequence
+
+    def send(self, frame_type, payload=b""):
+        """Sends a request without waiting for a reply. Returns its sequence number."""
+        sequence = self.__next_sequence()
+        self.port.write(encode_frame(sequence, frame_type, payload))
+        return sequence
+
+    def __read_frames(self):
+        data = self.port.read(max(1, self.port.in_waiting))
+        if len(data) > 0:
+            self.__received.extend(self.__decoder.feed(data))
+
+    def receive(self, sequence, timeout=None):
+        """Waits for the reply to the request with the sequence number and returns (type, payload)."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            for i, (frame_sequence, frame_type, payload) in enumerate(self.__received):
+                if frame_sequence == sequence:
+                    del self.__received[: i + 1]
+                    if frame_type == ERROR:
+                        code = ERROR_CODES.get(payload[1], payload[1])
+                        raise ProtocolError(f"ESP32 rejected request type {payload[0]:#04x}: {code}.")
+                    return frame_type, payload
+            if time.monotonic() >= deadline:
+                raise ProtocolError(f"No reply to request {sequence} in time.")
+            self.__read_frames()
+
+    def request(self, frame_type, payload, reply_type, timeout=None):
+        """Sends a request and returns the payload of its reply, which has to be of reply_type."""
+        received_type, received_payload = self.receive(self.send(frame_type, payload), timeout)
+        if received_type != reply_type:
+            raise ProtocolError(f"Expected reply type {reply_type:#04x}, got {received_type:#04x}.")
+        return received_payload
+
+    def move(self, servo_id, position, speed, acc):
+        self.send(MOVE, MOVE_RECORD.pack(servo_id, position, speed, acc))
+
+    def sync_move(self, moves):
+        """Moves several servos at once, moves is a list of (id, position, speed, acc)."""
+        self.send(SYNC_MOVE, encode_moves(moves))
+
+    def calibrate(self, servo_id):
+        self.send(CALIBRATE, bytes((servo_id,)))
+
+    def get_positions(self, servo_ids):
+        """Returns {id: position} of the servos, read in one round trip."""
+        return decode_positions(self.request(GET_POS, encode_ids(servo_ids), POSITIONS))
+
+    def get_telemetry(self, servo_ids):
+        """Returns {id: telemetry} of the servos, read in one round trip."""
+        return decode_telemetry(self.request(GET_TELEMETRY, encode_ids(servo_ids), TELEMETRY))
+
+    def move_and_report(self, moves, tolerance=10, move_timeout=5.0):
+        """Moves the servos, lets the ESP32 wait until all of them are within tolerance of their position and stopped,
+        and returns (arrived, {id: telemetry}) of them. arrived is False if move_timeout (seconds) ran out first."""
+        timeout_ms = int(min(move_timeout * 1000, 0xFFFF))
+        payload = struct.pack("<BH", tolerance, timeout_ms) + encode_moves(moves)
+        reply = self.request(MOVE_AND_REPORT, payload, MOVE_REPORT, timeout=move_timeout + self.timeout)
+        return bool(reply[0]), decode_telemetry(reply[1:])
@@ -0,0 +1,46 @@
+import threading
+
+import numpy as np
+
+# pyhackrf2 scales the int8 values as value / 127.5 - 1, this is kept so levels stay comparable with older measurements
+HACKRF_SCALE = 1 / 127.5
+
+
+def int8_to_complex(raw, out=None):
+    """Converts interleaved int8 I/Q (an int8 array or any bytes like object) to complex samples with the HackRF scaling. \n
+    The result is written into out (complex64 or complex128 with room for len(raw) // 2 samples) and returned as a view of it,
+    a new complex64 array is created if out is None. Bytes are viewed with np.frombuffer, never copied.
+    """
+    if not isinstance(raw, np.ndarray):
+        raw = np.frombuffer(raw, dtype=np.int8)
+    count = len(raw) // 2
+    if out is None:
+        out = np.empty(count, dtype=np.complex64)
+    out = out[:count]
+    floats = out.view(out.real.dtype)
+    np.multiply(raw[: 2 * count], floats.dtype.type(HACKRF_SCALE), out=floats, dtype=floats.dtype)
+    floats -= 1
+    return out
+
+
+class SampleBufferPool:
+    """Class that hands out preallocated sample buffers in rotation, so captures don't allocate new arrays every scan. \n
+    A buffer is handed out again after buffer_count further takes, so a capture stays valid while it waits in a scan pipeline
+    (max_pending captures queued, one being processed and one being captured). Buffers grow when more samples are asked for.
+    """
+
+    def __init__(self, buffer_count=4, dtype=np.complex64):
+        self.dtype = dtype
+        self.__buffers = [np.empty(0, dtype=dtype) for _ in range(buffer_count)]
+        self.__next = 0
+        self.__lock = threading.Lock()
+
+    def take(self, num_samples):
+        """Returns the next buffer as an array of num_samples samples, its old content is overwritten."""
+        num_samples = int(num_samples)
+        with self.__lock:
+            index = self.__next
+            self.__next = (self.__next + 1) % len(self.__buffers)
+            if len(self.__buffers[index]) < num_samples or self.__buffers[index].dtype != self.dtype:
+                self.__buffers[index] = np.empty(num_samples, dtype=self.dtype)
+            return self.__buffers[index][:num_samples]
@@ -0,0 +1,108 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class PositionTrack:
+    """Class that keeps the most recent timestamped servo positions, so the position at any moment in between can be interpolated. \n
+    Timestamps are time.monotonic() values and have to be added in order.
+    """
+
+    def __init__(self, max_samples=4096):
+        self.__times = deque(maxlen=max_samples)
+        self.__positions = deque(maxlen=max_samples)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__times)
+
+    def add(self, timestamp, position):
+        with self.__lock:
+            self.__times.append(float(timestamp))
+            self.__positions.append(float(position))
+
+    def clear(self):
+        with self.__lock:
+            self.__times.clear()
+            self.__positions.clear()
+
+    @property
+    def newest_time(self):
+        """Time of the newest position, or None if there is none."""
+        with self.__lock:
+            return self.__times[-1] if len(self.__times) > 0 else None
+
+    def position_at(self, timestamps):
+        """Returns the positions at the given timestamps, linearly interpolated between the two positions around each of them. \n
+        Timestamps outside of the known positions get NaN, they can't be placed.
+        """
+        with self.__lock:
+            times = np.array(self.__times)
+            positions = np.array(self.__positions)
+        if len(times) < 2:
+            return np.full(np.shape(timestamps), np.nan)
+        return np.interp(timestamps, times, positions, left=np.nan, right=np.nan)
+
+
+class AngleBinnedSpectrum:
+    """Class that accumulates PSDs taken while the antenna rotates into bins of servo position. \n
+    The circle of positions_per_turn servo steps is split into bin_count bins, every PSD is added to the bin the antenna was
+    pointing into in the middle of its samples. Each bin keeps the sum of its PSDs (linear power), how many there were and
+    the sum of their capture times.
+    """
+
+    def __init__(self, bin_count=360, positions_per_turn=4096):
+        self.bin_count = int(bin_count)
+        self.positions_per_turn = positions_per_turn
+        self.freqs = None
+        self.sums = None
+        self.counts = np.zeros(self.bin_count, dtype=np.int64)
+        self.time_sums = np.zeros(self.bin_count, dtype=np.float64)
+
+    @property
+    def bin_width(self):
+        """Width of a bin in servo steps."""
+        return self.positions_per_turn / self.bin_count
+
+    def bin_of(self, position):
+        """Returns the bin of the servo position."""
+        return int(position // self.bin_width) % self.bin_count
+
+    def bin_center(self, index):
+        """Returns the servo position at the middle of the bin."""
+        return int((index + 0.5) * self.bin_width)
+
+    def add(self, position, pxx, freqs, captured_at):
+        """Adds one PSD taken at the servo position, captured at captured_at (time.monotonic()). Returns the bin it went into."""
+        if self.freqs is None or len(freqs) != len(self.freqs):
+            self.freqs = np.array(freqs, dtype=np.float64)
+            self.sums = np.zeros((self.bin_count, len(freqs)), dtype=np.float64)
+            self.counts[:] = 0
+            self.time_sums[:] = 0
+        index = self.bin_of(position)
+        self.sums[index] += pxx
+        self.counts[index] += 1
+        self.time_sums[index] += captured_at
+        return index
+
+    def filled_bins(self):
+        """Returns the indices of the bins that hold at least one PSD."""
+        return np.flatnonzero(self.counts)
+
+    def average(self, index):
+        """Returns the average PSD of the bin, or None if it holds none."""
+        if self.counts[index] == 0:
+            return None
+        return self.sums[index] / self.counts[index]
+
+    def captured_at(self, index):
+        """Returns the average capture time of the PSDs of the bin, or None if it holds none."""
+        if self.counts[index] == 0:
+            return None
+        return float(self.time_sums[index] / self.counts[index])
+
+    def averages(self):
+        """Returns the average PSD of every bin as one array of bins x frequencies, empty bins are NaN."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sums / self.counts[:, np.newaxis]
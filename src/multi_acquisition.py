@@ -0,0 +1,262 @@
+import csv
+import heapq
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+from pyhackrf2 import HackRF
+
+from src import signal_processor
+from src import signal_batch
+
+
+class DeviceWorkerError(Exception):
+    """Raised if the worker process of a device failed."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class AcquisitionDevice:
+    """Class that describes one HackRF of a multi-device acquisition: its serial number and the radio settings it scans with. \n
+    Devices can cover different bands (center_freq) or antennas at the same time.
+    """
+
+    def __init__(
+        self,
+        serial,
+        center_freq=5785e6,
+        sample_rate=20e6,
+        sample_count=1e6,
+        amplifier=False,
+        antenna=None,
+        name=None,
+    ):
+        self.serial = serial
+        self.center_freq = center_freq
+        self.sample_rate = sample_rate
+        self.sample_count = sample_count
+        self.amplifier = amplifier
+        self.antenna = antenna
+        self.name = name if name is not None else serial
+
+
+class DeviceDetections:
+    """Class that holds the detections of one scan of one device, tagged with the device and the time the capture started."""
+
+    def __init__(self, device, captured_at, signals, raw_data=None):
+        self.device = device
+        self.captured_at = captured_at
+        self.signals = signals
+        self.raw_data = raw_data
+
+
+def load_devices(path="info_files/hackrf_serials.csv", **settings):
+    """Returns an AcquisitionDevice for every HackRF listed in the serials file. \n
+    The file has one device per line as key,value pairs (index,0,serial,...,antenna,helical,...).
+    Keyword arguments are passed on to every AcquisitionDevice.
+    """
+    devices = list()
+    with open(path, newline="") as file:
+        for row in csv.reader(file):
+            if len(row) < 2:
+                continue
+            fields = dict(zip(row[::2], row[1::2]))
+            devices.append(AcquisitionDevice(fields["serial"], antenna=fields.get("antenna"), **settings))
+    return devices
+
+
+def hackrf_index(serial):
+    """Returns the device index of the connected HackRF with the given serial number (the end of the full serial is enough)."""
+    serial = serial.lower()
+    for index, connected_serial in enumerate(HackRF.enumerate()):
+        if connected_serial.lower().endswith(serial):
+            return index
+    raise ValueError(f"No HackRF with serial {serial} connected.")
+
+
+def open_hackrf_processor(device: AcquisitionDevice) -> signal_processor.SignalProcessor:
+    """Opens the HackRF of the device and returns a SignalProcessor set up with the device settings."""
+    sp = signal_processor.SignalProcessor(
+        id=hackrf_index(device.serial),
+        sample_rate=device.sample_rate,
+        sample_count=device.sample_count,
+        center_freq=device.center_freq,
+    )
+    sp.set_amplifier(device.amplifier)
+    return sp
+
+
+def _acquisition_worker(device, processor_factory, output_queue, stop_event, send_raw):
+    """Runs in the worker process of one device, scans until stop_event is set and sends every scan's detections to output_queue."""
+    sp = None
+    try:
+        sp = processor_factory(device)
+        # Detections cross the process boundary as one structured array per scan
+        sp.batch_output = True
+        while not stop_event.is_set():
+            captured_at = time.time()
+            signals, raw_data = sp.get_signals()
+            output_queue.put((device.name, captured_at, signals.data, raw_data if send_raw else None))
+    except Exception:
+        output_queue.put((device.name, None, traceback.format_exc(), None))
+    finally:
+        if sp is not None:
+            sp.close()
+
+
+class MultiDeviceAcquisition:
+    """Class that scans with several HackRFs at once, each with its own SignalProcessor in its own worker process. \n
+    Detections of all devices are merged into one stream ordered by capture time. Every device delivers its scans in order,
+    so method get returns a scan once every device has delivered one captured at the same time or later. A device that
+    delivers nothing for max_delay seconds no longer holds the others back. \n
+    processor_factory is called in the worker process with the AcquisitionDevice and returns the SignalProcessor to use,
+    it has to be a module level function so it can be sent to the worker. A factory that returns processors on fake devices
+    allows running without radios. With use_processes False the workers are threads, which is only useful for debugging.
+    """
+
+    def __init__(
+        self,
+        devices,
+        processor_factory=open_hackrf_processor,
+        max_delay=2.0,
+        send_raw=False,
+        use_processes=True,
+    ):
+        self.devices = {device.name: device for device in devices}
+        self.processor_factory = processor_factory
+        self.max_delay = max_delay
+        self.send_raw = send_raw
+        self.use_processes = use_processes
+        self.running = False
+
+        self.__workers = list()
+        self.__output_queue = None
+        self.__stop_event = None
+        # Detections waiting for the other devices to catch up, as (captured_at, arrival number, DeviceDetections)
+        self.__pending = list()
+        self.__arrivals = 0
+        # Capture time of the newest scan received from each device
+        self.__latest = dict()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        """Starts one worker per device."""
+        if self.running:
+            return
+        if self.use_processes:
+            self.__output_queue = multiprocessing.Queue()
+            self.__stop_event = multiprocessing.Event()
+            worker_class = multiprocessing.Process
+        else:
+            self.__output_queue = queue.Queue()
+            self.__stop_event = threading.Event()
+            worker_class = threading.Thread
+
+        for device in self.devices.values():
+            worker = worker_class(
+                target=_acquisition_worker,
+                args=(device, self.processor_factory, self.__output_queue, self.__stop_event, self.send_raw),
+                daemon=True,
+            )
+            worker.start()
+            self.__workers.append(worker)
+        self.running = True
+
+    def stop(self, timeout=5.0):
+        """Stops all workers. Detections that were already received can still be read with get. \n
+        Raises DeviceWorkerError after all workers are stopped if any of them reported a failure on the way.
+        """
+        if not self.running:
+            return
+        self.__stop_event.set()
+        failures = list()
+        try:
+            deadline = time.monotonic() + timeout
+            while any(worker.is_alive() for worker in self.__workers) and time.monotonic() < deadline:
+                # Keep emptying the queue, a process does not exit while its queue data is not consumed
+                self.__receive_collecting(failures, timeout=0.05)
+        finally:
+            for worker in self.__workers:
+                if self.use_processes and worker.is_alive():
+                    worker.terminate()
+                worker.join(timeout=1.0)
+            self.__receive_collecting(failures)
+            self.__workers = list()
+            self.__latest = dict()
+            self.running = False
+        if len(failures) > 0:
+            raise DeviceWorkerError("\n".join(failure.message for failure in failures))
+
+    def __receive_collecting(self, failures, timeout=None):
+        """Like __receive, but keeps receiving past failed workers and adds their DeviceWorkerError to failures."""
+        while True:
+            try:
+                self.__receive(timeout=timeout)
+                return
+            except DeviceWorkerError as e:
+                failures.append(e)
+                # the rest is already queued, don't wait for it again
+                timeout = None
+
+    def __receive(self, timeout=None):
+        """Moves everything the workers sent into the reorder heap, waiting up to timeout for the first item."""
+        try:
+            item = self.__output_queue.get(timeout=timeout) if timeout else self.__output_queue.get_nowait()
+            while True:
+                name, captured_at, data, raw_data = item
+                if captured_at is None:
+                    raise DeviceWorkerError(f"Worker of device {name} failed:\n{data}")
+                detections = DeviceDetections(self.devices[name], captured_at, signal_batch.SignalBatch(data), raw_data)
+                heapq.heappush(self.__pending, (captured_at, self.__arrivals, detections))
+                self.__latest[name] = captured_at
+                self.__arrivals += 1
+                item = self.__output_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __ready(self, captured_at):
+        """Returns True if no scan captured before captured_at can arrive any more."""
+        # After stopping nothing older can arrive any more
+        if not self.running or time.time() - captured_at >= self.max_delay:
+            return True
+        return all(self.__latest.get(name, -1) >= captured_at for name in self.devices)
+
+    def get(self, timeout=None) -> DeviceDetections:
+        """Returns the next detections in capture time order. \n
+        Blocks until some are available, raises queue.Empty if timeout (in seconds) runs out first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.__receive()
+            if len(self.__pending) > 0 and self.__ready(self.__pending[0][0]):
+                return heapq.heappop(self.__pending)[2]
+            if len(self.__pending) == 0 and not self.running:
+                raise queue.Empty
+
+            wait = 0.1
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+                wait = min(wait, remaining)
+            self.__receive(timeout=wait)
+
+    def __iter__(self):
+        """Yields detections in capture time order until stopped and everything received was returned."""
+        while True:
+            try:
+                yield self.get(timeout=None if self.running else 0)
+            except queue.Empty:
+                if not self.running:
+                    return
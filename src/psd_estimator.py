@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class WelchPSD:
+    """Class that estimates the power spectral density of complex IQ samples with Welch's method using numpy.fft. \n
+    NFFT, Fs and Fc have the same meaning and the output has the same scaling as matplotlib's psd with its default
+    Hanning window, no detrending and two-sided spectrum. \n
+    The window, normalisation and frequency vector are cached per (fft_count, sample_rate, center_freq).
+    """
+
+    def __init__(self, noverlap=0, dtype=np.float64, segments_per_chunk=64, max_cached_plans=64):
+        self.noverlap = noverlap
+        self.dtype = dtype
+        # Segments are transformed in chunks so that memory use does not grow with the sample count
+        self.segments_per_chunk = segments_per_chunk
+        self.max_cached_plans = max_cached_plans
+        self.__plans = dict()
+
+    def __plan(self, NFFT, Fs, Fc):
+        """Returns the cached window, window normalisation and frequency vector for the given parameters."""
+        key = (NFFT, Fs, Fc, np.dtype(self.dtype))
+        plan = self.__plans.get(key)
+        if plan is not None:
+            return plan
+
+        if len(self.__plans) >= self.max_cached_plans:
+            self.__plans.clear()
+
+        window = np.hanning(NFFT).astype(self.dtype)
+        # Scale by the sampling frequency and the norm of the window, same as matplotlib with scale_by_freq=True
+        norm = 1.0 / (Fs * float(np.sum(window.astype(np.float64) ** 2)))
+        # The frequency vector stays in double precision, float32 can't resolve bins around 5800 MHz well
+        freqs = np.fft.fftshift(np.fft.fftfreq(NFFT, 1 / Fs)) + Fc
+        freqs.flags.writeable = False
+
+        plan = (window, norm, freqs)
+        self.__plans[key] = plan
+        return plan
+
+    def estimate(self, samples, NFFT=2048, Fs=2, Fc=0):
+        """Returns the power spectral density of the samples and the matching frequency vector. \n
+        The returned frequency vector is shared between calls and is read only.
+        """
+        window, norm, freqs = self.__plan(NFFT, Fs, Fc)
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+
+        samples = np.asarray(samples)
+        if len(samples) < NFFT:
+            padded = np.zeros(NFFT, dtype=complex_dtype)
+            padded[: len(samples)] = samples
+            samples = padded
+
+        step = NFFT - self.noverlap
+        segments = np.lib.stride_tricks.sliding_window_view(samples, NFFT)[::step]
+        segment_count = len(segments)
+
+        power_sum = np.zeros(NFFT, dtype=np.float64)
+        for i in range(0, segment_count, self.segments_per_chunk):
+            chunk = segments[i : i + self.segments_per_chunk].astype(complex_dtype)
+            chunk *= window
+            spectrum = np.fft.fft(chunk, axis=1)
+            power_sum += np.sum(spectrum.real**2 + spectrum.imag**2, axis=0, dtype=np.float64)
+
+        pxx = np.fft.fftshift(power_sum) * (norm / segment_count)
+        return pxx.astype(self.dtype, copy=False), freqs
+
+
+def psd(samples, NFFT=2048, Fs=2, Fc=0, noverlap=0, dtype=np.float64):
+    """Returns the power spectral density and frequency vector of the samples, like matplotlib's psd without plotting."""
+    return WelchPSD(noverlap=noverlap, dtype=dtype).estimate(samples, NFFT=NFFT, Fs=Fs, Fc=Fc)
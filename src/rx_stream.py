@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from src import iq_ingest
+
+
+class StreamTimeout(Exception):
+    """Raised if the stream did not deliver the requested samples in time."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class HackRFStream:
+    """Class that keeps a HackRF receiving into a preallocated ring buffer. \n
+    Works with any device object that has start_rx(pipe_function), stop_rx(), sample_count_limit and sample_rate,
+    so it can be driven by a fake device that pushes synthetic int8 IQ blocks. \n
+    Method read_samples returns the most recent samples that were taken after a given timestamp.
+    """
+
+    def __init__(self, hackrf, capacity=4e6, max_block_records=4096):
+        self.hackrf = hackrf
+        self.capacity = int(capacity)  # in complex samples
+        self.running = False
+
+        # Interleaved int8 I/Q bytes, exactly as delivered by the HackRF
+        self.__buffer = np.zeros(2 * self.capacity, dtype=np.int8)
+        # Total amount of bytes written since start, the write position in the ring is this modulo the buffer size
+        self.__bytes_written = 0
+        # (bytes written after the block, time the block was received, block length in bytes) for recent blocks
+        self.__blocks = deque(maxlen=max_block_records)
+        self.__condition = threading.Condition()
+
+    def start(self):
+        """Starts continuous receiving into the ring buffer."""
+        if self.running:
+            return
+        with self.__condition:
+            self.__bytes_written = 0
+            self.__blocks.clear()
+        self.running = True
+        # 0 means receive until stop_rx is called
+        self.hackrf.sample_count_limit = 0
+        self.hackrf.start_rx(pipe_function=self.__on_samples)
+
+    def stop(self):
+        """Stops receiving."""
+        if not self.running:
+            return
+        self.running = False
+        self.hackrf.stop_rx()
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def __on_samples(self, data) -> bool:
+        """Receive callback, copies the block into the ring buffer. Returns True when receiving should stop."""
+        received_at = time.monotonic()
+        block = np.frombuffer(data, dtype=np.int8)
+        size = len(self.__buffer)
+        if len(block) > size:
+            block = block[-size:]
+
+        with self.__condition:
+            start = self.__bytes_written % size
+            first_part = min(len(block), size - start)
+            self.__buffer[start : start + first_part] = block[:first_part]
+            self.__buffer[: len(block) - first_part] = block[first_part:]
+            self.__bytes_written += len(block)
+            self.__blocks.append((self.__bytes_written, received_at, len(block)))
+            self.__condition.notify_all()
+
+        return not self.running
+
+    def __first_byte_after(self, timestamp):
+        """Returns the byte count where the first block that started after the timestamp begins, or None if no such block yet."""
+        sample_rate = self.hackrf.sample_rate
+        for bytes_written, received_at, length in self.__blocks:
+            block_start_time = received_at - (length / 2) / sample_rate
+            if block_start_time >= timestamp:
+                return bytes_written - length
+        return None
+
+    def read_samples(self, num_samples, after=None, timeout=2.0, out=None):
+        """Returns the most recent num_samples samples as a complex array, all of them taken after the given time.monotonic() timestamp. \n
+        Blocks until enough samples have been received. The samples are scaled the same way as HackRF.read_samples. \n
+        If out is given the samples are converted straight from the ring buffer into it (see iq_ingest.int8_to_complex).
+        """
+        return self.__read(num_samples, after, timeout, out)[0]
+
+    def read_timed_samples(self, num_samples, after=None, timeout=2.0, out=None):
+        """Like read_samples, but also returns the time.monotonic() timestamp of the middle of the returned samples. \n
+        The timestamp is taken from the time the newest block arrived, going back half the duration of the samples.
+        """
+        samples, received_at = self.__read(num_samples, after, timeout, out)
+        return samples, received_at - (len(samples) / 2) / self.hackrf.sample_rate
+
+    def __read(self, num_samples, after, timeout, out):
+        """Returns the samples for read_samples and the time the newest of them arrived."""
+        num_bytes = 2 * int(num_samples)
+        if num_bytes > len(self.__buffer):
+            raise ValueError(f"Requested {int(num_samples)} samples but the ring buffer only holds {self.capacity}.")
+        if after is None:
+            after = time.monotonic()
+
+        deadline = time.monotonic() + timeout
+        with self.__condition:
+            while True:
+                first_byte = self.__first_byte_after(after)
+                if first_byte is not None and self.__bytes_written - first_byte >= num_bytes:
+                    break
+                remaining = deadline - time.monotonic()
+                if not self.running or remaining <= 0:
+                    raise StreamTimeout(f"Stream did not deliver {int(num_samples)} samples in time.")
+                self.__condition.wait(remaining)
+
+            # Time the newest of the returned samples arrived
+            received_at = self.__blocks[-1][1]
+            size = len(self.__buffer)
+            end = self.__bytes_written % size
+            start = (end - num_bytes) % size
+            if out is not None:
+                first_part = size - start if start >= end else num_bytes
+                iq_ingest.int8_to_complex(self.__buffer[start : start + first_part], out[: first_part // 2])
+                iq_ingest.int8_to_complex(self.__buffer[: num_bytes - first_part], out[first_part // 2 : num_bytes // 2])
+                return out[: num_bytes // 2], received_at
+            if start < end:
+                values = self.__buffer[start:end].copy()
+            else:
+                values = np.concatenate((self.__buffer[start:], self.__buffer[:end]))
+
+        iq = values.astype(np.float64).view(np.complex128)
+        iq /= 127.5
+        iq -= 1 + 1j
+        return iq, received_at
+
+
+class HackRFReader:
+    """Class that captures a fixed number of samples from a HackRF like HackRF.read_samples, but without its conversions. \n
+    Every received block is viewed with np.frombuffer and copied once into a preallocated int8 buffer, which is converted
+    straight into the requested output (see iq_ingest.int8_to_complex). Waiting for the capture does not busy loop.
+    """
+
+    def __init__(self, hackrf):
+        self.hackrf = hackrf
+        self.__raw = np.empty(0, dtype=np.int8)
+        self.__filled = 0
+        self.__done = threading.Event()
+
+    def __on_samples(self, data) -> bool:
+        """Receive callback, returns True when enough samples have been received."""
+        block = np.frombuffer(data, dtype=np.int8)
+        count = min(len(block), len(self.__raw) - self.__filled)
+        self.__raw[self.__filled : self.__filled + count] = block[:count]
+        self.__filled += count
+        if self.__filled >= len(self.__raw):
+            self.__done.set()
+            return True
+        return False
+
+    def read_raw(self, num_samples, timeout=2.0):
+        """Captures num_samples samples and returns them as interleaved int8 I/Q. \n
+        The returned array is reused by the next capture.
+        """
+        num_bytes = 2 * int(num_samples)
+        if len(self.__raw) != num_bytes:
+            self.__raw = np.empty(num_bytes, dtype=np.int8)
+        self.__filled = 0
+        self.__done.clear()
+
+        self.hackrf.sample_count_limit = num_bytes
+        self.hackrf.start_rx(pipe_function=self.__on_samples)
+        try:
+            # the time the samples take to arrive, plus the timeout for starting up
+            if not self.__done.wait(num_samples / self.hackrf.sample_rate + timeout):
+                raise StreamTimeout(f"HackRF did not deliver {int(num_samples)} samples in time.")
+        finally:
+            self.hackrf.stop_rx()
+        return self.__raw
+
+    def read_samples(self, num_samples, out=None, timeout=2.0):
+        """Captures num_samples samples and returns them converted into out (see iq_ingest.int8_to_complex)."""
+        return iq_ingest.int8_to_complex(self.read_raw(num_samples, timeout), out)
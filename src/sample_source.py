@@ -0,0 +1,165 @@
+import abc
+import json
+
+import numpy as np
+
+from src import iq_ingest
+
+# Raw IQ formats: interleaved int8 I/Q as delivered by the HackRF, and interleaved float32 I/Q
+IQ_FORMATS = {"cs8": np.int8, "cf32": np.float32}
+
+
+class SourceExhausted(Exception):
+    """Raised if a sample source has no more samples to read."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class SampleSource(abc.ABC):
+    """Interface of everything SignalProcessor can read samples from. \n
+    A source has sample_rate and center_freq in Hz and a method read_samples(num_samples, out=None) that returns complex samples
+    scaled like HackRF.read_samples, written into the complex array out if given. \n
+    pyhackrf2's HackRF (read through rx_stream.HackRFReader) and objects with the same read_samples(num_samples) can be used too,
+    recordings are read with IQFileSource.
+    """
+
+    sample_rate = None
+    center_freq = None
+
+    @abc.abstractmethod
+    def read_samples(self, num_samples, out=None):
+        """Returns the next num_samples complex samples, written into out if given."""
+
+    def close(self):
+        pass
+
+
+class IQFileSource(SampleSource):
+    """Class that reads a raw IQ recording through a memory map, so hours of data can be processed without loading them. \n
+    The recording is a raw cs8 or cf32 file with a small JSON sidecar (path + ".json") holding format, sample_rate and center_freq. \n
+    read_samples returns consecutive windows of the file: a cf32 window is a view of the file without any copy, a cs8 window is
+    converted once to complex64 with the HackRF scaling (read_raw returns the int8 view itself). If loop is True reading wraps around at the end
+    of the file, otherwise SourceExhausted is raised.
+    """
+
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        with open(path + ".json") as file:
+            metadata = json.load(file)
+        self.format = metadata["format"]
+        if self.format not in IQ_FORMATS:
+            raise ValueError(f"Unsupported IQ format {self.format}, use one of {list(IQ_FORMATS)}.")
+        self.__sample_rate = float(metadata["sample_rate"])
+        self.__center_freq = float(metadata["center_freq"])
+        self.metadata = metadata
+
+        self.__raw = np.memmap(path, dtype=IQ_FORMATS[self.format], mode="r")
+        self.sample_count = len(self.__raw) // 2
+        # Read position in samples
+        self.position = 0
+
+        # HackRF settings that have no meaning for a recording, kept so the GUI and tests can set them
+        self.amplifier_on = bool(metadata.get("amplifier_on", False))
+        self.lna_gain = metadata.get("lna_gain")
+        self.vga_gain = metadata.get("vga_gain")
+
+    @property
+    def sample_rate(self):
+        return self.__sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, value):
+        if value != self.__sample_rate:
+            raise ValueError(f"Recording {self.path} was made at {self.__sample_rate} S/s and can't be read at {value} S/s.")
+
+    @property
+    def center_freq(self):
+        return self.__center_freq
+
+    @center_freq.setter
+    def center_freq(self, value):
+        if value != self.__center_freq:
+            raise ValueError(f"Recording {self.path} was made at {self.__center_freq} Hz and can't be retuned to {value} Hz.")
+
+    @property
+    def remaining(self):
+        """Number of samples left before the end of the recording."""
+        return self.sample_count - self.position
+
+    def seek(self, position):
+        """Moves the read position to the given sample."""
+        if not 0 <= position <= self.sample_count:
+            raise ValueError(f"Position {position} is outside the recording of {self.sample_count} samples.")
+        self.position = int(position)
+
+    def read_raw(self, num_samples):
+        """Returns the next num_samples samples as a view of the file, interleaved I/Q in the file's format."""
+        num_samples = int(num_samples)
+        if num_samples > self.sample_count:
+            raise ValueError(f"Requested {num_samples} samples but the recording only holds {self.sample_count}.")
+        if self.remaining < num_samples:
+            if not self.loop:
+                raise SourceExhausted(f"Recording {self.path} has {self.remaining} samples left, {num_samples} requested.")
+            self.position = 0
+        start = self.position
+        self.position += num_samples
+        return self.__raw[2 * start : 2 * self.position]
+
+    def read_samples(self, num_samples, out=None):
+        """Returns the next num_samples samples as complex values scaled like HackRF.read_samples. \n
+        cf32 samples are returned as a view of the file unless out is given, cs8 samples are converted into out.
+        """
+        raw = self.read_raw(num_samples)
+        if self.format == "cf32":
+            if out is None:
+                return raw.view(np.complex64)
+            out = out[: int(num_samples)]
+            out[:] = raw.view(np.complex64)
+            return out
+        return iq_ingest.int8_to_complex(raw, out)
+
+    def close(self):
+        """Releases the memory map, windows that were returned keep it alive until they are gone."""
+        self.__raw = None
+
+
+class IQFileWriter:
+    """Class that records samples into a raw IQ file with the JSON sidecar IQFileSource reads. \n
+    Samples are given scaled like HackRF.read_samples, cs8 stores them back as the int8 values the HackRF delivered.
+    """
+
+    def __init__(self, path, sample_rate, center_freq, format="cs8", **metadata):
+        if format not in IQ_FORMATS:
+            raise ValueError(f"Unsupported IQ format {format}, use one of {list(IQ_FORMATS)}.")
+        self.path = path
+        self.format = format
+        metadata.update(format=format, sample_rate=float(sample_rate), center_freq=float(center_freq))
+        with open(path + ".json", "w") as file:
+            json.dump(metadata, file, indent=4)
+        self.__file = open(path, "wb")
+        self.sample_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def write(self, samples):
+        """Appends the samples to the recording."""
+        samples = np.asarray(samples)
+        interleaved = np.empty(2 * len(samples), dtype=np.float64)
+        interleaved[0::2] = samples.real
+        interleaved[1::2] = samples.imag
+        if self.format == "cs8":
+            interleaved = np.clip(np.rint((interleaved + 1) * 127.5), -128, 127)
+        self.__file.write(interleaved.astype(IQ_FORMATS[self.format]).tobytes())
+        self.sample_count += len(samples)
+
+    def close(self):
+        if not self.__file.closed:
+            self.__file.close()
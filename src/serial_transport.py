@@ -0,0 +1,286 @@
+import asyncio
+import collections
+import threading
+
+from src import esp32_protocol
+
+# Text requests with a reply and the first field of that reply, the servo id is the second field of both
+TEXT_REPLIES = {"GET_POS": "POSITION", "GET_TELEMETRY": "TELEMETRY"}
+
+
+def parse_telemetry_fields(fields):
+    """Returns the telemetry dictionary of the fields of a TELEMETRY line, like ESP32Controller.get_telemetry."""
+    return {
+        "servo_id": fields[1],
+        "position": fields[2],
+        "speed": fields[3],
+        "load": fields[4],
+        "voltage": fields[5],
+        "temperature": fields[6],
+        "move": fields[7],
+        "current": fields[8],
+    }
+
+
+class AsyncSerialTransport:
+    """Class that talks to the ESP32 over an open serial port with asyncio, in the text or the binary protocol. \n
+    A single reader task owns all reads: it splits the received bytes into lines (text) or frames (binary) and resolves
+    the future of the request each one answers. Text replies are matched by their type and servo id, in request order for
+    the same servo, frames by their sequence number. Lines and frames that answer no pending request (start up messages,
+    replies to requests that timed out) are kept in unsolicited instead of being taken as the next answer. \n
+    Requests don't wait for each other, several can be in flight at once: reading both servos costs one round trip, and
+    telemetry polling overlaps with motion commands on the same port.
+    """
+
+    def __init__(self, port, protocol="text", timeout=1.0, poll_interval=0.001):
+        self.port = port
+        self.protocol = protocol
+        self.timeout = timeout
+        # Pause between reads when the port returned nothing, a real port blocks in read until its own timeout instead
+        self.poll_interval = poll_interval
+        self.unsolicited = collections.deque(maxlen=64)
+
+        # (reply type, servo id) or ("FRAME", sequence) -> futures waiting for that reply, oldest first
+        self.__pending = collections.defaultdict(collections.deque)
+        self.__buffer = bytearray()
+        self.__decoder = esp32_protocol.FrameDecoder()
+        self.__sequence = 0
+        self.__reader = None
+
+    async def start(self):
+        """Starts the reader task on the running event loop."""
+        if self.__reader is None:
+            self.__reader = asyncio.get_running_loop().create_task(self.__read_loop())
+
+    async def close(self):
+        """Stops the reader task and fails the requests still waiting."""
+        if self.__reader is not None:
+            self.__reader.cancel()
+            try:
+                await self.__reader
+            except asyncio.CancelledError:
+                pass
+            self.__reader = None
+        for futures in self.__pending.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(esp32_protocol.ProtocolError("Transport closed."))
+        self.__pending.clear()
+
+    def __read_chunk(self):
+        return self.port.read(max(1, self.port.in_waiting))
+
+    async def __read_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Blocking serial reads run on an executor thread, the loop stays free for requests
+            data = await loop.run_in_executor(None, self.__read_chunk)
+            if len(data) > 0:
+                self.__dispatch(data)
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    def __dispatch(self, data):
+        """Resolves the pending requests answered by the received bytes."""
+        if self.protocol == "binary":
+            for sequence, frame_type, payload in self.__decoder.feed(data):
+                if not self.__resolve(("FRAME", sequence), (frame_type, payload)):
+                    self.unsolicited.append((sequence, frame_type, payload))
+            return
+
+        self.__buffer += data
+        *lines, rest = self.__buffer.split(b"\n")
+        self.__buffer = bytearray(rest)
+        for line in lines:
+            text = line.decode(errors="replace").strip()
+            fields = [field.strip() for field in text.split(",")]
+            try:
+                key = (fields[0], int(fields[1]))
+            except (IndexError, ValueError):
+                key = None
+            if key is None or not self.__resolve(key, fields):
+                if fields[0] == "INVALID":
+                    # The ESP32 could not parse a command, a move of it will never report MOVE_DONE
+                    print(f"[WARNING] ESP32 rejected {text}")
+                if len(text) > 0:
+                    self.unsolicited.append(text)
+
+    def __resolve(self, key, result):
+        """Hands the result to the oldest request waiting for key. Returns False if there is none."""
+        futures = self.__pending.get(key)
+        while futures:
+            future = futures.popleft()
+            if not future.done():
+                future.set_result(result)
+                return True
+        self.__pending.pop(key, None)
+        return False
+
+    def __expect(self, key):
+        """Returns a future for the next line or frame with key."""
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[key].append(future)
+        return future
+
+    async def __wait_for(self, key, write, timeout):
+        """Registers a request waiting for key, writes it and returns its result."""
+        future = self.__expect(key)
+        self.port.write(write)
+        try:
+            return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            raise esp32_protocol.ProtocolError(f"No reply to {key} in time.") from None
+        finally:
+            futures = self.__pending.get(key)
+            if futures is not None and future in futures:
+                futures.remove(future)
+
+    async def request_line(self, command, servo_id, timeout=None):
+        """Sends a text request with a reply (GET_POS, GET_TELEMETRY) and returns the fields of the reply."""
+        key = (TEXT_REPLIES[command], servo_id)
+        return await self.__wait_for(key, f"{command},{servo_id}\n".encode(), timeout)
+
+    async def request_frame(self, frame_type, payload, reply_type, timeout=None):
+        """Sends a binary request and returns the payload of its reply, which has to be of reply_type."""
+        self.__sequence = (self.__sequence + 1) & 0xFF
+        frame = esp32_protocol.encode_frame(self.__sequence, frame_type, payload)
+        received_type, received_payload = await self.__wait_for(("FRAME", self.__sequence), frame, timeout)
+        if received_type == esp32_protocol.ERROR:
+            code = esp32_protocol.ERROR_CODES.get(received_payload[1], received_payload[1])
+            raise esp32_protocol.ProtocolError(f"ESP32 rejected request type {received_payload[0]:#04x}: {code}.")
+        if received_type != reply_type:
+            raise esp32_protocol.ProtocolError(f"Expected reply type {reply_type:#04x}, got {received_type:#04x}.")
+        return received_payload
+
+    def __send_frame(self, frame_type, payload):
+        self.__sequence = (self.__sequence + 1) & 0xFF
+        self.port.write(esp32_protocol.encode_frame(self.__sequence, frame_type, payload))
+
+    async def move(self, servo_id, position, speed, acc):
+        if self.protocol == "binary":
+            self.__send_frame(esp32_protocol.MOVE, esp32_protocol.MOVE_RECORD.pack(servo_id, position, speed, acc))
+        else:
+            self.port.write(f"MOVE,{servo_id},{position},{speed},{acc}\n".encode())
+
+    async def sync_move(self, moves):
+        """Moves several servos at once, moves is a list of (id, position, speed, acc)."""
+        if self.protocol == "binary":
+            self.__send_frame(esp32_protocol.SYNC_MOVE, esp32_protocol.encode_moves(moves))
+            return
+        ids, positions, speeds, accs = (",".join(str(move[i]) for move in moves) for i in range(4))
+        self.port.write(f"SYNC_MOVE,[{ids}],{len(moves)},[{positions}],[{speeds}],[{accs}]\n".encode())
+
+    async def calibrate(self, servo_id):
+        if self.protocol == "binary":
+            self.__send_frame(esp32_protocol.CALIBRATE, bytes((servo_id,)))
+        else:
+            self.port.write(f"CALIBRATE,{servo_id}\n".encode())
+
+    async def get_positions(self, servo_ids):
+        """Returns {id: position} of the servos, the text requests are all sent before the first reply is awaited."""
+        if self.protocol == "binary":
+            payload = await self.request_frame(
+                esp32_protocol.GET_POS, esp32_protocol.encode_ids(servo_ids), esp32_protocol.POSITIONS
+            )
+            return esp32_protocol.decode_positions(payload)
+        replies = await asyncio.gather(*(self.request_line("GET_POS", servo_id) for servo_id in servo_ids))
+        return {servo_id: int(fields[2]) for servo_id, fields in zip(servo_ids, replies)}
+
+    async def get_telemetry(self, servo_ids):
+        """Returns {id: telemetry} of the servos, the text requests are all sent before the first reply is awaited."""
+        if self.protocol == "binary":
+            payload = await self.request_frame(
+                esp32_protocol.GET_TELEMETRY, esp32_protocol.encode_ids(servo_ids), esp32_protocol.TELEMETRY
+            )
+            return esp32_protocol.decode_telemetry(payload)
+        replies = await asyncio.gather(*(self.request_line("GET_TELEMETRY", servo_id) for servo_id in servo_ids))
+        return {servo_id: parse_telemetry_fields(fields) for servo_id, fields in zip(servo_ids, replies)}
+
+    async def __move_done(self, future, servo_id, position, tolerance):
+        """Waits for the MOVE_DONE of the servo within tolerance of position, earlier ones belong to an older move."""
+        while True:
+            fields = await future
+            if abs(int(fields[2]) - position) <= tolerance:
+                return
+            future = self.__expect(("MOVE_DONE", servo_id))
+
+    async def move_and_report(self, moves, tolerance=10, move_timeout=5.0):
+        """Moves the servos and returns (arrived, {id: telemetry}) once all of them are within tolerance of their position
+        and stopped. arrived is False if move_timeout (seconds) ran out first. \n
+        The binary protocol lets the ESP32 wait. With the text protocol the MOVE_DONE notifications of the servos are
+        awaited and the telemetry is read once they all came, or once move_timeout ran out."""
+        if self.protocol == "binary":
+            timeout_ms = int(min(move_timeout * 1000, 0xFFFF))
+            payload = bytes((tolerance,)) + timeout_ms.to_bytes(2, "little") + esp32_protocol.encode_moves(moves)
+            reply = await self.request_frame(
+                esp32_protocol.MOVE_AND_REPORT, payload, esp32_protocol.MOVE_REPORT, timeout=move_timeout + self.timeout
+            )
+            return bool(reply[0]), esp32_protocol.decode_telemetry(reply[1:])
+
+        # Expected before the move is sent, the notification of a short move may come right away
+        waits = [
+            self.__move_done(self.__expect(("MOVE_DONE", servo_id)), servo_id, position, tolerance)
+            for servo_id, position, _, _ in moves
+        ]
+        if len(moves) == 1:
+            await self.move(*moves[0])
+        else:
+            await self.sync_move(moves)
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), move_timeout)
+        except asyncio.TimeoutError:
+            pass
+        servo_ids = [move[0] for move in moves]
+        telemetry = await self.get_telemetry(servo_ids)
+        arrived = all(
+            abs(int(telemetry[servo_id]["position"]) - position) <= tolerance and int(telemetry[servo_id]["move"]) == 0
+            for servo_id, position, _, _ in moves
+        )
+        return arrived, telemetry
+
+
+class SerialTransport:
+    """Class that gives blocking callers the AsyncSerialTransport, with the same methods as esp32_protocol.BinaryTransport. \n
+    The event loop runs on its own thread. Every call waits for its result, so requests from several threads (a sweep
+    and the GUI polling telemetry) are pipelined on the port instead of taking turns. submit starts a coroutine of the
+    async transport without waiting for it.
+    """
+
+    def __init__(self, port, protocol="text", timeout=1.0):
+        self.timeout = timeout
+        self.transport = AsyncSerialTransport(port, protocol, timeout)
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, daemon=True)
+        self.__thread.start()
+        self.__run(self.transport.start())
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the transport's event loop and returns its concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop)
+
+    def __run(self, coroutine, timeout=None):
+        return self.submit(coroutine).result(timeout)
+
+    def close(self):
+        """Stops the reader task and the event loop."""
+        self.__run(self.transport.close())
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+
+    def move(self, servo_id, position, speed, acc):
+        self.__run(self.transport.move(servo_id, position, speed, acc))
+
+    def sync_move(self, moves):
+        self.__run(self.transport.sync_move(moves))
+
+    def calibrate(self, servo_id):
+        self.__run(self.transport.calibrate(servo_id))
+
+    def get_positions(self, servo_ids):
+        return self.__run(self.transport.get_positions(servo_ids))
+
+    def get_telemetry(self, servo_ids):
+        return self.__run(self.transport.get_telemetry(servo_ids))
+
+    def move_and_report(self, moves, tolerance=10, move_timeout=5.0):
+        return self.__run(self.transport.move_and_report(moves, tolerance, move_timeout))
@@ -0,0 +1,139 @@
+import numpy as np
+
+from src import channel_registry
+
+# Channel codes that are not a registry index
+NO_CHANNEL = -1
+UNCLEAR_CHANNEL = -2
+# Position value of a detection that has not been tied to a servo position yet
+NO_POSITION = -1
+
+signal_dtype = np.dtype(
+    [
+        ("start_freq", np.float64),
+        ("end_freq", np.float64),
+        ("peak_freq", np.float64),
+        ("peak_power_db", np.float64),
+        ("x", np.int32),
+        ("y", np.int32),
+        ("channel", np.int16),
+        ("scan_id", np.int64),
+        ("timestamp", np.float64),
+    ]
+)
+
+
+class SignalBatch:
+    """Class that holds all detections of one scan in a single NumPy structured array (see signal_dtype). \n
+    Channels are stored as channel registry indices, positions as servo coordinates. \n
+    Iterating over a batch yields SignalView objects, which read like Signal objects for the GUI and the channel list.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_detections(cls, start_freqs, end_freqs, peak_freqs, peak_powers_db, scan_id=0, timestamp=0.0):
+        """Creates a batch from arrays of detection values, without channel or position."""
+        data = np.empty(len(start_freqs), dtype=signal_dtype)
+        data["start_freq"] = start_freqs
+        data["end_freq"] = end_freqs
+        data["peak_freq"] = peak_freqs
+        data["peak_power_db"] = peak_powers_db
+        data["x"] = NO_POSITION
+        data["y"] = NO_POSITION
+        data["channel"] = NO_CHANNEL
+        data["scan_id"] = scan_id
+        data["timestamp"] = timestamp
+        return cls(data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.data)
+        if not 0 <= index < len(self.data):
+            raise IndexError("SignalBatch index out of range")
+        return SignalView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.data)):
+            yield SignalView(self, index)
+
+    def set_position(self, x, y):
+        """Ties every detection of the batch to the given servo position."""
+        self.data["x"] = int(x)
+        self.data["y"] = int(y)
+
+
+class SignalView:
+    """Lightweight read/write view of one detection in a SignalBatch."""
+
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __get(self, field):
+        return self.batch.data[field][self.index]
+
+    def __set(self, field, value):
+        self.batch.data[field][self.index] = value
+
+    start_freq = property(lambda self: self.__get("start_freq"), lambda self, value: self.__set("start_freq", value))
+    end_freq = property(lambda self: self.__get("end_freq"), lambda self, value: self.__set("end_freq", value))
+    peak_freq = property(lambda self: self.__get("peak_freq"), lambda self, value: self.__set("peak_freq", value))
+    peak_power_db = property(lambda self: self.__get("peak_power_db"), lambda self, value: self.__set("peak_power_db", value))
+    scan_id = property(lambda self: self.__get("scan_id"))
+    timestamp = property(lambda self: self.__get("timestamp"))
+
+    @property
+    def x(self):
+        x = self.__get("x")
+        return None if x == NO_POSITION else int(x)
+
+    @x.setter
+    def x(self, value):
+        self.__set("x", NO_POSITION if value is None else int(value))
+
+    @property
+    def y(self):
+        y = self.__get("y")
+        return None if y == NO_POSITION else int(y)
+
+    @y.setter
+    def y(self, value):
+        self.__set("y", NO_POSITION if value is None else int(value))
+
+    @property
+    def channel(self):
+        code = self.__get("channel")
+        if code == NO_CHANNEL:
+            return None
+        if code == UNCLEAR_CHANNEL:
+            return "Unclear"
+        return str(channel_registry.registry.names[code])
+
+    @property
+    def potential_channels(self):
+        """Channels whose range contains the peak frequency, looked up when asked for instead of being stored."""
+        if self.__get("channel") != UNCLEAR_CHANNEL:
+            return list()
+        registry = channel_registry.registry
+        candidates = registry.candidate_channels([self.peak_freq])[0]
+        return [str(name) for name in registry.names[candidates]]
+
+    @property
+    def bandwidth(self):
+        return self.end_freq - self.start_freq
+
+    @property
+    def center_freq(self):
+        return (self.end_freq + self.start_freq) / 2
+
+    def to_string(self):
+        return f"Signal: {self.start_freq} - {self.end_freq} MHz, {self.peak_power_db} dBm, {self.peak_freq} MHz, position: {self.x}, {self.y}"
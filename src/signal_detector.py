@@ -0,0 +1,102 @@
+import numpy as np
+
+
+def pxx_to_dBm(pxx):
+    """Converts a whole array of power values in mW to dBm, rounded the same way as mW_to_dBm. \n
+    The result is always double precision, rounded float32 values don't print as the rounded number.
+    """
+    with np.errstate(divide="ignore"):
+        return np.round(10 * np.log10(pxx, dtype=np.float64), 2)
+
+
+def find_signal_runs(pxx_db, level_of_interest_db, dc_start=None, dc_end=None):
+    """Finds runs of bins that are at or above the level of interest. \n
+    Bins between dc_start and dc_end are never part of a signal (DC spike). \n
+    Returns three index arrays: start bin, end bin and peak bin of every run. \n
+    The end bin is the first bin after the run (the bin that closed it), clipped to the last bin,
+    and the bin after that is not allowed to start a new run. This matches the old bin walk in SignalProcessor.
+    """
+    n = len(pxx_db)
+    above = pxx_db >= level_of_interest_db
+    if dc_start is not None and dc_end is not None:
+        above[dc_start:dc_end] = False
+
+    starts, ends = _run_edges(above)
+    if len(starts) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, empty
+
+    # The old walk consumed the bin after every run, so a run that starts exactly one bin later loses its first bin.
+    # A single bin run that loses its first bin disappears and so does not consume the bin after itself.
+    gap_of_one = np.zeros(len(starts), dtype=bool)
+    gap_of_one[1:] = (starts[1:] - ends[:-1]) == 1
+    candidate = gap_of_one & ((ends - starts) == 1)
+    position = np.arange(len(starts))
+    last_non_candidate = np.maximum.accumulate(np.where(candidate, 0, position))
+    dropped = candidate & ((position - last_non_candidate) % 2 == 1)
+    shifted = gap_of_one.copy()
+    shifted[1:] &= ~dropped[:-1]
+
+    if shifted.any():
+        above[starts[shifted]] = False
+        starts, ends = _run_edges(above)
+        if len(starts) == 0:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty, empty
+
+    # Peak power of every run, bins outside of runs can never win
+    masked_db = np.where(above, pxx_db, -np.inf)
+    peak_db = np.maximum.reduceat(masked_db, starts)
+
+    # First bin of every run that holds the peak power
+    run_marker = np.zeros(n, dtype=np.intp)
+    run_marker[starts] = 1
+    run_label = np.cumsum(run_marker) - 1
+    hits = np.flatnonzero(above & (pxx_db == peak_db[run_label]))
+    peak_idx = hits[np.searchsorted(hits, starts)]
+
+    end_idx = np.minimum(ends, n - 1)
+    return starts, end_idx, peak_idx
+
+
+def refine_signal_runs(pxx_db, level_of_interest_db, start_idx, end_idx, peak_idx, dc_start=None, dc_end=None):
+    """Estimates the edges and peaks of the runs found by find_signal_runs between bins. \n
+    Peaks are Gaussian interpolated (a parabola through the dBm values of the peak bin and its neighbours), edges are the
+    points where a straight line between the last bin below and the first bin above the level crosses it. \n
+    Returns the fractional bin positions of the start edge, end edge and peak of every run, and the interpolated peak power.
+    Where a neighbour is missing, inside the DC spike or not on the expected side of the level, the bin itself is kept.
+    """
+    n = len(pxx_db)
+    usable = np.isfinite(pxx_db)
+    if dc_start is not None and dc_end is not None:
+        usable[dc_start:dc_end] = False
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Peak: vertex of the parabola through the peak bin and both neighbours
+        left = np.maximum(peak_idx - 1, 0)
+        right = np.minimum(peak_idx + 1, n - 1)
+        a, b, c = pxx_db[left], pxx_db[peak_idx], pxx_db[right]
+        curvature = a - 2 * b + c
+        valid = (peak_idx > 0) & (peak_idx < n - 1) & usable[left] & usable[right] & (curvature < 0)
+        offset = np.clip(np.where(valid, 0.5 * (a - c) / curvature, 0.0), -0.5, 0.5)
+        peak_db = np.round(b - 0.25 * (a - c) * offset, 2)
+
+        # Start edge: crossing between the bin before the run and its first bin
+        before = np.maximum(start_idx - 1, 0)
+        a, b = pxx_db[before], pxx_db[start_idx]
+        valid = (start_idx > 0) & usable[before] & (a < level_of_interest_db) & (b >= level_of_interest_db)
+        start_pos = start_idx - np.where(valid, (b - level_of_interest_db) / (b - a), 0.0)
+
+        # End edge: crossing between the last bin of the run and the bin that closed it
+        last = np.maximum(end_idx - 1, 0)
+        a, b = pxx_db[last], pxx_db[end_idx]
+        valid = (end_idx > 0) & usable[end_idx] & (a >= level_of_interest_db) & (b < level_of_interest_db)
+        end_pos = end_idx - np.where(valid, (level_of_interest_db - b) / (a - b), 0.0)
+
+    return start_pos, end_pos, peak_idx + offset, peak_db
+
+
+def _run_edges(mask):
+    """Returns the start indices and exclusive end indices of all True runs in mask."""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
@@ -1,125 +1,20 @@
 from pyhackrf2 import HackRF
 import numpy as np
-from matplotlib.pyplot import psd
+import time
+from src import signal_detector
+from src import psd_estimator
+from src import rx_stream
+from src import spectrum_survey
+from src import channel_registry
+from src import signal_batch
+from src import sample_source
+from src import iq_ingest
+from src import waterfall
+from src import zoom_spectrum
+from src.channel_registry import channel_freq_range_list, channel_center_freq_list
 
 id = 0
 
-channel_freq_range_list = {
-    "A": [
-        [5850, 5880],
-        [5830, 5860],
-        [5810, 5840],
-        [5790, 5820],
-        [5770, 5800],
-        [5750, 5780],
-        [5730, 5760],
-        [5710, 5740],
-    ],
-    "B": [
-        [5718, 5748],
-        [5737, 5767],
-        [5756, 5786],
-        [5775, 5805],
-        [5794, 5824],
-        [5813, 5843],
-        [5832, 5862],
-        [5851, 5881],
-    ],
-    "E": [
-        [5690, 5720],
-        [5670, 5700],
-        [5650, 5680],
-        [5630, 5660],
-        [5870, 5900],
-        [5890, 5920],
-        [5910, 5940],
-        [5930, 5960],
-    ],
-    "F": [
-        [5725, 5755],
-        [5745, 5775],
-        [5765, 5795],
-        [5785, 5815],
-        [5805, 5835],
-        [5825, 5855],
-        [5845, 5875],
-        [5865, 5895],
-    ],
-    "R": [
-        [5643, 5673],
-        [5679, 5709],
-        [5716, 5746],
-        [5753, 5783],
-        [5790, 5820],
-        [5827, 5857],
-        [5864, 5894],
-        [5901, 5931],
-    ],
-    "D": [
-        [5347, 5377],
-        [5384, 5414],
-        [5421, 5451],
-        [5458, 5488],
-        [5495, 5525],
-        [5532, 5562],
-        [5569, 5599],
-        [5606, 5636],
-    ],
-    "U": [
-        [5300, 5330],
-        [5323, 5353],
-        [5341, 5371],
-        [5359, 5389],
-        [5377, 5407],
-        [5395, 5425],
-        [5413, 5443],
-        [5431, 5461],
-    ],
-    "O": [
-        [5459, 5489],
-        [5477, 5507],
-        [5495, 5525],
-        [5513, 5543],
-        [5531, 5561],
-        [5549, 5579],
-        [5567, 5597],
-        [5585, 5615],
-    ],
-    "L": [
-        [5318, 5348],
-        [5358, 5388],
-        [5398, 5428],
-        [5438, 5468],
-        [5478, 5508],
-        [5518, 5548],
-        [5558, 5588],
-        [5598, 5628],
-    ],
-    "H": [
-        [5638, 5668],
-        [5678, 5708],
-        [5718, 5748],
-        [5758, 5788],
-        [5798, 5828],
-        [5838, 5868],
-        [5878, 5908],
-        [5918, 5948],
-    ],
-}
-
-channel_center_freq_list = {
-    "A": [5865, 5845, 5825, 5805, 5785, 5765, 5745, 5725],
-    "B": [5733, 5752, 5771, 5790, 5809, 5828, 5847, 5866],
-    "E": [5705, 5685, 5665, 5645, 5885, 5905, 5925, 5945],
-    "F": [5740, 5760, 5780, 5800, 5820, 5840, 5860, 5880],
-    "R": [5658, 5695, 5732, 5769, 5806, 5843, 5880, 5917],
-    "D": [5362, 5399, 5436, 5473, 5510, 5547, 5584, 5621],
-    "U": [5325, 5348, 5366, 5384, 5402, 5420, 5438, 5456],
-    "O": [5474, 5492, 5510, 5528, 5546, 5564, 5582, 5600],
-    "L": [5333, 5373, 5413, 5453, 5493, 5533, 5573, 5613],
-    "H": [5653, 5693, 5733, 5773, 5813, 5853, 5893, 5933],
-}
-
 
 class Signal:
     """Class that represents a signal"""
@@ -178,48 +73,463 @@ class Signal:
     def inc_sweep_id(self):
         self.sweep_id += 1
 
+    @classmethod
+    def from_view(cls, view):
+        """Creates a full Signal object from a SignalView of a SignalBatch."""
+        signal = cls(view.start_freq, view.end_freq, view.peak_power_db, view.peak_freq)
+        signal.x = view.x
+        signal.y = view.y
+        signal.channel = view.channel
+        signal.potential_channels = view.potential_channels
+        return signal
+
+
+class ChannelPowers:
+    """Class that holds the power of every channel seen in one scan, as measured by the PolyphaseChannelizer. \n
+    Arrays are in channel registry order: indices (registry indices), powers_db (total power inside the visible part of the channel),
+    peak_freqs (center of the strongest sub-band of the channel in MHz) and coverage (visible fraction of the channel range). \n
+    Iterating yields one Signal per channel, so the GUI and ChannelList can use it like a list of signals.
+    """
+
+    def __init__(self, indices, powers_db, peak_freqs, coverage):
+        self.indices = indices
+        self.powers_db = powers_db
+        self.peak_freqs = peak_freqs
+        self.coverage = coverage
+        self.x = None
+        self.y = None
+
+    @property
+    def names(self):
+        return channel_registry.registry.names[self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        registry = channel_registry.registry
+        for index, power_db, peak_freq in zip(self.indices, self.powers_db, self.peak_freqs):
+            signal = Signal(
+                float(registry.start_freqs[index]),
+                float(registry.end_freqs[index]),
+                float(power_db),
+                float(peak_freq),
+            )
+            signal.channel = str(registry.names[index])
+            signal.x = self.x
+            signal.y = self.y
+            yield signal
+
+    def set_position(self, x, y):
+        """Ties the channel powers to the given servo position."""
+        self.x = int(x)
+        self.y = int(y)
+
+    def strongest(self):
+        """Returns the name of the strongest channel, or None if no channel is visible."""
+        if len(self.indices) == 0:
+            return None
+        return str(self.names[np.argmax(self.powers_db)])
+
+
+class PolyphaseChannelizer:
+    """Class that splits IQ samples into sub_bands equally wide sub-bands with a polyphase filter bank and
+    sums the sub-band powers of every channel on the channel grid. \n
+    The prototype filter is a Kaiser windowed sinc over taps * sub_bands samples, normalised to unity gain, so a sub-band
+    reports the power inside it in the same units as the samples. The DC sub-band (DC spike) and the sub-band at the band edge
+    are left out. Frames of taps * sub_bands samples do not overlap, which is enough for average power and keeps the cost
+    to one multiply per sample plus one short FFT per frame. \n
+    The sub-band to channel mapping is cached per (sample_rate, center_freq).
+    """
+
+    def __init__(self, sub_bands=32, taps=4, bands="A", kaiser_beta=5.0, frames_per_chunk=2048):
+        self.sub_bands = sub_bands
+        self.taps = taps
+        self.bands = bands
+        self.frames_per_chunk = frames_per_chunk
+
+        length = taps * sub_bands
+        n = np.arange(length) - (length - 1) / 2
+        prototype = np.sinc(n / sub_bands) * np.kaiser(length, kaiser_beta)
+        prototype /= np.sum(prototype)
+        # One row per tap, row t weights the t-th block of sub_bands samples of a frame
+        self.__polyphase = prototype.reshape(taps, sub_bands)
+        self.__plan_key = None
+
+    def __make_plan(self, sample_rate, center_freq):
+        """Calculates the sub-band frequencies and which sub-bands belong to which channel."""
+        key = (sample_rate, center_freq)
+        if key == self.__plan_key:
+            return
+        self.__plan_key = key
+
+        registry = channel_registry.registry
+        freqs = (np.fft.fftshift(np.fft.fftfreq(self.sub_bands, 1 / sample_rate)) + center_freq) / 1e6
+        usable = np.ones(self.sub_bands, dtype=bool)
+        usable[0] = False  # straddles both band edges
+        usable[self.sub_bands // 2] = False  # DC spike
+
+        candidates = registry.band_channels(self.bands) if self.bands is not None else np.arange(len(registry.names))
+        starts = registry.start_freqs[candidates][:, None]
+        ends = registry.end_freqs[candidates][:, None]
+        members = (freqs[None, :] >= starts) & (freqs[None, :] <= ends) & usable[None, :]
+        visible = np.any(members, axis=1)
+
+        half_width = sample_rate / 2e6
+        overlap = np.minimum(ends[:, 0], center_freq / 1e6 + half_width) - np.maximum(starts[:, 0], center_freq / 1e6 - half_width)
+
+        self.__freqs = freqs
+        self.__indices = candidates[visible]
+        self.__members = members[visible]
+        self.__coverage = np.clip(overlap / (ends[:, 0] - starts[:, 0]), 0, 1)[visible]
+
+    def sub_band_powers(self, samples, sample_rate, center_freq):
+        """Returns the average power of every sub-band and the sub-band center frequencies in MHz, lowest frequency first."""
+        self.__make_plan(sample_rate, center_freq)
+        samples = np.asarray(samples)
+        if not np.iscomplexobj(samples):
+            samples = samples.astype(np.complex128)
+        samples = np.ascontiguousarray(samples)
+
+        frame_length = self.taps * self.sub_bands
+        frames = len(samples) // frame_length
+        if frames <= 0:
+            raise ValueError(f"At least {frame_length} samples are needed for the channelizer.")
+
+        # Only the power is needed, so frames do not overlap. I and Q are weighted as separate real values.
+        pairs = samples[: frames * frame_length].view(samples.real.dtype).reshape(frames, self.taps, self.sub_bands, 2)
+        # complex64 samples are filtered in float32
+        polyphase = self.__polyphase.astype(pairs.dtype)
+        power_sum = np.zeros(self.sub_bands, dtype=np.float64)
+        for first in range(0, frames, self.frames_per_chunk):
+            # Weighted sum of the taps blocks of every frame, followed by one short FFT per frame
+            folded = np.einsum("ftbc,tb->fbc", pairs[first : first + self.frames_per_chunk], polyphase)
+            spectrum = np.fft.fft(folded[..., 0] + 1j * folded[..., 1], axis=1)
+            power_sum += np.einsum("fb,fb->b", spectrum.real, spectrum.real)
+            power_sum += np.einsum("fb,fb->b", spectrum.imag, spectrum.imag)
+
+        return np.fft.fftshift(power_sum / frames), self.__freqs
+
+    def channel_powers(self, samples, sample_rate, center_freq):
+        """Returns the ChannelPowers of the samples, and the sub-band powers and frequencies as raw data."""
+        powers, freqs = self.sub_band_powers(samples, sample_rate, center_freq)
+        members = self.__members
+        channel_power = members @ powers
+        strongest = np.argmax(np.where(members, powers[None, :], -np.inf), axis=1)
+        with np.errstate(divide="ignore"):
+            powers_db = np.round(10 * np.log10(channel_power), 2)
+        result = ChannelPowers(self.__indices, powers_db, freqs[strongest], self.__coverage)
+        return result, [powers, freqs]
+
 
 class SignalProcessor:
     """Class that processes signals. It takes a HackRF device id, sample rate, sample count, center frequency and amplifier state as arguments. \n
     Method get_signals returns a list of signals that are above the noise floor by the given offset in dBm. \n
+    Instead of opening the HackRF with the given id, any sample source (see sample_source.SampleSource) can be passed as hackrf,
+    from_file creates a processor that reads a recording.
     """
 
-    def __init__(self, id, sample_rate=20e6, sample_count=1e6, center_freq=5785e6):
+    def __init__(self, id, sample_rate=20e6, sample_count=1e6, center_freq=5785e6, hackrf=None):
         self.device_id = id
         self.sample_count = sample_count
         self.fft_count = 2048
+        # Estimate peak frequency, peak power and edges between FFT bins (see signal_detector.refine_signal_runs)
+        self.interpolate_peaks = True
+        # Two stage spectrum: a coarse PSD of coarse_fft_count bins finds the signals, a zoom FFT around each of them measures them
+        self.zoom_refinement = False
+        self.coarse_fft_count = 256
+        # Standard deviations of its own averaging above the noise that a zoomed bin needs to count as signal
+        self.zoom_noise_sigmas = 5.0
+        self.zoom = None
+        # Number of bins on each side of the center bin that are ignored because of the DC spike
+        self.dc_skip_bins = 24
+        # Welch PSD estimator, set psd.noverlap or psd.dtype to change the overlap or output precision
+        self.psd = psd_estimator.WelchPSD(dtype=np.float32)
+        # Captures are converted once from int8 into these reused buffers,
+        # set sample_buffers.dtype to np.complex128 and psd.dtype to np.float64 for double precision processing
+        self.sample_buffers = iq_ingest.SampleBufferPool(dtype=np.complex64)
+        self.__hackrf_reader = None
         self.manual_offset_in_use = False
         self.manual_offset_value = 10
         self.db_offset_in_use = 0.0
 
-        self.hackrf = HackRF(device_index=self.device_id)
+        # An already opened device or another sample source can be passed in instead of opening device id
+        self.hackrf = hackrf if hackrf is not None else HackRF(device_index=self.device_id)
         self.hackrf.sample_rate = sample_rate
         self.hackrf.center_freq = center_freq
 
+        # Continuous receive ring buffer, None when samples are read with read_samples on every scan
+        self.stream = None
+        # Wideband survey across all channel tables, created on first use
+        self.spectrum_survey = None
+
+        # The last PSD frames in dBm with their time and servo position
+        self.waterfall = waterfall.WaterfallBuffer(frame_count=256)
+
+        # Polyphase filter bank for channel power scans, created on first use
+        self.channelizer = None
+
+        # Adaptive dwell: capture in blocks of dwell_block_size samples and stop as soon as the running PSD shows a signal
+        # dwell_snr_margin_db above the level of interest, or no bin that could reach the level by the full dwell (see measure_adaptive).
+        # Scans near the level keep capturing up to max_dwell_samples (sample_count if None). Only while streaming.
+        self.adaptive_dwell = False
+        self.dwell_block_size = 65536
+        self.min_dwell_blocks = 2
+        self.max_dwell_samples = None
+        self.dwell_snr_margin_db = 6.0
+        self.dwell_noise_sigmas = 5.0
+        self.last_dwell_samples = 0
+
+        # Return detections as one SignalBatch per scan instead of a list of Signal objects
+        self.batch_output = False
+        self.scan_id = 0
+
     def set_amplifier(self, state):
         """Sets the amplifier state to the provided state."""
         self.hackrf.amplifier_on = state
 
+    @classmethod
+    def from_file(cls, path, sample_count=1e6, loop=False):
+        """Creates a signal processor that reads the IQ recording at path (see sample_source.IQFileSource) instead of a HackRF."""
+        source = sample_source.IQFileSource(path, loop=loop)
+        return cls(
+            None,
+            sample_rate=source.sample_rate,
+            sample_count=sample_count,
+            center_freq=source.center_freq,
+            hackrf=source,
+        )
+
+    def close(self):
+        """Stops streaming and closes the HackRF."""
+        self.stop_streaming()
+        if hasattr(self.hackrf, "close"):
+            self.hackrf.close()
+
     def mW_to_dBm(self, power):
         """Converts power in mW to dBm"""
         return round(10 * np.log10(power / 1), 2)
 
-    def __measure(self):
-        """Measures the samples and returns them"""
-        samples = self.hackrf.read_samples(self.sample_count)
+    def start_streaming(self, capacity=4e6):
+        """Keeps the HackRF receiving into a ring buffer of the given capacity (in samples) instead of starting RX on every scan."""
+        if self.stream is None:
+            self.stream = rx_stream.HackRFStream(self.hackrf, capacity=capacity)
+        self.stream.start()
+
+    def stop_streaming(self):
+        """Stops continuous receiving, scans go back to reading samples with read_samples."""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+
+    def __measure(self, after=None, sample_count=None, out=None):
+        """Measures the samples and returns them. \n
+        Samples from the HackRF are converted into out, or into the next of the reused sample buffers if out is None.
+        """
+        if sample_count is None:
+            sample_count = self.sample_count
+        if self.stream is not None:
+            if out is None:
+                out = self.sample_buffers.take(sample_count)
+            return self.stream.read_samples(sample_count, after=after, out=out)
+        if isinstance(self.hackrf, HackRF):
+            if self.__hackrf_reader is None or self.__hackrf_reader.hackrf is not self.hackrf:
+                self.__hackrf_reader = rx_stream.HackRFReader(self.hackrf)
+            if out is None:
+                out = self.sample_buffers.take(sample_count)
+            return self.__hackrf_reader.read_samples(sample_count, out=out)
+        if isinstance(self.hackrf, sample_source.SampleSource):
+            return self.hackrf.read_samples(sample_count, out=out)
+
+        samples = self.hackrf.read_samples(sample_count)
+        if out is not None:
+            out[: len(samples)] = samples
+            return out[: len(samples)]
         return samples
 
-    def __process(self):
-        """Processes the samples and returns a list of signals that are above the noise floor by the given offset in dBm, and the raw data."""
-        pxx, freqs = psd(
-            self.__measure(),
+    def capture_samples(self, after=None, sample_count=None):
+        """Captures the samples for one scan without processing them, so processing can happen elsewhere (see process_samples). \n
+        With adaptive_dwell on and no sample_count given, the amount of samples depends on what is seen (see measure_adaptive).
+        """
+        if self.adaptive_dwell and sample_count is None:
+            return self.measure_adaptive(after)[0]
+        return self.__measure(after, sample_count)
+
+    def capture_timed_samples(self, after=None, sample_count=None):
+        """Captures the samples for one scan and returns them with the time.monotonic() timestamp of their middle. \n
+        While streaming the timestamp comes from the time the samples arrived, otherwise it is the middle of the capture call.
+        """
+        if sample_count is None:
+            sample_count = self.sample_count
+        if self.stream is not None:
+            return self.stream.read_timed_samples(sample_count, after=after, out=self.sample_buffers.take(sample_count))
+        started = time.monotonic()
+        samples = self.__measure(after, sample_count)
+        return samples, (started + time.monotonic()) / 2
+
+    def measure_adaptive(self, after=None):
+        """Captures blocks of dwell_block_size samples while keeping a running PSD, until the scan is decided. \n
+        A scan is decided once its strongest bin outside the DC spike is dwell_snr_margin_db above the level of interest (a clear signal),
+        or when even dwell_noise_sigmas standard deviations above its strongest bin stay below the level of interest a PSD of
+        max_dwell_samples would have (nothing there that the full dwell could find), but never before min_dwell_blocks blocks.
+        Scans with a bin between the two go on until max_dwell_samples, so marginal pointings keep the full sensitivity. \n
+        Adaptive dwell needs the sample stream (see start_streaming). Without it every read of a HackRF starts and stops RX,
+        which costs more per block than dwelling saves, so one capture of sample_count samples is taken like with
+        adaptive_dwell off. \n
+        Returns the captured samples and the PSD and frequency vector of all of them.
+        """
+        sample_rate = self.hackrf.sample_rate
+        center_freq = self.hackrf.center_freq
+        if self.stream is None and isinstance(self.hackrf, HackRF):
+            samples = self.__measure(after, self.sample_count)
+            pxx, freqs = self.psd.estimate(samples, NFFT=self.fft_count, Fs=sample_rate / 1e6, Fc=center_freq / 1e6)
+            self.last_dwell_samples = len(samples)
+            return samples, pxx, freqs
+
+        max_samples = self.max_dwell_samples if self.max_dwell_samples is not None else self.sample_count
+        block_size = int(min(self.dwell_block_size, max_samples))
+        dc_start = (self.fft_count // 2) - self.dc_skip_bins
+        dc_end = (self.fft_count // 2) + self.dc_skip_bins
+
+        # Blocks are captured straight into consecutive parts of one buffer
+        samples = self.sample_buffers.take(max_samples)
+        power_sum = np.zeros(self.fft_count, dtype=np.float64)
+        block_count = 0
+        captured = 0
+        while captured + block_size <= max_samples:
+            block = self.__measure(after, block_size, out=samples[captured : captured + block_size])
+            # the next block has to start after this one, so the stream does not return overlapping samples
+            after = time.monotonic()
+            block_count += 1
+            captured += len(block)
+
+            pxx, freqs = self.psd.estimate(block, NFFT=self.fft_count, Fs=sample_rate / 1e6, Fc=center_freq / 1e6)
+            power_sum += pxx * len(block)
+            if block_count < self.min_dwell_blocks:
+                continue
+
+            pxx = power_sum / captured
+            pxx_db = signal_detector.pxx_to_dBm(pxx)
+            level_db = self.__level_of_interest(pxx, pxx_db, skip_dc=True)
+            peak = max(np.max(pxx[:dc_start]), np.max(pxx[dc_end:]))
+            if signal_detector.pxx_to_dBm(peak) >= level_db + self.dwell_snr_margin_db:
+                break
+            # Averaging n segments leaves every bin with a standard deviation of its mean / sqrt(n). Nothing is there only if
+            # even dwell_noise_sigmas above the strongest bin stays below the level of interest of the full dwell, which is
+            # lower than now since the noise bins spread less the longer they are averaged.
+            segments = captured // self.fft_count
+            full_level_db = self.__level_of_interest(
+                pxx, pxx_db, skip_dc=True, spread_scale=np.sqrt(segments / (max_samples // self.fft_count))
+            )
+            if peak * (1 + self.dwell_noise_sigmas / np.sqrt(segments)) < 10 ** (full_level_db / 10):
+                break
+
+        self.last_dwell_samples = captured
+        return samples[:captured], (power_sum / captured).astype(self.psd.dtype), freqs
+
+    def process_samples(self, samples, sample_rate=None, center_freq=None, position=None):
+        """Processes captured samples and returns a list of signals that are above the noise floor by the given offset in dBm, and the raw data. \n
+        sample_rate and center_freq (in Hz) are the settings the samples were captured with, the current HackRF settings are used if not given.
+        position is the (x, y) servo position the samples were captured at, it is stored with the PSD in the waterfall.
+        """
+        if sample_rate is None:
+            sample_rate = self.hackrf.sample_rate
+        if center_freq is None:
+            center_freq = self.hackrf.center_freq
+        if self.zoom_refinement:
+            return self.__process_zoomed(samples, sample_rate, center_freq, position)
+
+        pxx, freqs = self.psd.estimate(
+            samples,
             NFFT=self.fft_count,
-            Fs=self.hackrf.sample_rate / 1e6,
-            Fc=self.hackrf.center_freq / 1e6,
-            return_line=False,
+            Fs=sample_rate / 1e6,
+            Fc=center_freq / 1e6,
         )
-        raw_data = [pxx, freqs]
+        return self.detect_signals(pxx, freqs, position=position)
+
+    def __process_zoomed(self, samples, sample_rate, center_freq, position=None):
+        """Finds signals in a coarse PSD of coarse_fft_count bins and measures each of them in a zoom FFT (see zoom_spectrum.ZoomFFT). \n
+        Returns the signals and the coarse PSD as raw data, like process_samples.
+        """
+        if self.zoom is None:
+            self.zoom = zoom_spectrum.ZoomFFT(self.psd)
+        coarse_count = self.coarse_fft_count
+        pxx, freqs = self.psd.estimate(samples, NFFT=coarse_count, Fs=sample_rate / 1e6, Fc=center_freq / 1e6)
+        pxx_db = signal_detector.pxx_to_dBm(pxx)
+
+        # Same DC spike width in Hz as for the full PSD
+        dc_width = self.dc_skip_bins * sample_rate / self.fft_count
+        dc_bins = int(np.ceil(dc_width * coarse_count / sample_rate))
+        level_of_interest_db = self.__level_of_interest(pxx, pxx_db, skip_dc=True, dc_bins=dc_bins)
+        self.db_offset_in_use = level_of_interest_db
+        # Average noise of the coarse bins, from the same bins as the level
+        noise = np.mean(pxx[: coarse_count // 2 - dc_bins], dtype=np.float64)
+        found = self.__find_runs(
+            pxx_db, freqs, level_of_interest_db, coarse_count // 2 - dc_bins, coarse_count // 2 + dc_bins
+        )
+        start_freqs, end_freqs, peak_freqs, peak_db = [np.array(values, dtype=np.float64) for values in found]
+
+        # Every signal is zoomed with one coarse bin of margin on both sides, overlapping ranges are zoomed together
+        bin_width = sample_rate / coarse_count
+        lows = start_freqs * 1e6 - bin_width
+        highs = end_freqs * 1e6 + bin_width
+        # Coarse signals without a zoomed run above the zoom's level were noise in the coarse PSD
+        confirmed = np.zeros(len(start_freqs), dtype=bool)
+        ranges = list()
+        for low, high in zip(lows, highs):
+            if len(ranges) > 0 and low <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], high)
+            else:
+                ranges.append([low, high])
+
+        for low, high in ranges:
+            zoom_pxx, zoom_freqs = self.zoom.spectrum(samples, sample_rate, center_freq, low, high)
+            zoom_db = signal_detector.pxx_to_dBm(zoom_pxx)
+            # The zoom PSD averages decimation times fewer segments than the coarse one, so its noise bins spread further
+            # and would cross the coarse level. Its level is zoom_noise_sigmas standard deviations above the coarse noise.
+            zoom_level_db = level_of_interest_db
+            if not self.manual_offset_in_use:
+                zoom_segments = len(samples) // self.zoom.decimation_for(sample_rate, high - low) // self.zoom.zoom_fft_count
+                zoom_noise_db = self.mW_to_dBm(noise * (1 + self.zoom_noise_sigmas / np.sqrt(max(zoom_segments, 1))))
+                zoom_level_db = max(level_of_interest_db, zoom_noise_db)
+            # Bins inside the DC spike can't be part of a signal
+            in_dc = np.flatnonzero(np.abs(zoom_freqs * 1e6 - center_freq) < dc_width)
+            dc_start, dc_end = (in_dc[0], in_dc[-1] + 1) if len(in_dc) > 0 else (None, None)
+            zoom_starts, zoom_ends, zoom_peaks, zoom_peak_db = self.__find_runs(
+                zoom_db, zoom_freqs, zoom_level_db, dc_start, dc_end
+            )
+
+            # The finer bins split a signal into several runs where noise dips below the level, they are joined again:
+            # every zoomed run belongs to the coarse signal its peak is in, which gets the outer edges and the strongest peak
+            owner = np.searchsorted(lows, zoom_peaks * 1e6, side="right") - 1
+            for signal in np.unique(owner[(owner >= 0) & (zoom_peaks * 1e6 <= highs[np.maximum(owner, 0)])]):
+                mine = np.flatnonzero(owner == signal)
+                strongest = mine[np.argmax(zoom_peak_db[mine])]
+                start_freqs[signal] = np.min(zoom_starts[mine])
+                end_freqs[signal] = np.max(zoom_ends[mine])
+                peak_freqs[signal] = zoom_peaks[strongest]
+                peak_db[signal] = zoom_peak_db[strongest]
+                confirmed[signal] = True
+
+        start_freqs, end_freqs, peak_freqs, peak_db = (
+            start_freqs[confirmed], end_freqs[confirmed], peak_freqs[confirmed], peak_db[confirmed]
+        )
+        detected_at = time.time()
+        self.scan_id += 1
+        self.waterfall.push(pxx_db, freqs, detected_at, *(position if position is not None else (None, None)))
+        signals_list = self.__make_signals(
+            start_freqs, end_freqs, peak_freqs, peak_db, calculate_signal_channels_if_only_A_exists, detected_at
+        )
+        return (signals_list, [pxx, freqs])
 
+    def __level_of_interest(self, pxx, pxx_db, skip_dc=True, dc_bins=None, spread_scale=1.0):
+        """Returns the level in dBm above which bins belong to a signal. \n
+        dc_bins is the number of bins on each side of the center that belong to the DC spike, dc_skip_bins if None.
+        spread_scale scales the distance of the weakest bin from the average, to get the level of a PSD averaged over more
+        (spread_scale < 1) segments.
+        """
+        if dc_bins is None:
+            dc_bins = self.dc_skip_bins
         level_of_interest_db = 0.0
         level_of_interest_db_max = -35.0
         level_of_interest_db_min = -50.0
@@ -227,68 +537,144 @@ class SignalProcessor:
         # Set the level of interest to the minimum power + offset
         if self.manual_offset_in_use:
             level_of_interest_db = self.manual_offset_value
-            self.db_offset_in_use = level_of_interest_db
         else:
-            select_count = (self.fft_count // 2) - 24
-            # Take the first half of samples to avoid the DC spike
-            pxx_sample = pxx[:select_count]
-            freqs_sample = freqs[:select_count]
+            if skip_dc:
+                select_count = (len(pxx) // 2) - dc_bins
+                # Take the first half of samples to avoid the DC spike
+                pxx_sample = pxx[:select_count]
+            else:
+                pxx_sample = pxx
 
             # Find the minimum power in the sample to which we add the average power to get the level of interest
             min_index = np.argmin(pxx_sample)
-            avg_pxx_db = self.mW_to_dBm(np.average(pxx_sample))  # avg value
-            min_pxx_db = self.mW_to_dBm(pxx_sample[min_index])  # min value
+            avg_pxx_db = self.mW_to_dBm(np.mean(pxx_sample, dtype=np.float64))  # avg value
+            min_pxx_db = pxx_db[min_index]  # min value
+            if spread_scale != 1.0:
+                avg_pxx = np.mean(pxx_sample, dtype=np.float64)
+                min_pxx_db = self.mW_to_dBm(avg_pxx - (avg_pxx - pxx_sample[min_index]) * spread_scale)
             level_of_interest_db = min_pxx_db + 2 * abs(abs(min_pxx_db) - abs(avg_pxx_db))
-            # print(min_pxx_db, avg_pxx_db, level_of_interest_db, self.db_offset_in_use)
 
         # Limit the level of interest to the max and min values
         if level_of_interest_db < level_of_interest_db_min:
             level_of_interest_db = level_of_interest_db_min
         elif level_of_interest_db > level_of_interest_db_max:
             level_of_interest_db = level_of_interest_db_max
+        return level_of_interest_db
 
-        # reset the sample arrays to max size again
-        freqs_sample = freqs
-        pxx_sample = pxx
-        self.db_offset_in_use = level_of_interest_db
+    def __find_runs(self, pxx_db, freqs, level_of_interest_db, dc_start=None, dc_end=None):
+        """Returns the start, end and peak frequencies and the peak power of the signals at or above the level in the dBm spectrum."""
+        start_idx, end_idx, peak_idx = signal_detector.find_signal_runs(
+            pxx_db, level_of_interest_db, dc_start, dc_end
+        )
+        if not self.interpolate_peaks:
+            return freqs[start_idx], freqs[end_idx], freqs[peak_idx], pxx_db[peak_idx]
 
-        # Find the signals that are above the noise floor by the given offset
-        signals_list = list()
-        index = 0
-        while index < len(pxx_sample):
-            # skip DC spike
-            if index == 1000:
-                index = 1048
-            power_db = self.mW_to_dBm(pxx_sample[index])
-            if power_db >= level_of_interest_db:
-                temp_signal = Signal(
-                    freqs_sample[index],
-                    freqs_sample[index],
-                    power_db,
-                    freqs_sample[index],
+        start_pos, end_pos, peak_pos, peak_db = signal_detector.refine_signal_runs(
+            pxx_db, level_of_interest_db, start_idx, end_idx, peak_idx, dc_start, dc_end
+        )
+        bins = np.arange(len(freqs))
+        return np.interp(start_pos, bins, freqs), np.interp(end_pos, bins, freqs), np.interp(peak_pos, bins, freqs), peak_db
+
+    def __make_signals(self, start_freqs, end_freqs, peak_freqs, peak_db, find_channels, detected_at):
+        """Returns the detections as a SignalBatch or a list of Signal objects (see batch_output) with their channels assigned."""
+        if self.batch_output:
+            signals_list = signal_batch.SignalBatch.from_detections(
+                start_freqs,
+                end_freqs,
+                peak_freqs,
+                peak_db,
+                scan_id=self.scan_id,
+                timestamp=detected_at,
+            )
+        else:
+            signals_list = list()
+            for start_freq, end_freq, power_db, peak_freq in zip(start_freqs, end_freqs, peak_db, peak_freqs):
+                signals_list.append(
+                    Signal(start_freq, end_freq, power_db, peak_freq)
                 )
-                power_db = self.mW_to_dBm(pxx_sample[index])
-                while (power_db >= level_of_interest_db) and (index < len(pxx_sample)):
-                    power_db = self.mW_to_dBm(pxx_sample[index])
-                    temp_signal.end_freq = freqs_sample[index]
-                    if power_db > temp_signal.peak_power_db:
-                        temp_signal.peak_power_db = power_db
-                        temp_signal.peak_freq = freqs_sample[index]
-                    index += 1
-                signals_list.append(temp_signal)
-            index += 1
-
-        for signal in signals_list:
-            calculate_signal_channel_if_only_A_exists(signal)
+
+        find_channels(signals_list)
+        return signals_list
+
+    def detect_signals(self, pxx, freqs, skip_dc=True, find_channels=None, position=None, keep_history=True):
+        """Returns a list of signals in the given PSD that are above the noise floor by the given offset in dBm, and the raw data. \n
+        skip_dc should be False for spectra that have no DC spike in the middle, such as a stitched survey spectrum. \n
+        find_channels is called with all signals to assign their channels, by default only A band channels are assigned. \n
+        If keep_history is True the PSD is stored in the waterfall, with the (x, y) servo position if given.
+        """
+        if find_channels is None:
+            find_channels = calculate_signal_channels_if_only_A_exists
+        raw_data = [pxx, freqs]
+        pxx_db = signal_detector.pxx_to_dBm(pxx)
+
+        level_of_interest_db = self.__level_of_interest(pxx, pxx_db, skip_dc)
+        self.db_offset_in_use = level_of_interest_db
+
+        # Find the signals that are above the noise floor by the given offset, skipping the DC spike
+        dc_start = dc_end = None
+        if skip_dc:
+            dc_start = (self.fft_count // 2) - self.dc_skip_bins
+            dc_end = (self.fft_count // 2) + self.dc_skip_bins
+        found = self.__find_runs(pxx_db, freqs, level_of_interest_db, dc_start, dc_end)
+
+        self.scan_id += 1
+        detected_at = time.time()
+        if keep_history:
+            x, y = position if position is not None else (None, None)
+            self.waterfall.push(pxx_db, freqs, detected_at, x, y)
+
+        signals_list = self.__make_signals(*found, find_channels, detected_at)
 
         return (signals_list, raw_data)
 
-    def get_signals(self):
+    def get_signals(self, after=None):
         """Returns a list of signals that are above the lowest signal by the given offset in dBm. \n
         The signals are represented as Signal objects. \n
         The raw data is also returned. \n
+        When streaming, only samples taken after the time.monotonic() timestamp given in after are used. \n
+        """
+        if self.adaptive_dwell:
+            _, pxx, freqs = self.measure_adaptive(after)
+            return self.detect_signals(pxx, freqs)
+        return self.process_samples(self.__measure(after))
+
+    def process_channel_powers(self, samples, sample_rate=None, center_freq=None):
+        """Returns the power of every A band channel visible in the captured samples as ChannelPowers, and the sub-band powers as raw data. \n
+        Much cheaper than process_samples, there is no PSD and no signal detection, only a short filter bank.
+        """
+        if sample_rate is None:
+            sample_rate = self.hackrf.sample_rate
+        if center_freq is None:
+            center_freq = self.hackrf.center_freq
+        if self.channelizer is None:
+            self.channelizer = PolyphaseChannelizer()
+        return self.channelizer.channel_powers(samples, sample_rate, center_freq)
+
+    def get_channel_powers(self, after=None):
+        """Measures and returns the power of every visible A band channel, see process_channel_powers."""
+        return self.process_channel_powers(self.__measure(after))
+
+    def survey(self, start_freq=5300e6, end_freq=5960e6):
+        """Hops the HackRF across the given range (in Hz) and returns the signals found in the stitched spectrum, and its raw data. \n
+        Channels are assigned from every band, not just band A. The center frequency is restored afterwards. \n
+        A HackRF survey always runs on the sample stream. If it is not on already it is started for the survey and stopped
+        afterwards, starting and stopping RX on each of the ~75 hops costs more than the hop itself (see SpectrumSurvey for timing).
         """
-        return self.__process()
+        if self.spectrum_survey is None or (
+            self.spectrum_survey.start_freq,
+            self.spectrum_survey.end_freq,
+        ) != (start_freq, end_freq):
+            self.spectrum_survey = spectrum_survey.SpectrumSurvey(self, start_freq, end_freq)
+        started_stream = self.stream is None and isinstance(self.hackrf, HackRF)
+        if started_stream:
+            self.start_streaming()
+        try:
+            pxx, freqs = self.spectrum_survey.run()
+        finally:
+            if started_stream:
+                self.stop_streaming()
+        # The stitched spectrum has another frequency axis, it would start the waterfall over
+        return self.detect_signals(pxx, freqs, skip_dc=False, find_channels=calculate_signal_channels, keep_history=False)
 
 
 def mW_to_dBm(value):
@@ -300,41 +686,63 @@ def calculate_signal_channel(signal:Signal):
     """Updates the signals' channels based on the signals' peak frequencies. \n
     If no channel is a direct fit, assigns potential channels to signals based on their peak frequencies. \n
     """
-    # if signals peak freq is exactly a channel center freq, assign the channel to that signal
-    for channel, frequencies in channel_center_freq_list.items():
-        for i, freq in enumerate(frequencies):
-            if round(signal.peak_freq) == freq:
-                signal.channel = f"{channel}{i+1}"
-                return True
-
-    # assign potential channels to signals based on their peak freq
-    for channel, frequencies in channel_freq_range_list.items():
-        for i, freq_range in enumerate(frequencies):
-            if signal.peak_freq >= freq_range[0] and signal.peak_freq <= freq_range[1]:
-                signal.potential_channels.append(f"{channel}{i+1}")
-    
-    if signal.channel is None or len(signal.potential_channels) == 0:
-        signal.channel = "Unclear"
-        return False
-    
-    return True
+    return calculate_signal_channels([signal])[0]
+
+
+def calculate_signal_channels(signals):
+    """Updates the channels of all signals at once, the same way calculate_signal_channel does for one signal. \n
+    Returns a list telling for every signal whether a channel was found.
+    """
+    registry = channel_registry.registry
+    if isinstance(signals, signal_batch.SignalBatch):
+        exact = registry.exact_channels(signals.data["peak_freq"])
+        # potential channels of unclear signals are looked up by the views when needed
+        signals.data["channel"] = np.where(exact >= 0, exact, signal_batch.UNCLEAR_CHANNEL)
+        return list(exact >= 0)
+
+    exact, candidates = registry.classify([signal.peak_freq for signal in signals])
+
+    results = list()
+    for signal, exact_index, candidate_indices in zip(signals, exact, candidates):
+        # if signals peak freq is exactly a channel center freq, assign the channel to that signal
+        if exact_index >= 0:
+            signal.channel = str(registry.names[exact_index])
+            results.append(True)
+            continue
+
+        # assign potential channels to signals based on their peak freq
+        signal.potential_channels.extend(str(name) for name in registry.names[candidate_indices])
+
+        if signal.channel is None or len(signal.potential_channels) == 0:
+            signal.channel = "Unclear"
+            results.append(False)
+        else:
+            results.append(True)
+    return results
+
 
 def calculate_signal_channel_if_only_A_exists(signal:Signal):
-    a_channels = [
-        [5850, 5880],
-        [5830, 5860],
-        [5810, 5840],
-        [5790, 5820],
-        [5770, 5800],
-        [5750, 5780],
-        [5730, 5760],
-        [5710, 5740]]
-    
-    for freq_range in a_channels:
-        if signal.peak_freq >= freq_range[0] and signal.peak_freq <= freq_range[1]:
-            signal.channel = f"A{a_channels.index(freq_range) + 1}"
-            return True
-    
+    return calculate_signal_channels_if_only_A_exists([signal])[0]
+
+
+def calculate_signal_channels_if_only_A_exists(signals):
+    """Assigns every signal the first A band channel whose range contains its peak frequency."""
+    registry = channel_registry.registry
+    if isinstance(signals, signal_batch.SignalBatch):
+        first = registry.first_candidate_channels(signals.data["peak_freq"], bands="A")
+        signals.data["channel"] = first
+        return [True if found else None for found in first >= 0]
+
+    candidates = registry.candidate_channels([signal.peak_freq for signal in signals], bands="A")
+
+    results = list()
+    for signal, candidate_indices in zip(signals, candidates):
+        if len(candidate_indices) > 0:
+            signal.channel = str(registry.names[candidate_indices[0]])
+            results.append(True)
+        else:
+            results.append(None)
+    return results
 
 
 if __name__ == "__main__":
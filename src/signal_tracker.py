@@ -0,0 +1,172 @@
+import collections
+import math
+import threading
+import time
+
+
+class Track:
+    """Class that holds the bookkeeping of one tracked signal: the Signal itself (with its position history), the frequency
+    bucket it is filed under, and when and in which sweep it was last seen."""
+
+    def __init__(self, signal, bucket, last_seen, last_sweep):
+        self.signal = signal
+        self.bucket = bucket
+        self.last_seen = last_seen
+        self.last_sweep = last_sweep
+
+
+class SignalTracker:
+    """Class that keeps track of the signals seen during continuous sweeps and associates new detections with them. \n
+    A detection belongs to a track if its peak, start and end frequencies are all within tolerance (MHz) of the track's.
+    Tracks are filed in buckets of tolerance MHz by peak frequency, so the candidates of a detection are found in its own
+    bucket and the two next to it instead of by comparing against every track. All detections of a scan are associated
+    at once, closest peaks first, and a track takes at most one detection per scan. \n
+    Tracks that were not seen for max_age seconds or max_missed_sweeps sweeps are evicted, and the least recently seen
+    tracks are evicted when there are more than max_tracks. A track keeps the position history of its last
+    max_history_sweeps sweeps.
+    """
+
+    def __init__(self, tolerance=0.1, max_age=60.0, max_missed_sweeps=3, max_tracks=256, max_history_sweeps=16):
+        self.tolerance = tolerance
+        self.max_age = max_age
+        self.max_missed_sweeps = max_missed_sweeps
+        self.max_tracks = max_tracks
+        self.max_history_sweeps = max_history_sweeps
+        self.sweep = 0
+
+        # Tracks by signal id, least recently seen first
+        self.__tracks = collections.OrderedDict()
+        # Bucket number -> signal ids of the tracks whose peak frequency is in that bucket
+        self.__buckets = collections.defaultdict(set)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__tracks)
+
+    @property
+    def signals(self):
+        """The tracked signals, least recently seen first."""
+        with self.__lock:
+            return [track.signal for track in self.__tracks.values()]
+
+    def reset(self):
+        """Forgets all tracks."""
+        with self.__lock:
+            self.__tracks.clear()
+            self.__buckets.clear()
+
+    def __bucket_of(self, freq):
+        return math.floor(freq / self.tolerance)
+
+    def __file(self, track, freq):
+        """Moves the track into the bucket of the given peak frequency."""
+        bucket = self.__bucket_of(freq)
+        if bucket != track.bucket:
+            self.__buckets[track.bucket].discard(track.signal.id)
+            if len(self.__buckets[track.bucket]) == 0:
+                del self.__buckets[track.bucket]
+            self.__buckets[bucket].add(track.signal.id)
+            track.bucket = bucket
+
+    def __evict(self, signal_id):
+        track = self.__tracks.pop(signal_id)
+        self.__buckets[track.bucket].discard(signal_id)
+        if len(self.__buckets[track.bucket]) == 0:
+            del self.__buckets[track.bucket]
+
+    def __matches(self, signal, track_signal):
+        return (
+            abs(signal.peak_freq - track_signal.peak_freq) <= self.tolerance
+            and abs(signal.start_freq - track_signal.start_freq) <= self.tolerance
+            and abs(signal.end_freq - track_signal.end_freq) <= self.tolerance
+        )
+
+    def update(self, signals, x, y, timestamp=None, move_to_stronger=False):
+        """Associates the signals of one scan at position x, y with the tracks and adds the position to their history. \n
+        Signals that match no track start a new one. If move_to_stronger is True, a track takes over the position and values
+        of a stronger detection. timestamp is the time.monotonic() time of the scan, now if None. Returns the signals that
+        started new tracks.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        new_signals = list()
+        with self.__lock:
+            # Every (distance, detection, track) pair within tolerance, from the neighbouring buckets only
+            pairs = list()
+            for i, signal in enumerate(signals):
+                bucket = self.__bucket_of(signal.peak_freq)
+                for neighbour in (bucket - 1, bucket, bucket + 1):
+                    for signal_id in self.__buckets.get(neighbour, ()):
+                        track_signal = self.__tracks[signal_id].signal
+                        if self.__matches(signal, track_signal):
+                            pairs.append((abs(signal.peak_freq - track_signal.peak_freq), i, signal_id))
+
+            pairs.sort()
+            assigned = dict()
+            taken = set()
+            for _, i, signal_id in pairs:
+                if i not in assigned and signal_id not in taken:
+                    assigned[i] = signal_id
+                    taken.add(signal_id)
+
+            for i, signal in enumerate(signals):
+                if i in assigned:
+                    track = self.__tracks[assigned[i]]
+                    track.last_seen = timestamp
+                    track.last_sweep = self.sweep
+                    self.__tracks.move_to_end(track.signal.id)
+                    existing = track.signal
+                    existing.update_sweep_list()
+                    existing.position_history[existing.sweep_id].append([x, y, signal.peak_power_db])
+
+                    if move_to_stronger and signal.peak_power_db >= existing.peak_power_db:
+                        existing.x = x
+                        existing.y = y
+                        existing.peak_freq = signal.peak_freq
+                        existing.peak_power_db = signal.peak_power_db
+                        existing.start_freq = signal.start_freq
+                        existing.end_freq = signal.end_freq
+                        self.__file(track, signal.peak_freq)
+                    continue
+
+                signal.x = x
+                signal.y = y
+                signal.update_sweep_list()
+                signal.position_history[signal.sweep_id].append([x, y, signal.peak_power_db])
+                bucket = self.__bucket_of(signal.peak_freq)
+                self.__tracks[signal.id] = Track(signal, bucket, timestamp, self.sweep)
+                self.__buckets[bucket].add(signal.id)
+                new_signals.append(signal)
+
+            self.__age_out(timestamp)
+        return new_signals
+
+    def next_sweep(self, now=None):
+        """Starts a new sweep: every track gets a new position history entry, tracks missing for too many sweeps or not seen
+        for max_age seconds before now (time.monotonic(), like the scan timestamps) are evicted."""
+        if now is None:
+            now = time.monotonic()
+        with self.__lock:
+            self.sweep += 1
+            for track in self.__tracks.values():
+                signal = track.signal
+                signal.inc_sweep_id()
+                if len(signal.position_history) >= self.max_history_sweeps:
+                    # Keep the history bounded, the current sweep stays at index sweep_id
+                    del signal.position_history[0]
+                    signal.sweep_id -= 1
+            self.__age_out(now)
+
+    def __age_out(self, now):
+        """Evicts the tracks that are too old, oldest first, and the least recently seen ones above max_tracks."""
+        while len(self.__tracks) > 0:
+            signal_id, track = next(iter(self.__tracks.items()))
+            if (
+                len(self.__tracks) > self.max_tracks
+                or now - track.last_seen > self.max_age
+                or self.sweep - track.last_sweep > self.max_missed_sweeps
+            ):
+                self.__evict(signal_id)
+            else:
+                break
+
@@ -0,0 +1,115 @@
+import time
+
+import numpy as np
+
+
+class SpectrumSurvey:
+    """Class that hops the HackRF center frequency across a wide frequency range in overlapping steps
+    and stitches the PSD of every step into one spectrum. \n
+    Every step keeps only the bins between the DC spike and the band edges. The step size is chosen so that the
+    kept bins of neighbouring steps cover each others DC gap, and centers are aligned to the FFT bin grid (and to whole Hz),
+    so bins of different steps land exactly on the same stitched frequencies. \n
+    The hop direction alternates between runs, so back to back surveys never retune across the whole range. \n
+    Timing: 5300-5960 MHz at 20 MS/s is 75 hops. Each hop waits for the first stream block that started after the retune,
+    so with libhackrf's 131072 sample transfers (6.6 ms) a hop takes 6.6 to 13.1 ms, about 10 ms on average, and the
+    survey about 0.75-0.9 s (measured against a simulated HackRF delivering blocks at that rate). That wait is the floor,
+    using samples from inside a block would need sample times finer than the block arrival time.
+    """
+
+    def __init__(self, signal_processor, start_freq=5300e6, end_freq=5960e6, edge_trim=0.1, dwell_segments=8, settle_samples=2048):
+        self.sp = signal_processor
+        self.start_freq = start_freq
+        self.end_freq = end_freq
+        # Fraction of each half of the band that is thrown away at the edges (anti aliasing filter roll-off)
+        self.edge_trim = edge_trim
+        # Number of FFT segments captured per step, a few are enough to find channels in the survey
+        self.dwell_segments = dwell_segments
+        # Samples thrown away after each retune while the PLL settles
+        self.settle_samples = settle_samples
+
+        self.__ascending = True
+        self.__plan_key = None
+
+    def __make_plan(self):
+        """Calculates the hop centers and the stitched frequency grid for the current radio settings."""
+        sample_rate = self.sp.hackrf.sample_rate
+        fft_count = self.sp.fft_count
+        key = (sample_rate, fft_count, self.sp.dc_skip_bins, self.edge_trim)
+        if key == self.__plan_key:
+            return
+        self.__plan_key = key
+
+        bin_width = sample_rate / fft_count
+        half_keep = int((fft_count // 2) * (1 - self.edge_trim))
+        dc_half = self.sp.dc_skip_bins
+
+        # Centers are kept on a multiple of 8 bins, so that they are whole Hz for the usual 2048 bins over 20 MHz
+        alignment = 8
+        step_bins = ((half_keep - dc_half) // alignment) * alignment
+        if step_bins <= 0:
+            raise ValueError("Edge trim and DC skip leave no usable bandwidth for the survey.")
+
+        # The first step reaches down to start_freq, steps continue until one reaches up to end_freq
+        start_bin = int(np.floor(self.start_freq / bin_width))
+        end_bin = int(np.ceil(self.end_freq / bin_width))
+        first_center_bin = ((start_bin + half_keep) // alignment) * alignment
+        center_bins = np.arange(first_center_bin, end_bin - half_keep + step_bins, step_bins)
+
+        offsets = np.arange(-half_keep, half_keep + 1)
+        offsets = offsets[np.abs(offsets) >= dc_half]
+
+        grid_start_bin = center_bins[0] - half_keep
+        grid_length = center_bins[-1] + half_keep - grid_start_bin + 1
+
+        self.__bin_width = bin_width
+        self.__center_bins = center_bins
+        # Index into each step's PSD, and index into the stitched grid for each step
+        self.__psd_index = offsets + fft_count // 2
+        self.__grid_index = (center_bins - grid_start_bin)[:, None] + offsets[None, :]
+        self.__freqs = (grid_start_bin + np.arange(grid_length)) * bin_width / 1e6
+
+        in_range = (self.__freqs >= self.start_freq / 1e6) & (self.__freqs <= self.end_freq / 1e6)
+        self.__crop = slice(np.argmax(in_range), len(in_range) - np.argmax(in_range[::-1]))
+
+    def hop_centers(self):
+        """Returns the center frequencies in Hz the survey hops to, in ascending order."""
+        self.__make_plan()
+        return self.__center_bins * self.__bin_width
+
+    def run(self):
+        """Performs one survey and returns the stitched PSD and its frequency vector in MHz."""
+        self.__make_plan()
+        hackrf = self.sp.hackrf
+        sample_rate = hackrf.sample_rate
+        fft_count = self.sp.fft_count
+        original_center_freq = hackrf.center_freq
+        dwell = self.dwell_segments * fft_count
+
+        power_sum = np.zeros(len(self.__freqs), dtype=np.float64)
+        hits = np.zeros(len(self.__freqs), dtype=np.int32)
+
+        order = range(len(self.__center_bins))
+        if not self.__ascending:
+            order = reversed(order)
+        self.__ascending = not self.__ascending
+
+        try:
+            for step in order:
+                hackrf.center_freq = self.__center_bins[step] * self.__bin_width
+                retuned_at = time.monotonic()
+                samples = self.sp.capture_samples(after=retuned_at, sample_count=dwell + self.settle_samples)
+                # The frequency axis is built from the grid, so the PSD is estimated around 0 to reuse one cached plan
+                pxx, _ = self.sp.psd.estimate(
+                    samples[self.settle_samples :],
+                    NFFT=fft_count,
+                    Fs=sample_rate / 1e6,
+                    Fc=0,
+                )
+                grid_index = self.__grid_index[step]
+                power_sum[grid_index] += pxx[self.__psd_index]
+                hits[grid_index] += 1
+        finally:
+            hackrf.center_freq = original_center_freq
+
+        pxx = power_sum / np.maximum(hits, 1)
+        return pxx[self.__crop], self.__freqs[self.__crop]
@@ -0,0 +1,93 @@
+import queue
+import threading
+
+
+class ScanCapture:
+    """Class that holds everything captured at one scan point: the raw samples, the radio settings they were taken with,
+    the servo telemetry and the servo position the antenna was pointing at."""
+
+    def __init__(self, samples, sample_rate, center_freq, telemetry_1, telemetry_2, x, y, captured_at):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.telemetry_1 = telemetry_1
+        self.telemetry_2 = telemetry_2
+        self.x = x
+        self.y = y
+        self.captured_at = captured_at
+
+
+class ScanPipeline:
+    """Class that processes scan captures on a worker thread, so the servos can move to the next point while the previous
+    capture goes through PSD, detection and bookkeeping. \n
+    process_scan is called with each capture and returns the scan data, handle_result is then called with the capture
+    and the scan data, so results stay tied to the position they were captured at. \n
+    Captures are processed in submission order. If enabled is False everything runs synchronously in submit.
+    """
+
+    def __init__(self, process_scan, handle_result=None, max_pending=2, enabled=True):
+        self.process_scan = process_scan
+        self.handle_result = handle_result
+        self.enabled = enabled
+        self.error = None
+
+        self.__queue = queue.Queue(maxsize=max_pending)
+        self.__worker = None
+        if self.enabled:
+            self.__worker = threading.Thread(target=self.__work, daemon=True)
+            self.__worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is None:
+            self.__raise_error()
+        return False
+
+    def __run(self, capture):
+        scan_data = self.process_scan(capture)
+        if self.handle_result is not None:
+            self.handle_result(capture, scan_data)
+
+    def __work(self):
+        while True:
+            capture = self.__queue.get()
+            try:
+                if capture is None:
+                    return
+                if self.error is None:
+                    self.__run(capture)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.__queue.task_done()
+
+    def __raise_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def submit(self, capture: ScanCapture):
+        """Queues a capture for processing. Blocks if max_pending captures are already waiting."""
+        self.__raise_error()
+        if not self.enabled:
+            self.__run(capture)
+            return
+        self.__queue.put(capture)
+
+    def drain(self):
+        """Waits until every submitted capture has been processed."""
+        if self.enabled:
+            self.__queue.join()
+        self.__raise_error()
+
+    def close(self):
+        """Processes the remaining captures and stops the worker thread."""
+        if self.__worker is None:
+            return
+        self.__queue.put(None)
+        self.__worker.join()
+        self.__worker = None
@@ -0,0 +1,96 @@
+import threading
+import time
+
+
+class TelemetryCache:
+    """Class that keeps the latest telemetry of the servos, polled on one background thread. \n
+    poll() reads the telemetry of all servos and hands every sample to update. It is only ever called on the polling thread,
+    every interval seconds or right away when a reader needs a newer sample. Readers get the cached sample if it is
+    within their staleness budget, otherwise they wake the poller and wait for its next sample instead of using the
+    serial port themselves. Telemetry read elsewhere (move reports, direct reads) is added with update as well. \n
+    Sample times are time.monotonic() at the moment the request was sent, so a sample is never newer than the state it shows.
+    """
+
+    def __init__(self, poll, interval=0.25):
+        self.poll = poll
+        self.interval = interval
+        self.error = None
+
+        # Servo id -> (telemetry, time)
+        self.__samples = dict()
+        self.__condition = threading.Condition()
+        self.__wake = False
+        self.__running = False
+        self.__thread = None
+
+    @property
+    def running(self):
+        return self.__running
+
+    def start(self):
+        """Starts the polling thread."""
+        with self.__condition:
+            if self.__running:
+                return
+            self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stops the polling thread after its current poll."""
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        self.__thread = None
+
+    def update(self, servo_id, telemetry, sampled_at):
+        """Adds a sample of the servo taken at sampled_at, unless a newer one is cached already."""
+        with self.__condition:
+            cached = self.__samples.get(servo_id)
+            if cached is None or cached[1] <= sampled_at:
+                self.__samples[servo_id] = (telemetry, sampled_at)
+                self.__condition.notify_all()
+
+    def sample(self, servo_id):
+        """Returns (telemetry, time) of the latest sample of the servo, or None."""
+        with self.__condition:
+            return self.__samples.get(servo_id)
+
+    def get(self, servo_id, max_age=0.5, timeout=1.0):
+        """Returns the telemetry of the servo if the latest sample is at most max_age seconds old. Otherwise the poller is
+        woken and the next sample is awaited for up to timeout seconds. Returns None if none came or the poller is stopped."""
+        deadline = time.monotonic() + timeout
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                cached = self.__samples.get(servo_id)
+                if cached is not None and now - cached[1] <= max_age:
+                    return cached[0]
+                if not self.__running:
+                    return None
+                # Woken even if the reader does not wait, so the next read finds a newer sample
+                self.__wake = True
+                self.__condition.notify_all()
+                if now >= deadline:
+                    return None
+                self.__condition.wait(deadline - now)
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                # update notifies as well, only a reader's wake or the interval end the wait
+                deadline = time.monotonic() + self.interval
+                while not self.__wake and self.__running and time.monotonic() < deadline:
+                    self.__condition.wait(deadline - time.monotonic())
+                self.__wake = False
+                if not self.__running:
+                    return
+            try:
+                self.poll()
+                self.error = None
+            except Exception as e:
+                # Keep polling, a reader that gets no sample falls back to reading itself
+                self.error = e
+                print(f"[WARNING] Telemetry poll failed: {e}")
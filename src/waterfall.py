@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+
+from src import signal_batch
+
+
+class WaterfallBuffer:
+    """Class that keeps the last frame_count PSD frames in a preallocated ring buffer, for waterfalls, max-hold and averaging. \n
+    The frequency axis is stored once, every frame is a row of dBm values with the time it was taken and the servo position
+    (NO_POSITION if not known). The buffer starts over when a frame with a different frequency axis is pushed. \n
+    Readers get views of the ring buffer, nothing is copied. A view row is overwritten once frame_count newer frames were pushed.
+    """
+
+    def __init__(self, frame_count=256, dtype=np.float32):
+        self.frame_count = int(frame_count)
+        self.dtype = dtype
+        self.freqs = None
+        self.rows = None
+        self.timestamps = np.zeros(self.frame_count, dtype=np.float64)
+        self.x = np.full(self.frame_count, signal_batch.NO_POSITION, dtype=np.int32)
+        self.y = np.full(self.frame_count, signal_batch.NO_POSITION, dtype=np.int32)
+        # Total amount of frames pushed since the last reset, the next row is this modulo frame_count
+        self.pushed = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.pushed, self.frame_count)
+
+    def reset(self, freqs=None):
+        """Forgets all frames, and sets up the buffer for the given frequency axis."""
+        with self.__lock:
+            self.pushed = 0
+            if freqs is None:
+                self.freqs = None
+                return
+            self.freqs = np.array(freqs, dtype=np.float64)
+            self.freqs.flags.writeable = False
+            if self.rows is None or self.rows.shape[1] != len(freqs) or self.rows.dtype != self.dtype:
+                self.rows = np.empty((self.frame_count, len(freqs)), dtype=self.dtype)
+
+    def push(self, pxx_db, freqs, timestamp, x=None, y=None):
+        """Stores one frame of dBm values. Returns the row it was stored in."""
+        if self.freqs is None or len(freqs) != len(self.freqs) or not np.array_equal(freqs, self.freqs):
+            self.reset(freqs)
+        with self.__lock:
+            row = self.pushed % self.frame_count
+            self.rows[row] = pxx_db
+            self.timestamps[row] = timestamp
+            self.x[row] = signal_batch.NO_POSITION if x is None else int(x)
+            self.y[row] = signal_batch.NO_POSITION if y is None else int(y)
+            self.pushed += 1
+        return row
+
+    def __order(self, count):
+        """Returns the ring slices holding the newest count frames, oldest first."""
+        with self.__lock:
+            count = len(self) if count is None else min(int(count), len(self))
+            end = self.pushed % self.frame_count
+            start = (end - count) % self.frame_count
+        if count == 0:
+            return [slice(0, 0)]
+        if start < end:
+            return [slice(start, end)]
+        return [slice(start, self.frame_count), slice(0, end)]
+
+    def segments(self, count=None):
+        """Returns the newest count frames (all if None) as one or two views of the ring, oldest first. \n
+        Each segment is a tuple of (dBm rows, timestamps, x positions, y positions).
+        """
+        return [(self.rows[part], self.timestamps[part], self.x[part], self.y[part]) for part in self.__order(count)]
+
+    def latest(self):
+        """Returns a view of the newest frame, or None if there is none."""
+        if len(self) == 0:
+            return None
+        return self.rows[(self.pushed - 1) % self.frame_count]
+
+    def max_hold(self, count=None, out=None):
+        """Returns the highest dBm value of every bin over the newest count frames (all if None), or None if there are none."""
+        if len(self) == 0 or (count is not None and count <= 0):
+            return None
+        parts = self.__order(count)
+        out = np.max(self.rows[parts[0]], axis=0, out=out)
+        for part in parts[1:]:
+            np.maximum(out, np.max(self.rows[part], axis=0), out=out)
+        return out
+
+    def average(self, count=None, out=None):
+        """Returns the average power of every bin over the newest count frames (all if None) in dBm, or None if there are none. \n
+        The frames are averaged in linear power (mW) like the PSD segments, a mean of the dBm values would sit below it
+        wherever the power varies between frames.
+        """
+        if len(self) == 0 or (count is not None and count <= 0):
+            return None
+        parts = self.__order(count)
+        frames = sum(part.stop - part.start for part in parts)
+        power = np.zeros(self.rows.shape[1], dtype=np.float64)
+        for part in parts:
+            power += np.sum(np.power(10.0, self.rows[part] / 10.0, dtype=np.float64), axis=0)
+        power /= frames
+        if out is None:
+            out = np.empty(self.rows.shape[1], dtype=self.dtype)
+        with np.errstate(divide="ignore"):
+            np.multiply(np.log10(power), 10.0, out=out)
+        return out
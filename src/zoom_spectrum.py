@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class ZoomFFT:
+    """Class that estimates a high resolution PSD of a narrow frequency range of complex IQ samples (a zoom FFT). \n
+    The range is shifted to DC, low pass filtered and decimated in one step: the filter coefficients carry the frequency shift,
+    so the samples are only touched by one matrix product with taps coefficients per output sample. The shift that remains at
+    the decimated rate is a whole number of zoom bins and is undone by rolling the spectrum. \n
+    Only the middle keep fraction of the decimated band is returned, the filter rolls off outside of it.
+    The decimation is chosen so that the requested range fits, up to max_decimation.
+    """
+
+    def __init__(self, psd, zoom_fft_count=256, max_decimation=64, taps=8, keep=0.5, kaiser_beta=6.0, max_cached_filters=64):
+        # WelchPSD used for the decimated samples
+        self.psd = psd
+        self.zoom_fft_count = zoom_fft_count
+        self.max_decimation = max_decimation
+        self.taps = taps
+        self.keep = keep
+        self.kaiser_beta = kaiser_beta
+        self.max_cached_filters = max_cached_filters
+        self.__prototypes = dict()
+        self.__filters = dict()
+
+    def decimation_for(self, sample_rate, bandwidth):
+        """Returns the decimation that fits the bandwidth (Hz) into the kept part of the decimated band."""
+        if bandwidth <= 0:
+            return self.max_decimation
+        return int(np.clip(np.floor(sample_rate * self.keep / bandwidth), 1, self.max_decimation))
+
+    def __prototype(self, decimation):
+        """Returns the low pass filter for the decimation, normalised to unity gain."""
+        prototype = self.__prototypes.get(decimation)
+        if prototype is None:
+            length = self.taps * decimation
+            n = np.arange(length) - (length - 1) / 2
+            prototype = np.sinc(n / decimation) * np.kaiser(length, self.kaiser_beta)
+            prototype /= np.sum(prototype)
+            self.__prototypes[decimation] = prototype
+        return prototype
+
+    def __filter(self, sample_rate, decimation, shift_bins, dtype):
+        """Returns the filter coefficients that shift by shift_bins zoom bins, one row of decimation coefficients per tap."""
+        key = (sample_rate, decimation, shift_bins, np.dtype(dtype))
+        coefficients = self.__filters.get(key)
+        if coefficients is not None:
+            return coefficients
+        if len(self.__filters) >= self.max_cached_filters:
+            self.__filters.clear()
+
+        shift = shift_bins * sample_rate / (decimation * self.zoom_fft_count)
+        prototype = self.__prototype(decimation)
+        k = np.arange(len(prototype))
+        coefficients = (prototype * np.exp(-2j * np.pi * shift * k / sample_rate)).astype(dtype)
+        coefficients = coefficients.reshape(self.taps, decimation).T.copy()
+        self.__filters[key] = coefficients
+        return coefficients
+
+    def spectrum(self, samples, sample_rate, center_freq, low_freq, high_freq):
+        """Returns the zoomed PSD covering low_freq to high_freq (Hz, absolute) and its frequency vector in MHz. \n
+        The PSD has the same scaling as the WelchPSD of the full band, so levels can be compared directly.
+        """
+        decimation = self.decimation_for(sample_rate, high_freq - low_freq)
+        count = self.zoom_fft_count
+        bin_width = sample_rate / (decimation * count)
+        shift_bins = int(round(((low_freq + high_freq) / 2 - center_freq) / bin_width))
+
+        samples = np.asarray(samples)
+        dtype = np.result_type(samples.dtype, np.complex64)
+        coefficients = self.__filter(sample_rate, decimation, shift_bins, dtype)
+
+        # One row per output sample, output m is the sum over taps t of block m + t weighted by the coefficients of tap t
+        blocks = samples[: (len(samples) // decimation) * decimation].reshape(-1, decimation)
+        outputs = len(blocks) - self.taps + 1
+        if outputs < count:
+            raise ValueError(f"At least {(count + self.taps - 1) * decimation} samples are needed to zoom with decimation {decimation}.")
+        per_tap = blocks @ coefficients
+        decimated = per_tap[:outputs, 0].copy()
+        for tap in range(1, self.taps):
+            decimated += per_tap[tap : tap + outputs, tap]
+
+        pxx, _ = self.psd.estimate(decimated, NFFT=count, Fs=sample_rate / decimation / 1e6, Fc=0)
+        pxx = np.roll(pxx, -(shift_bins % count))
+
+        offsets = np.arange(count) - count // 2
+        kept = np.abs(offsets) <= count * self.keep / 2
+        freqs = (center_freq + (shift_bins + offsets[kept]) * bin_width) / 1e6
+        return pxx[kept], freqs